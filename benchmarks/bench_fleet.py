@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Time parse_many on a fleet of generated files, against a loop over
+InterfacesReader.parse_interfaces."""
+from __future__ import print_function, with_statement, absolute_import
+import argparse
+import shutil
+import tempfile
+import warnings
+import os
+
+from common import best_of, generate_interfaces, report
+from debinterface import InterfacesReader, parse_many
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--stanzas", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="interfaces-fleet-")
+    paths = [
+        generate_interfaces(args.stanzas, os.path.join(
+            directory, "interfaces{0}".format(index)))
+        for index in range(args.files)
+    ]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            seconds = best_of(
+                lambda: [InterfacesReader(x).parse_interfaces()
+                         for x in paths],
+                repeat=args.repeat)
+            report("loop ({0} files)".format(args.files), seconds,
+                   args.files)
+            for as_dicts in (False, True):
+                seconds = best_of(
+                    lambda: parse_many(paths, args.workers,
+                                       as_dicts=as_dicts),
+                    repeat=args.repeat)
+                report("parse_many, as_dicts={0}".format(as_dicts),
+                       seconds, args.files)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Time InterfacesReader.update_interfaces after a one stanza change,
+against a full parse_interfaces."""
+from __future__ import print_function, with_statement, absolute_import
+import argparse
+import os
+import warnings
+
+from common import best_of, generate_interfaces, report
+from debinterface import InterfacesReader
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stanzas", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = generate_interfaces(args.stanzas)
+    with open(path) as interfaces:
+        content = interfaces.read()
+    state = {"mtu": 1500}
+
+    def change_one_stanza():
+        state["mtu"] += 1
+        with open(path, "w") as interfaces:
+            interfaces.write(content.replace(
+                "    mtu 1500", "    mtu {0}".format(state["mtu"]), 1))
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            seconds = best_of(
+                lambda: InterfacesReader(path).parse_interfaces(),
+                repeat=args.repeat)
+            report("parse_interfaces", seconds, args.stanzas)
+
+            reader = InterfacesReader(path)
+            reader.update_interfaces()
+
+            def update():
+                change_one_stanza()
+                changes = reader.update_interfaces()
+                assert len(changes.changed) == 1
+
+            seconds = best_of(update, repeat=args.repeat)
+            report("update_interfaces, one changed", seconds, args.stanzas)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
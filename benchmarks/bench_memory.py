@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Measure the memory held by parsed adapters, per adapter."""
+from __future__ import print_function, with_statement, absolute_import
+import argparse
+import gc
+import os
+import tracemalloc
+from timeit import timeit
+import warnings
+
+from common import generate_interfaces
+from debinterface import AdapterTable, InterfacesReader, NetworkAdapter
+
+
+def measure(build):
+    """Return the bytes allocated by build() and still held, and its
+    result."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stanzas", type=int, default=100000)
+    args = parser.parse_args()
+
+    path = generate_interfaces(args.stanzas)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            size, adapters = measure(lambda: [
+                NetworkAdapter({"name": "eth{0}".format(x)})
+                for x in range(args.stanzas)])
+            print("{0:<40} {1:10.0f} bytes/adapter".format(
+                "NetworkAdapter(name)", float(size) / len(adapters)))
+            del adapters
+            for validate in ("strict", "lazy"):
+                size, adapters = measure(lambda: InterfacesReader(
+                    path, validate=validate).parse_interfaces())
+                print("{0:<40} {1:10.0f} bytes/adapter".format(
+                    "parse_interfaces, {0}".format(validate),
+                    float(size) / len(adapters)))
+                del adapters
+            size, table = measure(lambda: AdapterTable(
+                InterfacesReader(path, validate="lazy").parse_interfaces()))
+            print("{0:<40} {1:10.0f} bytes/adapter".format(
+                "AdapterTable", float(size) / len(table)))
+            wanted = table.column("address")[len(table) // 2]
+            print("{0:<40} {1:10.4f} s".format(
+                "AdapterTable.indexes('address')",
+                timeit(lambda: table.indexes("address", wanted),
+                       number=5) / 5))
+            adapters = InterfacesReader(path, validate="lazy").parse_interfaces()
+            print("{0:<40} {1:10.4f} s".format(
+                "address scan of NetworkAdapter list",
+                timeit(lambda: [x for x in adapters
+                                if x.attributes.get("address") == wanted],
+                       number=5) / 5))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Time InterfacesReader.parse_interfaces and Interfaces.updateAdapters
+on a generated file."""
+from __future__ import print_function, with_statement, absolute_import
+import argparse
+import os
+import warnings
+
+from common import best_of, generate_interfaces, report
+from debinterface import Interfaces, InterfacesReader, PARSE_CACHE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stanzas", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    path = generate_interfaces(args.stanzas)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for validate in ("strict", "lazy"):
+                seconds = best_of(
+                    lambda: InterfacesReader(
+                        path, validate=validate).parse_interfaces(),
+                    repeat=args.repeat)
+                report("parse_interfaces, {0} ({1} stanzas)".format(
+                    validate, args.stanzas), seconds, args.stanzas)
+
+            # Validation deferred to write time
+            adapters = InterfacesReader(
+                path, validate="lazy").parse_interfaces()
+            seconds = best_of(
+                lambda: [x.validateAll() for x in adapters],
+                repeat=args.repeat)
+            report("validateAll, lazy adapters", seconds, args.stanzas)
+
+            interfaces = Interfaces(update_adapters=False,
+                                    interfaces_path=path)
+            PARSE_CACHE.clear()
+            interfaces.updateAdapters()
+            seconds = best_of(interfaces.updateAdapters, repeat=args.repeat)
+            report("updateAdapters, cached", seconds, args.stanzas)
+
+            # Cold start: no parse cache, a snapshot on disk
+            interfaces = Interfaces(update_adapters=False,
+                                    interfaces_path=path, snapshot=True)
+            interfaces.updateAdapters()
+
+            def load_snapshot():
+                PARSE_CACHE.clear()
+                interfaces.updateAdapters()
+
+            seconds = best_of(load_snapshot, repeat=args.repeat)
+            report("updateAdapters, snapshot", seconds, args.stanzas)
+    finally:
+        os.remove(path)
+        if os.path.exists(path + ".snapshot"):
+            os.remove(path + ".snapshot")
+
+
+if __name__ == "__main__":
+    main()
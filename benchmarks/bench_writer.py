@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Time the rendering of adapters by InterfacesWriter, a write of an
+unchanged file and the in process structure check."""
+from __future__ import print_function, with_statement, absolute_import
+import argparse
+import os
+import warnings
+
+from common import best_of, generate_interfaces, report
+from debinterface import (InterfacesReader, InterfacesWriter,
+                          structure_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stanzas", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = generate_interfaces(args.stanzas)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            adapters = InterfacesReader(path).parse_interfaces()
+            for validate in (True, False):
+                writer = InterfacesWriter(adapters, path, validate=validate)
+                seconds = best_of(writer._render, repeat=args.repeat)
+                report("render, validate={0} ({1} stanzas)".format(
+                    validate, args.stanzas), seconds, args.stanzas)
+
+            # The file has the rendered content: nothing is written
+            writer = InterfacesWriter(adapters, path, validate=False)
+            with open(path, "wb") as interfaces:
+                interfaces.write(writer._render())
+            seconds = best_of(writer.write_interfaces, repeat=args.repeat)
+            report("write_interfaces, unchanged", seconds, args.stanzas)
+
+            seconds = best_of(lambda: structure_errors(adapters),
+                              repeat=args.repeat)
+            report("structure_errors", seconds, args.stanzas)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
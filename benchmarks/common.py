@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Shared helpers for the benchmark scripts.
+
+The scripts are meant to be run from a source checkout, eg:
+
+    python benchmarks/bench_reader.py --stanzas 20000
+"""
+from __future__ import print_function, with_statement, absolute_import
+import os
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def generate_stanza(index):
+    """Return the text of one generated stanza, with its auto line.
+
+        Args:
+            index (int): the stanza number, used to build unique values
+
+        Returns:
+            str: the stanza text
+    """
+    name = "eth{0}".format(index)
+    third, fourth = divmod(index % 65000, 250)
+    lines = [
+        "auto {0}".format(name),
+        "iface {0} inet static".format(name),
+        "    address 10.{0}.{1}.{2}".format(index % 200, third, fourth + 1),
+        "    netmask 255.255.255.0",
+        "    gateway 10.{0}.{1}.254".format(index % 200, third),
+        "    broadcast 10.{0}.{1}.255".format(index % 200, third),
+        "    dns-nameservers 8.8.8.8",
+        "    mtu 1500",
+        "    up ip link set {0} promisc on".format(name),
+        "    post-down ip link set {0} promisc off".format(name),
+        "",
+    ]
+    if index % 10 == 0:
+        lines.insert(0, "# generated bridge member {0}".format(index))
+    return "\n".join(lines) + "\n"
+
+
+def generate_interfaces(stanzas, path=None):
+    """Write a generated interfaces file.
+
+        Args:
+            stanzas (int): number of iface stanzas to generate
+            path (str, optional): destination, a temporary file by default
+
+        Returns:
+            str: the path of the written file
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="interfaces-bench-")
+        os.close(fd)
+    with open(path, "w") as interfaces:
+        interfaces.write("auto lo\niface lo inet loopback\n\n")
+        for index in range(stanzas):
+            interfaces.write(generate_stanza(index))
+    return path
+
+
+def best_of(func, repeat=5, number=1):
+    """Return the best wall time in seconds of func over repeat runs."""
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def report(label, seconds, count=None):
+    """Print one benchmark line."""
+    if count:
+        print("{0:<40} {1:10.4f} s  {2:10.2f} us/item".format(
+            label, seconds, seconds * 1e6 / count))
+    else:
+        print("{0:<40} {1:10.4f} s".format(label, seconds))
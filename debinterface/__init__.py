@@ -1,23 +1,44 @@
 # -*- coding: utf-8 -*-
 """Imports for easier use"""
 from .adapter import NetworkAdapter
+from .adapterGraph import AdapterGraph
+from .adapterIndexes import AdapterIndexes, StaleIndexError
+from .adapterTable import AdapterTable
 from .adapterValidation import NetworkAdapterValidation
 from .dnsmasqRange import (DnsmasqRange,
                            DEFAULT_CONFIG as DNSMASQ_DEFAULT_CONFIG)
 from .hostapd import Hostapd
-from .interfaces import Interfaces
-from .interfacesReader import InterfacesReader
-from .interfacesWriter import InterfacesWriter
+from .interfaces import Interfaces, PARSE_CACHE
+from .interfacesChecker import check_structure, structure_errors
+from .interfacesDiff import diff_adapters, plan_apply
+from .interfacesDocument import InterfacesDocument
+from .interfacesReader import InterfacesReader, ParseResult, parse_many
+from .interfacesWriter import InterfacesWriter, InterfacesChangedError
+from .ifupdown import CommandResult
 
 __version__ = '3.1.0'
 
 __all__ = [
     'NetworkAdapter',
+    'AdapterGraph',
+    'AdapterIndexes',
+    'StaleIndexError',
+    'AdapterTable',
     'NetworkAdapterValidation',
     'DnsmasqRange',
     'DNSMASQ_DEFAULT_CONFIG',
     'Hostapd',
     'Interfaces',
+    'check_structure',
+    'structure_errors',
+    'diff_adapters',
+    'plan_apply',
+    'InterfacesDocument',
+    'PARSE_CACHE',
     'InterfacesReader',
-    'InterfacesWriter'
+    'ParseResult',
+    'parse_many',
+    'InterfacesWriter',
+    'InterfacesChangedError',
+    'CommandResult'
 ]
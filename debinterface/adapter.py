@@ -6,13 +6,364 @@ It has setter for many common options, but it is impossible to have setter for
 every options on earth !
 """
 from __future__ import print_function, with_statement, absolute_import
+import functools
 import socket
 import warnings
+import weakref
+from collections import OrderedDict
+try:
+    from collections.abc import ItemsView, KeysView, ValuesView
+except ImportError:  # Python 2
+    from collections import ItemsView, KeysView, ValuesView
+
 from .adapterValidation import NetworkAdapterValidation, VALID_OPTS
 
 
+class ChangeLog(object):
+    """ The adapters whose options changed, among the adapters it
+        watches, until it is cleared. Indexes keep one to index again
+        the changed adapters only. Changes made in place to a stored
+        container, eg adapter.attributes['bridge-opts'][key] = value,
+        are not seen.
+    """
+
+    def __init__(self, keys=None):
+        """ Args:
+                keys (iterable, optional): the options to follow,
+                    default to all of them
+        """
+        self._keys = None if keys is None else frozenset(keys)
+        # id(adapter) => adapter, in change order
+        self._changed = OrderedDict()
+
+    def __len__(self):
+        return len(self._changed)
+
+    def watch(self, adapter):
+        """ Log the changes of the options of adapter from now on.
+
+            Args:
+                adapter (NetworkAdapter): the adapter
+        """
+        attributes = adapter.attributes
+        watchers = attributes._watchers or []
+        if not any(x[0] is self for x in watchers):
+            attributes._watchers = watchers + [(self, weakref.ref(adapter))]
+
+    def unwatch(self, adapter):
+        """ Stop logging the changes of adapter, and forget them.
+
+            Args:
+                adapter (NetworkAdapter): the adapter
+        """
+        attributes = adapter.attributes
+        if attributes._watchers:
+            attributes._watchers = [
+                x for x in attributes._watchers if x[0] is not self] or None
+        self._changed.pop(id(adapter), None)
+
+    def changed(self):
+        """ Returns:
+                list: the changed adapters, in change order
+        """
+        return list(self._changed.values())
+
+    def clear(self):
+        """ Forget the changes logged so far """
+        self._changed.clear()
+
+    def _add(self, adapter, key):
+        if key is None or self._keys is None or key in self._keys:
+            self._changed[id(adapter)] = adapter
+
+
+class _Lazy(object):
+    """An empty container shown for a missing key of _Attributes. It is
+    stored in its attributes when first changed. Reads of the key return
+    the same container until then, see _Attributes.__missing__.
+    """
+
+    __slots__ = ()
+
+    def _bind(self, owner, key):
+        self._owner = owner
+        self._key = key
+
+    def _store(self):
+        owner = self._owner
+        if owner is None:
+            return
+        key = self._key
+        if dict.__contains__(owner, key):
+            if dict.__getitem__(owner, key) is not self:
+                # the key was set since this container was read
+                self._owner = None
+                return
+        else:
+            dict.__setitem__(owner, key, self)
+            owner._forget(key)
+        owner.touch(key)
+
+
+class _LazyList(_Lazy, list):
+    """ Commands list, see _Lazy """
+
+    __slots__ = ('_owner', '_key', '__weakref__')
+
+    def append(self, value):
+        self._store()
+        list.append(self, value)
+
+    def extend(self, values):
+        self._store()
+        list.extend(self, values)
+
+    def insert(self, index, value):
+        self._store()
+        list.insert(self, index, value)
+
+    def __setitem__(self, index, value):
+        self._store()
+        list.__setitem__(self, index, value)
+
+    def __iadd__(self, values):
+        self._store()
+        return list.__iadd__(self, values)
+
+
+class _LazyDict(_Lazy, dict):
+    """ bridge-opts, see _Lazy """
+
+    __slots__ = ('_owner', '_key', '__weakref__')
+
+    def __setitem__(self, key, value):
+        self._store()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._store()
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._store()
+        return dict.pop(self, key, *default)
+
+    def update(self, *args, **kwargs):
+        self._store()
+        dict.update(self, *args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._store()
+        return dict.setdefault(self, key, default)
+
+
+# Containers of an adapter, in the order they are listed. They are only
+# stored once written, see _Attributes.
+_CONTAINER_KEYS = ('bridge-opts', 'up', 'down', 'pre-up', 'pre-down',
+                   'post-up', 'post-down')
+_CONTAINERS = dict((key, list) for key in _CONTAINER_KEYS)
+_CONTAINERS['bridge-opts'] = dict
+_LAZY_CONTAINERS = dict((key, _LazyList) for key in _CONTAINER_KEYS)
+_LAZY_CONTAINERS['bridge-opts'] = _LazyDict
+
+
+def _detach(value):
+    """ Unlink a container removed from its attributes """
+    if isinstance(value, _Lazy):
+        value._owner = None
+
+
+def _plain(value):
+    """ A lazy container as a plain list or dict """
+    if isinstance(value, _LazyList):
+        return list(value)
+    if isinstance(value, _LazyDict):
+        return dict(value)
+    return value
+
+
+class _Attributes(dict):
+    """Options of an adapter. The containers (bridge-opts, up, down...)
+    are only stored once written. Until then the mapping shows them
+    empty: reading one returns an empty container, stored in the
+    attributes when it is first changed.
+    Changes are told to the ChangeLog watching the adapter.
+    """
+
+    # _pending: key => weak reference to the container read for a missing
+    # key, while the reader holds it. _watchers: (ChangeLog, weak reference
+    # to the adapter) list, the attributes do not keep their adapter alive.
+    # Both are None when empty.
+    __slots__ = ('_pending', '_watchers')
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._pending = None
+        self._watchers = None
+
+    def __reduce__(self):
+        return (self.__class__, (self.stored(), ))
+
+    def touch(self, key=None):
+        """ Tell the change logs watching the adapter that an option
+            changed in place, eg a stored container.
+
+            Args:
+                key (str, optional): the option, default to any
+        """
+        if self._watchers:
+            for log, reference in self._watchers:
+                adapter = reference()
+                if adapter is not None:
+                    log._add(adapter, key)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if self._watchers:
+            self.touch(key)
+
+    def __missing__(self, key):
+        pending = self._pending
+        if pending is not None and key in pending:
+            value = pending[key]()
+            if value is not None:
+                return value
+        try:
+            value = _LAZY_CONTAINERS[key]()
+        except KeyError:
+            raise KeyError(key)
+        value._bind(self, key)
+        if pending is None:
+            pending = self._pending = {}
+        pending[key] = weakref.ref(
+            value, functools.partial(self._forget, key))
+        return value
+
+    def _forget(self, key, reference=None):
+        """ Drop the pending container of key, once stored or, with
+            reference, once its reader dropped it """
+        pending = self._pending
+        if pending is None or key not in pending:
+            return
+        if reference is None or pending[key] is reference:
+            del pending[key]
+            if not pending:
+                self._pending = None
+
+    def _missing_containers(self):
+        return [x for x in _CONTAINER_KEYS if not dict.__contains__(self, x)]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in _CONTAINERS
+
+    def __iter__(self):
+        for key in dict.__iter__(self):
+            yield key
+        for key in self._missing_containers():
+            yield key
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._missing_containers())
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    # Python 2
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def has_key(self, key):
+        return key in self
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self.touch()
+
+    def pop(self, key, *default):
+        if dict.__contains__(self, key) or key not in _CONTAINERS:
+            value = dict.pop(self, key, *default)
+            self.touch(key)
+            _detach(value)
+            return value
+        return _CONTAINERS[key]()
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self.touch(item[0])
+        return item
+
+    def clear(self):
+        dict.clear(self)
+        self.touch()
+
+    def __delitem__(self, key):
+        if dict.__contains__(self, key) or key not in _CONTAINERS:
+            _detach(dict.pop(self, key))
+            self.touch(key)
+
+    def copy(self):
+        """ A plain dict of the options, with the empty containers """
+        options = self.stored()
+        for key in self._missing_containers():
+            options[key] = _CONTAINERS[key]()
+        return options
+
+    def stored(self):
+        """ A plain dict of the stored options only """
+        return dict((key, _plain(value))
+                    for key, value in dict.items(self))
+
+    def __eq__(self, other):
+        if isinstance(other, _Attributes):
+            other = other.copy()
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.copy() == other
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
 class NetworkAdapter(object):
-    """ A representation a network adapter. """
+    """ A representation a network adapter.
+        Adapters only hold their options: the validator is shared and
+        the containers are created when first used. Change logs and
+        adapter tables refer to adapters weakly.
+    """
+
+    __slots__ = ('_ifAttributes', '__weakref__')
+
+    # Validators are stateless, all adapters share this one.
+    _validator = NetworkAdapterValidation()
+    _valid = VALID_OPTS  # For backward compatibility
 
     @property
     def attributes(self):
@@ -27,7 +378,9 @@ class NetworkAdapter(object):
             Raises:
                 ValueError: if there is a validation error
         """
-        self._validator.validate_all(self._ifAttributes)
+        # A plain copy of the stored options: the missing containers are
+        # empty, they validate the same as absent
+        self._validator.validate_all(dict(dict.items(self._ifAttributes)))
 
     def validateOne(self, opt, validations, val):
         """ Not thorough validations... and quick coded.
@@ -252,7 +605,8 @@ class NetworkAdapter(object):
                 value (any): the value
         """
 
-        self._ifAttributes['bridge-opts'][key] = value
+        self._ifAttributes.setdefault('bridge-opts', {})[key] = value
+        self._ifAttributes.touch('bridge-opts')
 
     def appendBropts(self, key, value):
         """Set a discrete bridge option key with value
@@ -262,8 +616,9 @@ class NetworkAdapter(object):
                 value (any): the value
         """
         new_value = value
-        if key in self._ifAttributes['bridge-opts']:
-            new_value = self._ifAttributes['bridge-opts'][key] + value
+        bridge_opts = self._ifAttributes.get('bridge-opts', {})
+        if key in bridge_opts:
+            new_value = bridge_opts[key] + value
         self.replaceBropt(key, new_value)
 
     def setUp(self, up):
@@ -392,6 +747,30 @@ class NetworkAdapter(object):
         else:
             return self._ifAttributes
 
+    def copy(self):
+        """Return an independent copy of the adapter, without validating
+        its options again.
+
+            Returns:
+                NetworkAdapter: the copy
+        """
+        other = self.__class__.__new__(self.__class__)
+        other._ifAttributes = _Attributes()
+        for key, value in dict.items(self._ifAttributes):
+            if isinstance(value, list):
+                value = value[:]
+            elif isinstance(value, dict):
+                value = dict(value)
+            other._ifAttributes[key] = value
+        return other
+
+    def __getstate__(self):
+        """Pickle the options only, the validator is shared."""
+        return {'attributes': self._ifAttributes.stored()}
+
+    def __setstate__(self, state):
+        self._set_attributes(_Attributes(state['attributes']))
+
     def display(self):
         """Display a (kind of) human readable representation of the adapter."""
         print('============')
@@ -410,21 +789,25 @@ class NetworkAdapter(object):
 
     def __init__(self, options=None):
         # Initialize attribute storage structre.
-        self._validator = NetworkAdapterValidation()
-        self._valid = VALID_OPTS  # For backward compatibility
         self.reset()
         self.set_options(options)
 
     def reset(self):
-        """ Initialize attribute storage structure. """
-        self._ifAttributes = {}
-        self._ifAttributes['bridge-opts'] = {}
-        self._ifAttributes['up'] = []
-        self._ifAttributes['down'] = []
-        self._ifAttributes['pre-up'] = []
-        self._ifAttributes['pre-down'] = []
-        self._ifAttributes['post-up'] = []
-        self._ifAttributes['post-down'] = []
+        """ Initialize attribute storage structure.
+            bridge-opts and the commands lists are stored on first write.
+        """
+        self._set_attributes(_Attributes())
+
+    def _set_attributes(self, attributes):
+        """ Replace the attributes, the change logs watching the adapter
+            are moved to the new ones """
+        # unset while __init__ runs reset()
+        old = getattr(self, '_ifAttributes', None)
+        self._ifAttributes = attributes
+        watchers = getattr(old, '_watchers', None)
+        if watchers:
+            attributes._watchers = watchers
+            attributes.touch()
 
     def set_options(self, options):
         """Set options, either only the name if options is a str,
@@ -447,6 +830,8 @@ class NetworkAdapter(object):
 
         # If a dictionary of options is provided, populate the adapter options.
         elif isinstance(options, dict):
+            if not options:
+                return
             try:
                 roseta = {
                     'name': self.setName,
@@ -493,12 +878,13 @@ class NetworkAdapter(object):
                 value (any): the data. Will be appended into a
                     list if it's not one
         """
-        if key not in dic:
+        # Stored values only, a missing container is created here
+        if not dict.__contains__(dic, key):
             dic[key] = []
-        if not isinstance(dic[key], list):
-            tmp = dic[key]
-            dic[key] = [tmp]
+        current = dict.__getitem__(dic, key)
+        if not isinstance(current, list):
+            current = dic[key] = [current]
         if isinstance(value, list):
-            dic[key] += value
+            current.extend(value)
         else:
-            dic[key].append(value)
+            current.append(value)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""Dependencies between interfaces, read from the options of the adapters:
+a bridge needs its bridge_ports, a VLAN its vlan-raw-device (or the
+interface before the dot of its name) and a bond its bond-slaves.
+"""
+from __future__ import print_function, with_statement, absolute_import
+import re
+from collections import OrderedDict
+
+
+# Values of bridge_ports and bond-slaves which are not interface names
+_PORT_KEYWORDS = frozenset(['none', 'all', 'regex', 'noregex'])
+# eth0.100 => eth0
+_VLAN_NAME = re.compile(r'^(?P<device>[^.]+)\.\d+$')
+
+
+def adapter_dependencies(adapter):
+    """ Names of the interfaces an adapter needs up before its own.
+
+        Args:
+            adapter (NetworkAdapter): the adapter
+
+        Returns:
+            list: interface names, without duplicates
+    """
+    attributes = adapter.attributes
+    unknown = attributes.get('unknown') or {}
+    names = []
+
+    bridge_opts = attributes.get('bridge-opts') or {}
+    ports = bridge_opts.get('ports') or ''
+    if not isinstance(ports, str):
+        ports = ' '.join(ports)
+    names.extend(ports.split())
+
+    for key in ('bond-slaves', 'bond_slaves', 'slaves'):
+        names.extend(str(unknown.get(key) or '').split())
+
+    device = (unknown.get('vlan-raw-device')
+              or unknown.get('vlan_raw_device'))
+    if device:
+        names.append(str(device).strip())
+    else:
+        match = _VLAN_NAME.match(attributes.get('name') or '')
+        if match:
+            names.append(match.group('device'))
+
+    name = attributes.get('name')
+    return [x for x in OrderedDict.fromkeys(names)
+            if x not in _PORT_KEYWORDS and x != name]
+
+
+class AdapterGraph(object):
+    """ Dependency graph of the interfaces of adapters, by name.
+
+        Interfaces which are only referenced, eg a bridge port without
+        its own stanza, are nodes too but are not part of the default
+        layers.
+    """
+
+    def __init__(self, adapters=()):
+        """ Args:
+                adapters (iterable): NetworkAdapter
+        """
+        # name => names it needs, in the order found
+        self._requires = OrderedDict()
+        # name => names needing it
+        self._required_by = {}
+        # names which have a stanza, in list order
+        self._defined = OrderedDict()
+        for adapter in adapters:
+            name = adapter.attributes.get('name')
+            if name is None:
+                continue
+            self._defined[name] = True
+            requires = self._requires.setdefault(name, OrderedDict())
+            for dependency in adapter_dependencies(adapter):
+                requires[dependency] = True
+                self._requires.setdefault(dependency, OrderedDict())
+                self._required_by.setdefault(dependency, set()).add(name)
+
+    def __contains__(self, name):
+        return name in self._requires
+
+    def dependencies(self, name):
+        """ Args:
+                name (str): an interface name
+
+            Returns:
+                list: the names it directly needs up first
+        """
+        return list(self._requires.get(name, ()))
+
+    def dependents(self, name):
+        """ Args:
+                name (str): an interface name
+
+            Returns:
+                list: the names directly needing it, in ifup order
+        """
+        return self._sorted(self._required_by.get(name, ()))
+
+    def layers(self, names=None, reverse=False):
+        """ Split interfaces into layers to run one after the other: the
+            interfaces of a layer only need interfaces of earlier layers,
+            they can be brought up in parallel. Names of a layer are in
+            the order of the adapters.
+
+            Args:
+                names (iterable, optional): the interfaces to order,
+                    default to the ones with a stanza. Dependencies which
+                    are not in names still order the layers
+                reverse (bool, optional): dependents first, for ifdown.
+                    Default False
+
+            Returns:
+                list: lists of names
+
+            Raises:
+                ValueError: if the interfaces depend on each other in a
+                    cycle
+        """
+        if names is None:
+            names = self._defined
+        depths = {}
+        layers = []
+        for name in self._sorted(set(names), depths):
+            depth = depths[name]
+            while len(layers) <= depth:
+                layers.append([])
+            layers[depth].append(name)
+        layers = [x for x in layers if x]
+        if reverse:
+            layers.reverse()
+        return layers
+
+    def restart_set(self, names):
+        """ The interfaces to restart when the given ones change: them
+            and every interface depending on them, directly or not.
+
+            Args:
+                names (iterable): the changed interfaces
+
+            Returns:
+                list: names, in ifup order
+        """
+        found = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name in found:
+                continue
+            found.add(name)
+            pending.extend(self._required_by.get(name, ()))
+        return self._sorted(found)
+
+    def _depth(self, name, depths, visiting):
+        """ Length of the longest dependency chain below name """
+        depth = depths.get(name)
+        if depth is not None:
+            return depth
+        if name in visiting:
+            raise ValueError(
+                "dependency cycle through {0}".format(name))
+        visiting.add(name)
+        depth = 0
+        for dependency in self._requires.get(name, ()):
+            depth = max(depth, self._depth(dependency, depths, visiting) + 1)
+        visiting.discard(name)
+        depths[name] = depth
+        return depth
+
+    def _sorted(self, names, depths=None):
+        """ names in layers order, then in adapters order """
+        if depths is None:
+            depths = {}
+        order = dict((name, i) for i, name in enumerate(self._defined))
+        return sorted(names, key=lambda x: (
+            self._depth(x, depths, set()), order.get(x, len(order)), x))
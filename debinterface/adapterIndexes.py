@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""Secondary indexes of the adapters of an Interfaces: by address, by
+network, by bridge port, the auto and allow-hotplug adapters, and a
+prefix trie of the networks for longest prefix matches.
+Adapters are indexed with the keys of their options when they are added.
+Lookups index again the adapters changed since the last lookup, update()
+indexes an adapter again after a change a ChangeLog does not see, eg to its
+bridge-opts dict in place.
+"""
+from __future__ import print_function, with_statement, absolute_import
+import ipaddress
+from collections import OrderedDict
+
+from . import toolutils
+from .adapter import ChangeLog
+
+
+# Options the keys of an adapter are made of, see adapter_keys
+KEY_OPTIONS = ('address', 'netmask', 'bridge-opts', 'auto', 'hotplug')
+
+
+class StaleIndexError(Exception):
+    """ A lookup found adapters changed since they were indexed, and was
+        not allowed to index them again. """
+
+
+def _ip_interface(attributes):
+    """ The ipaddress interface of an adapter, from its address and
+        netmask options, or an address/prefix address.
+
+        Returns:
+            IPv4Interface or IPv6Interface: None if there is no valid address
+    """
+    address = attributes.get('address')
+    if not address:
+        return None
+    netmask = attributes.get('netmask')
+    if netmask and '/' not in address:
+        address = u'{0}/{1}'.format(address, netmask)
+    try:
+        return ipaddress.ip_interface(u'{0}'.format(address))
+    except ValueError:
+        return None
+
+
+def adapter_keys(adapter):
+    """ Keys of an adapter in AdapterIndexes.
+
+        Args:
+            adapter (NetworkAdapter): the adapter
+
+        Returns:
+            tuple: (address, network, ports, auto, hotplug). address and
+                network are ipaddress objects or None, ports a tuple
+    """
+    attributes = adapter.attributes
+    interface = _ip_interface(attributes)
+    bridge_opts = attributes.get('bridge-opts') or {}
+    ports = bridge_opts.get('ports') or ''
+    if not isinstance(ports, str):
+        ports = ' '.join(ports)
+    return (
+        interface.ip if interface is not None else None,
+        interface.network if interface is not None else None,
+        tuple(ports.split()),
+        attributes.get('auto') is True,
+        attributes.get('hotplug') is True
+    )
+
+
+class AdapterIndexes(object):
+    """ Maintained secondary indexes of adapters.
+
+        Lookups first index again the adapters whose options changed
+        since the last lookup, told by a ChangeLog, and only these.
+    """
+
+    def __init__(self, adapters=(), track=True):
+        """ Args:
+                adapters (iterable): NetworkAdapter
+                track (bool, optional): follow the changes of the
+                    adapters options, False for indexes used once.
+                    Default True
+        """
+        self._log = ChangeLog(KEY_OPTIONS) if track else None
+        self._adapters = {}
+        self.rebuild(adapters)
+
+    def rebuild(self, adapters=()):
+        """ Index all adapters again.
+
+            Args:
+                adapters (iterable): NetworkAdapter
+        """
+        # ip address => adapters
+        self._by_address = {}
+        # ip network => adapters
+        self._by_network = {}
+        # port name => bridge adapters
+        self._by_port = {}
+        # id(adapter) => adapter, in indexing order
+        self._auto = OrderedDict()
+        self._hotplug = OrderedDict()
+        # network => adapters, for longest prefix matches
+        self._routes = toolutils.PrefixTrie()
+        if self._log is not None:
+            for adapter in self._adapters.values():
+                self._log.unwatch(adapter)
+        # id(adapter) => keys it is indexed with
+        self._keys = {}
+        # id(adapter) => adapter
+        self._adapters = {}
+        for adapter in adapters:
+            self.add(adapter)
+
+    def add(self, adapter):
+        """ Index an adapter.
+
+            Args:
+                adapter (NetworkAdapter): the adapter
+        """
+        keys = adapter_keys(adapter)
+        address, network, ports, auto, hotplug = keys
+        self._keys[id(adapter)] = keys
+        self._adapters[id(adapter)] = adapter
+        if self._log is not None:
+            self._log.watch(adapter)
+        if address is not None:
+            self._by_address.setdefault(address, []).append(adapter)
+            self._by_network.setdefault(network, []).append(adapter)
+            self._routes.insert(network, adapter)
+        for port in ports:
+            self._by_port.setdefault(port, []).append(adapter)
+        if auto:
+            self._auto[id(adapter)] = adapter
+        if hotplug:
+            self._hotplug[id(adapter)] = adapter
+
+    def remove(self, adapter):
+        """ Remove an adapter from the indexes, with the keys it was
+            indexed with. Unknown adapters are ignored.
+
+            Args:
+                adapter (NetworkAdapter): the adapter
+        """
+        keys = self._keys.pop(id(adapter), None)
+        if keys is None:
+            return
+        del self._adapters[id(adapter)]
+        if self._log is not None:
+            self._log.unwatch(adapter)
+        address, network, ports, auto, hotplug = keys
+        if address is not None:
+            self._discard(self._by_address, address, adapter)
+            self._discard(self._by_network, network, adapter)
+            self._routes.remove(network, adapter)
+        for port in ports:
+            self._discard(self._by_port, port, adapter)
+        self._auto.pop(id(adapter), None)
+        self._hotplug.pop(id(adapter), None)
+
+    def update(self, adapter):
+        """ Index an adapter again, after its options changed.
+
+            Args:
+                adapter (NetworkAdapter): the adapter
+        """
+        self.remove(adapter)
+        self.add(adapter)
+
+    def by_address(self, address, repair=True):
+        """ Adapters with the given address.
+
+            Args:
+                address (str): an IPv4 or IPv6 address
+                repair (bool, optional): index again the adapters changed
+                    since the last lookup, else raise StaleIndexError.
+                    Default True
+
+            Returns:
+                list: NetworkAdapter, empty if the address is not valid
+        """
+        try:
+            address = ipaddress.ip_address(u'{0}'.format(address))
+        except ValueError:
+            return []
+        return self._checked(self._by_address, address, repair)
+
+    def by_network(self, network, repair=True):
+        """ Adapters whose address is in the given network, with the
+            same prefix length.
+
+            Args:
+                network (str): a network, eg 10.0.0.0/24. Host bits
+                    are ignored
+                repair (bool, optional): see by_address
+
+            Returns:
+                list: NetworkAdapter, empty if the network is not valid
+        """
+        try:
+            network = ipaddress.ip_network(u'{0}'.format(network),
+                                           strict=False)
+        except ValueError:
+            return []
+        return self._checked(self._by_network, network, repair)
+
+    def by_destination(self, address, repair=True):
+        """ Adapters of the longest network containing address, the
+            ones that would carry traffic to it.
+
+            Args:
+                address (str): an IPv4 or IPv6 address
+                repair (bool, optional): see by_address
+
+            Returns:
+                list: NetworkAdapter, empty if no network contains
+                    address or if it is not valid
+        """
+        try:
+            address = ipaddress.ip_address(u'{0}'.format(address))
+        except ValueError:
+            return []
+        self._refresh(repair)
+        return self._routes.longest_match(address)
+
+    def by_port(self, port, repair=True):
+        """ Bridges whose bridge_ports contain port.
+
+            Args:
+                port (str): the interface name
+                repair (bool, optional): see by_address
+
+            Returns:
+                list: NetworkAdapter
+        """
+        return self._checked(self._by_port, port, repair)
+
+    def auto(self, repair=True):
+        """ Args:
+                repair (bool, optional): see by_address
+
+            Returns:
+                list: the auto adapters
+        """
+        return self._flagged(self._auto, repair)
+
+    def hotplug(self, repair=True):
+        """ Args:
+                repair (bool, optional): see by_address
+
+            Returns:
+                list: the allow-hotplug adapters
+        """
+        return self._flagged(self._hotplug, repair)
+
+    def _checked(self, index, key, repair):
+        """ Adapters of index[key] """
+        self._refresh(repair)
+        return list(index.get(key, ()))
+
+    def _flagged(self, flagged, repair):
+        """ Adapters of a flag set """
+        self._refresh(repair)
+        return list(flagged.values())
+
+    def _refresh(self, repair):
+        """ Index again the adapters changed since the last lookup
+
+            Raises:
+                StaleIndexError: if adapters changed and repair is False
+        """
+        if not self._log:
+            return
+        if not repair:
+            raise StaleIndexError()
+        changed = self._log.changed()
+        self._log.clear()
+        for adapter in changed:
+            if adapter_keys(adapter) != self._keys[id(adapter)]:
+                self.update(adapter)
+
+    @staticmethod
+    def _discard(index, key, adapter):
+        adapters = index.get(key)
+        if adapters is None:
+            return
+        adapters[:] = [x for x in adapters if x is not adapter]
+        if not adapters:
+            del index[key]
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+"""AdapterTable stores many adapters as columns instead of one
+NetworkAdapter object per interface:
+    - name in a list, addrFam and source as codes in an array
+    - address, netmask, gateway... packed in array('I') (IPv4) or as
+      16 bytes (IPv6)
+    - auto and allow-hotplug as bits
+    - up, down... commands as ids in a string pool shared by all rows
+    - the other options in a flat (key, value...) tuple per row, None
+      when there are none
+
+Reading a row builds a NetworkAdapter, the view of the row: the changes
+made to it are seen by the table. The table keeps the changed views, the
+others are dropped once unused and built again on the next read.
+compact() packs the changed views back into the columns. Column scans
+(column, indexes) do not build adapters.
+"""
+from __future__ import print_function, with_statement, absolute_import
+import socket
+import struct
+import weakref
+from array import array
+
+try:
+    from collections.abc import MutableSequence
+except ImportError:  # Python 2
+    from collections import MutableSequence
+
+try:
+    from sys import intern
+except ImportError:  # Python 2, a builtin
+    pass
+
+from .adapter import ChangeLog, NetworkAdapter
+
+
+# Options packed as IP addresses.
+_IP_KEYS = ('address', 'netmask', 'gateway', 'broadcast', 'network',
+            'dns-nameservers')
+# Options packed as codes.
+_CODE_KEYS = ('addrFam', 'source')
+# Options stored in the string pool.
+_COMMAND_KEYS = ('pre-up', 'up', 'post-up', 'down', 'pre-down', 'post-down')
+# Options stored as bits, they are only set when True.
+_FLAG_BITS = {'auto': 1, 'hotplug': 2}
+
+# Kind of a packed address.
+_NO_IP, _IPV4, _IPV6 = 0, 4, 6
+_IPV4_STRUCT = struct.Struct('!I')
+
+# Codes are array('H') items, 0 is no value.
+_MAX_CODES = 0xffff
+
+
+def _pack_ip(value):
+    """ Pack an IP address in its canonical form.
+
+        Args:
+            value (any): the option value
+
+        Returns:
+            tuple: (kind, int or 16 bytes), or None if value is not an
+                IP address written as inet_ntop writes it
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        packed = socket.inet_pton(socket.AF_INET, value)
+        if socket.inet_ntop(socket.AF_INET, packed) == value:
+            return _IPV4, _IPV4_STRUCT.unpack(packed)[0]
+    except (socket.error, ValueError):
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, value)
+        if socket.inet_ntop(socket.AF_INET6, packed) == value:
+            return _IPV6, packed
+    except (socket.error, ValueError):
+        pass
+    return None
+
+
+class _IPColumn(object):
+    """ One packed IP option. kinds tells what ipv4 holds for each row:
+        the address for IPv4, the slot of the 16 bytes address in ipv6
+        for IPv6, so that IPv4 only tables do not pay for IPv6.
+    """
+
+    __slots__ = ('kinds', 'ipv4', 'ipv6', 'free')
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.ipv4 = array('I')
+        self.ipv6 = []
+        self.free = []
+
+    def insert(self, row, packed):
+        self.kinds.insert(row, _NO_IP)
+        self.ipv4.insert(row, 0)
+        self.set(row, packed)
+
+    def set(self, row, packed):
+        self._release(row)
+        kind, value = packed if packed is not None else (_NO_IP, 0)
+        if kind == _IPV6:
+            if self.free:
+                slot = self.free.pop()
+                self.ipv6[slot] = value
+            else:
+                slot = len(self.ipv6)
+                self.ipv6.append(value)
+            value = slot
+        self.kinds[row] = kind
+        self.ipv4[row] = value
+
+    def copy(self):
+        column = _IPColumn.__new__(_IPColumn)
+        column.kinds = self.kinds[:]
+        column.ipv4 = self.ipv4[:]
+        column.ipv6 = list(self.ipv6)
+        column.free = list(self.free)
+        return column
+
+    def delete(self, row):
+        self._release(row)
+        del self.kinds[row]
+        del self.ipv4[row]
+
+    def get(self, row):
+        kind = self.kinds[row]
+        if kind == _IPV4:
+            return socket.inet_ntoa(_IPV4_STRUCT.pack(self.ipv4[row]))
+        if kind == _IPV6:
+            return socket.inet_ntop(socket.AF_INET6,
+                                    self.ipv6[self.ipv4[row]])
+        return None
+
+    def matches(self, row, packed):
+        kind, value = packed
+        if self.kinds[row] != kind:
+            return False
+        if kind == _IPV4:
+            return self.ipv4[row] == value
+        return self.ipv6[self.ipv4[row]] == value
+
+    def _release(self, row):
+        if self.kinds[row] == _IPV6:
+            slot = self.ipv4[row]
+            self.ipv6[slot] = None
+            self.free.append(slot)
+
+
+class AdapterTable(MutableSequence):
+    """ A list of adapters stored as columns.
+        Adapters given to the constructor or to extend are packed: use
+        the rows of the table, not these objects, afterwards.
+        Adapters inserted or assigned one at a time are kept as they are,
+        as list items are, until compact() packs them. They remain the
+        views of their rows.
+    """
+
+    def __init__(self, adapters=()):
+        self._names = []
+        self._codes = {key: array('H') for key in _CODE_KEYS}
+        self._ips = {key: _IPColumn() for key in _IP_KEYS}
+        self._flags = array('B')
+        self._commands = []
+        self._extras = []
+        # row => weak reference to the view of the row, or None
+        self._views = []
+        # Keeps the changed views and the inserted adapters alive until
+        # compact() packs them
+        self._log = ChangeLog()
+        # Strings shared by all rows: addrFam and source values, commands.
+        self._pool = ['']
+        self._pool_ids = {'': 0}
+        self.extend(adapters)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[x] for x in range(*index.indices(len(self)))]
+        row = self._row(index)
+        view = self._view(row)
+        if view is None:
+            view = NetworkAdapter.__new__(NetworkAdapter)
+            view.__setstate__({'attributes': self.row_attributes(row)})
+            self._set_view(row, view)
+        return view
+
+    def __setitem__(self, index, adapter):
+        if isinstance(index, slice):
+            raise TypeError("AdapterTable does not support slice assignment")
+        row = self._row(index)
+        self._drop_view(row)
+        self._set_row(row, {})
+        self._keep(row, adapter)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            for row in sorted(range(*index.indices(len(self))),
+                              reverse=True):
+                del self[row]
+            return
+        row = self._row(index)
+        self._drop_view(row)
+        del self._names[row]
+        for column in self._codes.values():
+            del column[row]
+        for column in self._ips.values():
+            column.delete(row)
+        del self._flags[row]
+        del self._commands[row]
+        del self._extras[row]
+        del self._views[row]
+
+    def insert(self, index, adapter):
+        """ Insert adapter before index, as list.insert does. The adapter
+            is the view of its row.
+
+            Args:
+                index (int): the position
+                adapter (NetworkAdapter): the adapter
+        """
+        row = min(max(index + len(self) if index < 0 else index, 0),
+                  len(self))
+        self._insert_row(row, {})
+        self._keep(row, adapter)
+
+    def extend(self, adapters):
+        """ Append and pack adapters.
+
+            Args:
+                adapters (iterable): NetworkAdapter
+        """
+        for adapter in adapters:
+            self._insert_row(len(self), adapter.attributes)
+
+    def compact(self):
+        """ Pack the adapters changed or inserted since the last compact,
+            so that the table does not keep them. They remain the views
+            of their rows while they are used.
+        """
+        self._pack_views(self)
+        self._log.clear()
+
+    def copy(self):
+        """ A packed copy of the table, without views.
+
+            Returns:
+                AdapterTable: the copy
+        """
+        table = self.__class__.__new__(self.__class__)
+        table._names = list(self._names)
+        table._codes = dict(
+            (key, column[:]) for key, column in self._codes.items())
+        table._ips = dict(
+            (key, column.copy()) for key, column in self._ips.items())
+        table._flags = self._flags[:]
+        table._commands = list(self._commands)
+        table._extras = list(self._extras)
+        table._views = [None] * len(self)
+        table._log = ChangeLog()
+        table._pool = list(self._pool)
+        table._pool_ids = dict(self._pool_ids)
+        self._pack_views(table)
+        return table
+
+    def row_attributes(self, row):
+        """ Build the attributes dict of a row, without keeping a view.
+
+            Args:
+                row (int): the row
+
+            Returns:
+                dict: a new dict of the row options
+        """
+        view = self._view(row)
+        if view is not None:
+            return view.attributes.stored()
+        attributes = {}
+        name = self._names[row]
+        if name is not None:
+            attributes['name'] = name
+        for key, column in self._codes.items():
+            code = column[row]
+            if code:
+                attributes[key] = self._pool[code]
+        for key, column in self._ips.items():
+            value = column.get(row)
+            if value is not None:
+                attributes[key] = value
+        flags = self._flags[row]
+        for key, bit in _FLAG_BITS.items():
+            if flags & bit:
+                attributes[key] = True
+        commands = self._commands[row]
+        if commands is not None:
+            items = iter(commands)
+            for key_id in items:
+                count = next(items)
+                attributes[self._pool[key_id]] = [
+                    self._pool[next(items)] for _ in range(count)]
+        extras = self._extras[row]
+        if extras is not None:
+            for key, value in zip(extras[::2], extras[1::2]):
+                if isinstance(value, list):
+                    value = value[:]
+                elif isinstance(value, dict):
+                    value = dict(value)
+                attributes[key] = value
+        return attributes
+
+    def column(self, key):
+        """ Values of one option for all rows, without building adapters.
+
+            Args:
+                key (str): the option name, eg address
+
+            Returns:
+                list: the value of each row, None where it is not set
+        """
+        if key == 'name':
+            values = list(self._names)
+        elif key in self._codes:
+            pool = self._pool
+            values = [pool[x] if x else None for x in self._codes[key]]
+        elif key in self._ips:
+            get = self._ips[key].get
+            values = [get(row) for row in range(len(self))]
+        elif key in _FLAG_BITS:
+            bit = _FLAG_BITS[key]
+            values = [True if x & bit else None for x in self._flags]
+        elif key in _COMMAND_KEYS:
+            values = [self._row_commands(row, key) for row in range(len(self))]
+        else:
+            values = [None] * len(self)
+        for row, extras in enumerate(self._extras):
+            if extras is not None and key in extras[::2]:
+                values[row] = self._extra(row, key)
+        for row, view in self._live_views():
+            values[row] = view.attributes.get(key)
+        return values
+
+    def indexes(self, key, value):
+        """ Rows whose option key equals value. Packed options are
+            compared packed.
+
+            Args:
+                key (str): the option name
+                value (any): the wanted value
+
+            Returns:
+                list: the rows, in order
+        """
+        packed = _pack_ip(value) if key in self._ips else None
+        if packed is None:
+            return [row for row, x in enumerate(self.column(key))
+                    if x == value]
+        # Canonical IPs are always packed: extras can not hold value.
+        column = self._ips[key]
+        kind, packed_value = packed
+        kinds = column.kinds
+        if kind == _IPV4:
+            rows = set(row for row, x in enumerate(column.ipv4)
+                       if x == packed_value and kinds[row] == kind)
+        else:
+            rows = set(row for row, x in enumerate(kinds)
+                       if x == kind and column.matches(row, packed))
+        # Columns of viewed rows are out of date
+        for row, view in self._live_views():
+            if view.attributes.get(key) == value:
+                rows.add(row)
+            else:
+                rows.discard(row)
+        return sorted(rows)
+
+    def _row(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("AdapterTable index out of range")
+        return index
+
+    def _view(self, row):
+        """ The view of row, None if it has none or it was dropped """
+        reference = self._views[row]
+        if reference is None:
+            return None
+        view = reference()
+        if view is None:
+            self._views[row] = None
+        return view
+
+    def _live_views(self):
+        """ (row, view) of the rows with a view """
+        for row, reference in enumerate(self._views):
+            if reference is not None:
+                view = self._view(row)
+                if view is not None:
+                    yield row, view
+
+    def _set_view(self, row, view):
+        self._log.watch(view)
+        self._views[row] = weakref.ref(view)
+
+    def _keep(self, row, adapter):
+        """ Make adapter the view of row, kept until compact() """
+        self._set_view(row, adapter)
+        self._log._add(adapter, None)
+
+    def _drop_view(self, row):
+        view = self._view(row)
+        if view is not None:
+            self._log.unwatch(view)
+
+    def _pack_views(self, table):
+        """ Pack the views kept by this table in the rows of table """
+        kept = set(id(x) for x in self._log.changed())
+        for row, view in self._live_views():
+            if id(view) in kept:
+                table._set_row(row, view.attributes.stored())
+
+    def _intern(self, value):
+        """ Pool id of value """
+        try:
+            return self._pool_ids[value]
+        except KeyError:
+            self._pool_ids[value] = len(self._pool)
+            self._pool.append(value)
+            return len(self._pool) - 1
+
+    def _extra(self, row, key):
+        extras = self._extras[row]
+        for index in range(0, len(extras), 2):
+            if extras[index] == key:
+                return extras[index + 1]
+        return None
+
+    def _row_commands(self, row, key):
+        commands = self._commands[row]
+        if commands is None:
+            return None
+        items = iter(commands)
+        for key_id in items:
+            count = next(items)
+            if self._pool[key_id] == key:
+                return [self._pool[next(items)] for _ in range(count)]
+            for _ in range(count):
+                next(items)
+        return None
+
+    def _insert_row(self, row, attributes):
+        self._names.insert(row, None)
+        for column in self._codes.values():
+            column.insert(row, 0)
+        for column in self._ips.values():
+            column.insert(row, None)
+        self._flags.insert(row, 0)
+        self._commands.insert(row, None)
+        self._extras.insert(row, None)
+        self._views.insert(row, None)
+        self._set_row(row, attributes)
+
+    def _set_row(self, row, attributes):
+        """ Pack attributes in the columns of an existing row """
+        extras = {}
+        flags = 0
+        commands = array('I')
+        names = self._names
+        names[row] = None
+        for key in _CODE_KEYS:
+            self._codes[key][row] = 0
+        for column in self._ips.values():
+            column.set(row, None)
+
+        for key, value in attributes.items():
+            if key == 'name' and isinstance(value, str):
+                names[row] = value
+            elif key in self._codes and isinstance(value, str):
+                code = self._intern(value)
+                if code <= _MAX_CODES:
+                    self._codes[key][row] = code
+                else:
+                    extras[key] = value
+            elif key in self._ips:
+                packed = _pack_ip(value)
+                if packed is None:
+                    extras[key] = value
+                else:
+                    self._ips[key].set(row, packed)
+            elif key in _FLAG_BITS and value is True:
+                flags |= _FLAG_BITS[key]
+            elif (key in _COMMAND_KEYS and isinstance(value, list)
+                    and all(isinstance(x, str) for x in value)):
+                if value:
+                    commands.append(self._intern(key))
+                    commands.append(len(value))
+                    commands.extend(self._intern(x) for x in value)
+            elif key == 'bridge-opts' and not value:
+                # created on first use, see NetworkAdapter
+                continue
+            else:
+                if isinstance(value, str):
+                    value = intern(value)
+                extras[key] = value
+        self._flags[row] = flags
+        self._commands[row] = commands or None
+        self._extras[row] = tuple(
+            x for item in extras.items() for x in item) or None
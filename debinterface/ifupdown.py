@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Run ifup or ifdown on many interfaces: several interfaces per process,
+processes spread on a pool of threads, each with a timeout.
+"""
+from __future__ import print_function, with_statement, absolute_import
+from collections import namedtuple, OrderedDict
+from concurrent import futures
+
+from . import toolutils
+
+
+IFUP = '/sbin/ifup'
+IFDOWN = '/sbin/ifdown'
+# Default commands run at the same time
+MAX_WORKERS = 4
+
+# One per interface. output is the output of the process which handled
+# the interface, shared by the interfaces of a successful batch
+CommandResult = namedtuple('CommandResult', ['name', 'success', 'output'])
+
+
+def run_many(command, names, batch_size=1, max_workers=MAX_WORKERS,
+             timeout=None):
+    """ Run command on many interfaces.
+
+        Names are split into batches of batch_size, one process each, eg
+        "ifup eth0 eth1 eth2". A failed batch does not tell which of its
+        interfaces failed: they are run again one by one. ifup and ifdown
+        skip the interfaces already up or down, so this is safe.
+
+        Args:
+            command (str or list): path of ifup or ifdown, or a script
+                taking interface names the same way. A list holds the
+                path and the arguments before the names
+            names (iterable): interface names, duplicates are run once
+            batch_size (int, optional): interfaces per process. Default 1
+            max_workers (int, optional): processes running at the same
+                time. Default MAX_WORKERS
+            timeout (float, optional): seconds before a process is killed
+                and its interfaces reported as failed. Default None
+
+        Returns:
+            list: CommandResult, in the order of names
+
+        Raises:
+            ValueError: if batch_size or max_workers is lower than 1
+    """
+    if batch_size < 1 or max_workers < 1:
+        raise ValueError("batch_size and max_workers must be at least 1")
+    names = list(OrderedDict.fromkeys(names))
+    if not names:
+        return []
+    batches = [names[i:i + batch_size]
+               for i in range(0, len(names), batch_size)]
+
+    results = {}
+    with futures.ThreadPoolExecutor(max_workers) as executor:
+        tasks = [executor.submit(_run_batch, command, batch, timeout)
+                 for batch in batches]
+        retries = []
+        for batch, task in zip(batches, tasks):
+            success, output = task.result()
+            if success or len(batch) == 1:
+                for name in batch:
+                    results[name] = CommandResult(name, success, output)
+            else:
+                retries.extend(
+                    (name, executor.submit(_run_batch, command, [name],
+                                           timeout))
+                    for name in batch)
+        for name, task in retries:
+            results[name] = CommandResult(name, *task.result())
+    return [results[name] for name in names]
+
+
+def run_layers(command, layers, requires=None, **options):
+    """ Run command on layers of interfaces, one layer after the other,
+        each layer with run_many.
+
+        Args:
+            command (str): path of ifup or ifdown
+            layers (list): lists of interface names, see
+                AdapterGraph.layers
+            requires (function, optional): requires(name) returns the
+                names which must have succeeded to run name. The others
+                are reported failed without being run. Default None, run
+                every interface
+            **options: run_many batch_size, max_workers and timeout
+
+        Returns:
+            list: CommandResult, in the order of layers
+    """
+    results = []
+    failed = set()
+    for layer in layers:
+        done = {}
+        for name in layer:
+            blocking = [x for x in (requires(name) if requires else ())
+                        if x in failed]
+            if blocking:
+                done[name] = CommandResult(
+                    name, False,
+                    'not run, {0} failed'.format(' '.join(blocking)))
+        runnable = [x for x in layer if x not in done]
+        for result in run_many(command, runnable, **options):
+            done[result.name] = result
+        for name in OrderedDict.fromkeys(layer):
+            results.append(done[name])
+            if not done[name].success:
+                failed.add(name)
+    return results
+
+
+def _run_batch(command, names, timeout):
+    if isinstance(command, (list, tuple)):
+        command = list(command)
+    else:
+        command = [command]
+    return toolutils.safe_subprocess(command + names, timeout=timeout)
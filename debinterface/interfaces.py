@@ -1,10 +1,188 @@
 # -*- coding: utf-8 -*-
 # A class representing the contents of /etc/network/interfaces
 from __future__ import print_function, with_statement, absolute_import
-from .interfacesWriter import InterfacesWriter
-from .interfacesReader import InterfacesReader
-from .adapter import NetworkAdapter
-from . import toolutils
+import functools
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+from .interfacesWriter import InterfacesWriter, CHECK_MODES
+from .interfacesReader import InterfacesReader, VALIDATE_MODES
+from .interfacesDocument import InterfacesDocument
+from .snapshot import load_snapshot, save_snapshot
+from .adapter import ChangeLog, NetworkAdapter
+from .adapterGraph import AdapterGraph
+from .adapterTable import AdapterTable
+from .adapterIndexes import AdapterIndexes, StaleIndexError
+from .interfacesDiff import diff_adapters, plan_apply
+from . import ifupdown, toolutils
+
+
+# Adapters read by Interfaces.updateAdapters, by interfaces file real path.
+# Entries are used until one of the read files changes. Set maxsize to the
+# number of interfaces files managed by the process, 0 to disable it.
+# Adapters read in columnar mode are cached packed, in an AdapterTable.
+PARSE_CACHE = toolutils.LRUCache(maxsize=8)
+
+_CachedParse = namedtuple('_CachedParse', ['sources', 'adapters', 'validated'])
+
+# State of Interfaces when a transaction started: the adapters and a copy
+# of each of them, in the same order.
+_Transaction = namedtuple('_Transaction', ['adapters', 'baselines'])
+
+# Interfaces._signature until the file is read.
+_NOT_READ = object()
+
+
+def _adapters_of(other):
+    """ The adapters of an Interfaces, or other itself """
+    if isinstance(other, Interfaces):
+        return other.adapters
+    return other
+
+
+def _reading(method):
+    """ In thread safe mode, run method holding the read lock. If it
+        has to repair the indexes, run it again holding the write lock.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._lock is None:
+            return method(self, *args, **kwargs)
+        try:
+            with self._lock.reading():
+                return method(self, *args, **kwargs)
+        except StaleIndexError:
+            with self._lock.writing():
+                return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _writing(method):
+    """ In thread safe mode, run method holding the write lock. """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._lock is None:
+            return method(self, *args, **kwargs)
+        with self._lock.writing():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def _unlocked():
+    yield
+
+
+class _AdapterList(list):
+    """ The adapters list of an Interfaces. It tells the Interfaces about
+        the adapters added to it and removed from it, so that the name
+        and secondary indexes follow changes made through the list.
+    """
+
+    __slots__ = ('_owner', )
+
+    def __init__(self, owner, adapters=()):
+        list.__init__(self, adapters)
+        self._owner = owner
+
+    def __reduce__(self):
+        # copies and pickles are plain lists
+        return (list, (list(self), ))
+
+    def _tell(self):
+        """ The Interfaces to tell, None once it uses another list """
+        owner = self._owner
+        return owner if owner._adapters is self else None
+
+    def append(self, adapter):
+        list.append(self, adapter)
+        owner = self._tell()
+        if owner is not None:
+            owner._added(adapter, len(self) - 1)
+
+    def extend(self, adapters):
+        start = len(self)
+        list.extend(self, adapters)
+        owner = self._tell()
+        if owner is not None:
+            for position in range(start, len(self)):
+                owner._added(self[position], position)
+
+    def __iadd__(self, adapters):
+        self.extend(adapters)
+        return self
+
+    def insert(self, index, adapter):
+        list.insert(self, index, adapter)
+        owner = self._tell()
+        if owner is not None:
+            owner._added(adapter)
+
+    def pop(self, index=-1):
+        adapter = list.pop(self, index)
+        owner = self._tell()
+        if owner is not None:
+            owner._removed(adapter, index == -1)
+        return adapter
+
+    def remove(self, adapter):
+        list.remove(self, adapter)
+        owner = self._tell()
+        if owner is not None:
+            owner._removed(adapter)
+
+    def clear(self):
+        del self[:]
+
+    def __delitem__(self, index):
+        removed = self[index]
+        list.__delitem__(self, index)
+        owner = self._tell()
+        if owner is not None:
+            for adapter in (removed if isinstance(index, slice)
+                            else [removed]):
+                owner._removed(adapter)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            removed, value = self[index], list(value)
+            list.__setitem__(self, index, value)
+        else:
+            removed = [self[index]]
+            list.__setitem__(self, index, value)
+            value = [value]
+        owner = self._tell()
+        if owner is not None:
+            for adapter in removed:
+                owner._removed(adapter)
+            for adapter in value:
+                owner._added(adapter)
+
+    # Python 2 calls these for simple slices
+    def __setslice__(self, start, stop, value):
+        self.__setitem__(slice(start, stop), value)
+
+    def __delslice__(self, start, stop):
+        self.__delitem__(slice(start, stop))
+
+    def __imul__(self, count):
+        list.__imul__(self, count)
+        owner = self._tell()
+        if owner is not None:
+            owner.reindex()
+        return self
+
+    def sort(self, *args, **kwargs):
+        list.sort(self, *args, **kwargs)
+        owner = self._tell()
+        if owner is not None:
+            owner._positions = None
+
+    def reverse(self):
+        list.reverse(self)
+        owner = self._tell()
+        if owner is not None:
+            owner._positions = None
 
 
 class Interfaces(object):
@@ -12,7 +190,10 @@ class Interfaces(object):
 
     def __init__(self, update_adapters=True,
                  interfaces_path='/etc/network/interfaces',
-                 backup_path=None):
+                 backup_path=None, incremental=False, lossless=False,
+                 validate='strict', snapshot=False, snapshot_path=None,
+                 columnar=False, indexes=False, lock=False, cas=False,
+                 thread_safe=False, check='ifup'):
         """ By default read interface file on init
 
             Args:
@@ -22,18 +203,109 @@ class Interfaces(object):
                     /etc/network/interfaces
                 backup_path (str, optional): default to
                     /etc/network/interfaces.bak
+                incremental (bool, optional): updateAdapters only parses
+                    the changed stanzas and reports the changes.
+                    Default False
+                lossless (bool, optional): keep comments and layout of
+                    the file, writeInterfaces only rewrites changed
+                    lines. Included files are not read. Not available
+                    with incremental or snapshot. Default False
+                validate (str, optional): 'strict', 'lazy' or 'none',
+                    see InterfacesReader. With 'none', writeInterfaces
+                    does not validate adapters either. Default 'strict'
+                snapshot (bool, optional): load adapters from a binary
+                    snapshot while the files it was read from did not
+                    change, save one after each parse. Not available in
+                    incremental mode. Default False
+                snapshot_path (str, optional): default to
+                    interfaces_path + .snapshot
+                columnar (bool, optional): store adapters in an
+                    AdapterTable, for hosts with many interfaces.
+                    Not available in incremental and lossless modes.
+                    Default False
+                indexes (bool, optional): maintain the address, network,
+                    bridge port, auto and allow-hotplug indexes and the
+                    prefix trie used by getAdapterByAddress,
+                    getAdaptersInNetwork, getAdapterForDestination,
+                    getBridge, getAutoAdapters and getHotplugAdapters,
+                    which scan the adapters otherwise. Not available in
+                    columnar mode. Default False
+                lock (bool, optional): writeInterfaces holds an fcntl
+                    lock on interfaces_path + .lock, so that processes
+                    using this library do not write at the same time.
+                    The lock file is created next to the interfaces file.
+                    Default False
+                cas (bool, optional): compare and swap, writeInterfaces
+                    raises InterfacesChangedError instead of writing if
+                    the file changed since updateAdapters or the last
+                    write. Default False
+                thread_safe (bool, optional): guard the instance with a
+                    readers-writer lock. Lookups and adapters run in
+                    parallel, adapters returns a copy of the list.
+                    Changes, updateAdapters, writeInterfaces and
+                    transaction blocks run alone. Not available in
+                    columnar mode. Default False
+                check (str, optional): how writeInterfaces checks the
+                    file, one of InterfacesWriter CHECK_MODES: 'ifup',
+                    'python' (in process, no subprocess) or 'both'.
+                    Default 'ifup'
+
+            Raises:
+                ValueError: if validate is not one of VALIDATE_MODES,
+                    check not one of CHECK_MODES, if columnar is used
+                    with incremental, lossless, indexes or thread_safe,
+                    or if two of incremental, lossless and snapshot are
+                    used together
         """
+        if validate not in VALIDATE_MODES:
+            raise ValueError("validate must be one of {0}, not {1!r}".format(
+                ", ".join(VALIDATE_MODES), validate))
+        if check not in CHECK_MODES:
+            raise ValueError("check must be one of {0}, not {1!r}".format(
+                ", ".join(CHECK_MODES), check))
+        if columnar and (incremental or lossless or indexes or thread_safe):
+            raise ValueError("columnar can not be used with incremental, "
+                             "lossless, indexes or thread_safe")
+        if len([x for x in (incremental, lossless, snapshot) if x]) > 1:
+            raise ValueError("incremental, lossless and snapshot can not "
+                             "be used together")
 
         self._set_paths(interfaces_path, backup_path)
+        self._snapshot = snapshot
+        self._snapshot_path = (snapshot_path
+                               or self._interfaces_path + ".snapshot")
+        self._incremental = incremental
+        self._reader = None
+        self._lossless = lossless
+        self._document = None
+        self._validate = validate
+        # Read with validate='lazy' and not validated since
+        self._unvalidated = False
+        self._columnar = columnar
+        self._indexes = AdapterIndexes() if indexes else None
+        # The indexed adapters whose name or family changed
+        self._renamed = ChangeLog(('name', 'addrFam'))
+        self._entries = {}
+        self._transaction = None
+        self._lock_path = self._interfaces_path + ".lock" if lock else None
+        self._cas = cas
+        self._check = check
+        self._signature = _NOT_READ
+        self._lock = toolutils.ReadWriteLock() if thread_safe else None
 
         if update_adapters is True:
             self.updateAdapters()
         else:
-            self._adapters = []
+            self._adapters = AdapterTable() if columnar else []
+            self.reindex()
 
     @property
     def adapters(self):
-        return self._adapters
+        """ The adapters list. In thread safe mode, a copy of it. """
+        if self._lock is None:
+            return self._adapters
+        with self._lock.reading():
+            return list(self._adapters)
 
     @property
     def interfaces_path(self):
@@ -43,37 +315,140 @@ class Interfaces(object):
     def backup_path(self):
         return self._backup_path
 
+    @property
+    def snapshot_path(self):
+        return self._snapshot_path
+
+    @_writing
     def updateAdapters(self):
-        """ (re)read interfaces file and save adapters """
-        reader = InterfacesReader(self._interfaces_path)
-        self._adapters = reader.parse_interfaces()
-        if not self._adapters:
-            self._adapters = []
+        """ (re)read interfaces file and save adapters.
+            If the file and the files it includes did not change since
+            they were read, copies of the cached adapters are used,
+            see PARSE_CACHE.
+            In incremental mode, adapters of unchanged stanzas are kept
+            as they are, see InterfacesReader.update_interfaces.
+            In lossless mode, the file is read as an InterfacesDocument.
+            With snapshot, a valid snapshot is loaded instead of parsing.
+            In columnar mode, adapters are packed in an AdapterTable.
 
+            Returns:
+                AdapterChanges: in incremental mode only, else None
+        """
+        # Taken before reading: a change made while reading is detected
+        try:
+            self._signature = toolutils.file_signature(self._interfaces_path)
+        except OSError:
+            self._signature = None
+        self._unvalidated = self._validate == 'lazy'
+
+        if self._lossless:
+            self._document = InterfacesDocument.read(
+                self._interfaces_path, self._validate != 'strict')
+            self._adapters = self._document.adapters
+            self.reindex()
+            return
+
+        if self._incremental:
+            if self._reader is None:
+                self._reader = InterfacesReader(
+                    self._interfaces_path, validate=self._validate)
+            changes = self._reader.update_interfaces()
+            self._adapters = list(self._reader.adapters)
+            self.reindex()
+            return changes
+
+        key = os.path.realpath(self._interfaces_path)
+        cached = PARSE_CACHE.get(key, valid=self._is_usable)
+        if cached is not None:
+            self._unvalidated = self._unvalidated and not cached.validated
+            self._adapters = self._copy_adapters(cached.adapters)
+            self.reindex()
+            return
+
+        validated = self._validate == 'strict'
+        loaded = None
+        if self._snapshot:
+            loaded = load_snapshot(self._snapshot_path, validated)
+        if loaded is not None:
+            sources, self._adapters = loaded
+        else:
+            reader = InterfacesReader(
+                self._interfaces_path, validate=self._validate)
+            self._adapters = reader.parse_interfaces()
+            if not self._adapters:
+                self._adapters = []
+            sources = reader.sources
+            if self._snapshot:
+                self._save_snapshot(sources, validated)
+        self._pack_adapters()
+        if PARSE_CACHE.maxsize:
+            PARSE_CACHE.put(key, _CachedParse(
+                sources, self._copy_adapters(self._adapters), validated))
+        self.reindex()
+
+    @_writing
     def writeInterfaces(self):
-        """ write adapters to interfaces file """
-        return InterfacesWriter(
-            self._adapters,
-            self._interfaces_path,
-            self._backup_path
-        ).write_interfaces()
+        """ write adapters to interfaces file.
+            In a transaction, the file is written when it ends.
 
-    def getAdapter(self, name):
-        """ Find adapter by interface name
+            Returns:
+                bool: False if the file already had this content and was
+                    left as is. None in a transaction
+        """
+        if self._transaction is not None:
+            return
+        return self._write(self._validate != 'none')
+
+    @contextmanager
+    def transaction(self):
+        """ Group changes to the adapters: adds, removes and changes
+            of adapter options. addAdapter does not validate the new
+            adapters, they are validated with the changed ones at the
+            end of the block, once, then the file is written once.
+            If the block raises, or if the validation or the write
+            fails, adapters are restored to their state before the
+            block and the exception is raised again.
+            A transaction opened in a transaction joins it.
+            In thread safe mode, the block holds the write lock.
+
+            Raises:
+                ValueError: if a validation error or the file check fails
+        """
+        with (self._lock.writing() if self._lock else _unlocked()):
+            if self._transaction is not None:
+                yield self
+                return
+            adapters = list(self._adapters)
+            self._transaction = _Transaction(
+                adapters, [x.copy() for x in adapters])
+            try:
+                yield self
+                self._commit()
+            except Exception:
+                self._rollback()
+                raise
+            finally:
+                self._transaction = None
+
+    @_reading
+    def getAdapter(self, name, addrFam=None):
+        """ Find adapter by interface name, through the name indexes.
 
             Args:
                 name (str): the name of the interface
+                addrFam (str, optional): only find the adapter of this
+                    family, inet and inet6 stanzas share their name
 
             Returns:
                 NetworkAdapter: the new adapter or None if not found
         """
-        return next(
-            (
-                x for x in self._adapters
-                if x.attributes['name'] == name
-            ),
-            None)
+        if self._columnar:
+            rows = self._table_rows(name, addrFam)
+            return self._adapters[rows[0]] if rows else None
+        adapters = self._indexed(name, addrFam)
+        return adapters[0] if adapters else None
 
+    @_writing
     def addAdapter(self, options, index=None):
         """Insert a NetworkAdapter before the given index
             or at the end of the list.
@@ -87,7 +462,8 @@ class Interfaces(object):
                 NetworkAdapter: the new adapter
         """
         adapter = NetworkAdapter(options)
-        adapter.validateAll()
+        if self._transaction is None:
+            adapter.validateAll()
 
         if index is None:
             self._adapters.append(adapter)
@@ -95,6 +471,7 @@ class Interfaces(object):
             self._adapters.insert(index, adapter)
         return adapter
 
+    @_writing
     def removeAdapter(self, index):
         """ Remove the adapter at the given index.
 
@@ -103,16 +480,129 @@ class Interfaces(object):
         """
         self._adapters.pop(index)
 
-    def removeAdapterByName(self, name):
-        """ Remove the adapter with the given name.
+    @_writing
+    def removeAdapterByName(self, name, addrFam=None):
+        """ Remove the adapters with the given name.
 
             Args:
                 name (str): the name of the interface
+                addrFam (str, optional): only remove the adapter of
+                    this family
+        """
+        if self._columnar:
+            for row in reversed(self._table_rows(name, addrFam)):
+                del self._adapters[row]
+            return
+        for adapter in list(self._indexed(name, addrFam)):
+            self._adapters.remove(adapter)
+
+    @_reading
+    def getAdapterByAddress(self, address):
+        """ Find the adapter with the given address.
+
+            Args:
+                address (str): an IPv4 or IPv6 address
+
+            Returns:
+                NetworkAdapter: the adapter or None if not found
+        """
+        adapters = self._secondary().by_address(
+            address, repair=self._may_repair())
+        return self._in_order(adapters)[0] if adapters else None
+
+    @_reading
+    def getAdaptersInNetwork(self, network):
+        """ Find the adapters whose address and netmask are in network.
+
+            Args:
+                network (str): a network, eg 10.0.0.0/24
+
+            Returns:
+                list: NetworkAdapter
+        """
+        adapters = self._secondary().by_network(
+            network, repair=self._may_repair())
+        return self._in_order(adapters)
+
+    @_reading
+    def getAdapterForDestination(self, address):
+        """ Find the adapter that would carry traffic to address: the
+            adapter of the longest network, from address and netmask,
+            containing it. See AdapterIndexes.by_destination.
+
+            Args:
+                address (str): an IPv4 or IPv6 address
+
+            Returns:
+                NetworkAdapter: the adapter or None if no adapter
+                    network contains address
+        """
+        adapters = self._secondary().by_destination(
+            address, repair=self._may_repair())
+        return self._in_order(adapters)[0] if adapters else None
+
+    @_reading
+    def getBridge(self, port):
+        """ Find the bridge whose bridge_ports contain port.
+
+            Args:
+                port (str): the name of the port interface
+
+            Returns:
+                NetworkAdapter: the bridge or None if not found
+        """
+        adapters = self._secondary().by_port(port, repair=self._may_repair())
+        return self._in_order(adapters)[0] if adapters else None
+
+    @_reading
+    def getAutoAdapters(self):
+        """ Returns:
+                list: the adapters started by ifup -a
+        """
+        adapters = self._secondary().auto(repair=self._may_repair())
+        return self._in_order(adapters)
+
+    @_reading
+    def getHotplugAdapters(self):
+        """ Returns:
+                list: the allow-hotplug adapters
+        """
+        adapters = self._secondary().hotplug(repair=self._may_repair())
+        return self._in_order(adapters)
+
+    @_writing
+    def reindex(self, adapter=None):
+        """ Build the indexes again. Adapters added to or removed from
+            the adapters list, and the options changed through the
+            adapters, are indexed as they change. Call it after changing
+            a container of an adapter in place, eg its bridge-opts dict.
+
+            Args:
+                adapter (NetworkAdapter, optional): only index again
+                    this adapter of the list
         """
-        self._adapters = [
-            x for x in self._adapters
-            if x.attributes['name'] != name
-        ]
+        entry = self._entries.get(id(adapter))
+        if entry is not None:
+            self._unindex_adapter(adapter)
+            self._index_adapter(adapter)[3] = entry[3]
+            return
+        for entry in self._entries.values():
+            self._renamed.unwatch(entry[0])
+        # name => adapters, (name, addrFam) => adapters
+        self._by_name = {}
+        self._by_family = {}
+        # id(adapter) => [adapter, name, addrFam, times in the list]
+        self._entries = {}
+        # id(adapter) => position in the list, built when needed
+        self._positions = None
+        if self._columnar:
+            return
+        if not isinstance(self._adapters, _AdapterList):
+            self._adapters = _AdapterList(self, self._adapters)
+        if self._indexes is not None:
+            self._indexes.rebuild()
+        for adapter in self._adapters:
+            self._added(adapter)
 
     @staticmethod
     def upAdapter(if_name):
@@ -140,6 +630,365 @@ class Interfaces(object):
 
         return toolutils.safe_subprocess(["/sbin/ifdown", if_name])
 
+    @staticmethod
+    def upAdapters(if_names, command=ifupdown.IFUP, **options):
+        """Uses ifup on many interfaces, see ifupdown.run_many
+
+            Args:
+                if_names (iterable): the names of the interfaces
+                command (str, optional): the ifup path
+                **options: batch_size, max_workers and timeout
+
+            Returns:
+                list: ifupdown.CommandResult, one per interface
+        """
+        return ifupdown.run_many(command, if_names, **options)
+
+    @staticmethod
+    def downAdapters(if_names, command=ifupdown.IFDOWN, **options):
+        """Uses ifdown on many interfaces, see ifupdown.run_many
+
+            Args:
+                if_names (iterable): the names of the interfaces
+                command (str, optional): the ifdown path
+                **options: batch_size, max_workers and timeout
+
+            Returns:
+                list: ifupdown.CommandResult, one per interface
+        """
+        return ifupdown.run_many(command, if_names, **options)
+
+    def dependencyGraph(self):
+        """ Returns:
+                AdapterGraph: dependencies between the interfaces, from
+                    bridge_ports, bond-slaves and vlan-raw-device
+        """
+        return AdapterGraph(self.adapters)
+
+    def getRestartSet(self, if_names):
+        """ The interfaces to restart when the given ones changed.
+
+            Args:
+                if_names (iterable): the changed interfaces
+
+            Returns:
+                list: them and the interfaces depending on them, in ifup
+                    order
+        """
+        return self.dependencyGraph().restart_set(if_names)
+
+    def upAdaptersInOrder(self, if_names=None, command=ifupdown.IFUP,
+                          **options):
+        """Uses ifup on interfaces, layer after layer of the dependency
+            graph. Interfaces whose dependencies failed are not run.
+
+            Args:
+                if_names (iterable, optional): the names of the
+                    interfaces, default to all of them
+                command (str, optional): the ifup path
+                **options: batch_size, max_workers and timeout
+
+            Returns:
+                list: ifupdown.CommandResult, one per interface
+
+            Raises:
+                ValueError: if the interfaces depend on each other in a
+                    cycle
+        """
+        graph = self.dependencyGraph()
+        return ifupdown.run_layers(command, graph.layers(if_names),
+                                   graph.dependencies, **options)
+
+    def downAdaptersInOrder(self, if_names=None, command=ifupdown.IFDOWN,
+                            **options):
+        """Uses ifdown on interfaces, dependents first.
+
+            Args:
+                if_names (iterable, optional): the names of the
+                    interfaces, default to all of them
+                command (str, optional): the ifdown path
+                **options: batch_size, max_workers and timeout
+
+            Returns:
+                list: ifupdown.CommandResult, one per interface
+
+            Raises:
+                ValueError: if the interfaces depend on each other in a
+                    cycle
+        """
+        graph = self.dependencyGraph()
+        return ifupdown.run_layers(
+            command, graph.layers(if_names, reverse=True), **options)
+
+    def diff(self, other):
+        """ Compare these adapters with other ones.
+
+            Args:
+                other (Interfaces or iterable): the wanted state, an
+                    Interfaces or NetworkAdapter
+
+            Returns:
+                list: interfacesDiff.AdapterChange
+        """
+        return diff_adapters(self.adapters, _adapters_of(other))
+
+    def planApply(self, current):
+        """ The ifdown and ifup needed to go from current to these
+            adapters, for the changed interfaces only.
+
+            Args:
+                current (Interfaces or iterable): the state in use, an
+                    Interfaces or NetworkAdapter
+
+            Returns:
+                interfacesDiff.ApplyPlan: changes and layers to run
+
+            Raises:
+                ValueError: if the interfaces depend on each other in a
+                    cycle
+        """
+        return plan_apply(_adapters_of(current), self.adapters)
+
+    def applyChanges(self, current, ifup=ifupdown.IFUP,
+                     ifdown=ifupdown.IFDOWN, **options):
+        """ Bring down the changed interfaces, write the adapters and
+            bring them up, see planApply.
+
+            Args:
+                current (Interfaces or iterable): the state in use, eg an
+                    Interfaces read before the changes
+                ifup (str, optional): the ifup path
+                ifdown (str, optional): the ifdown path
+                **options: batch_size, max_workers and timeout
+
+            Returns:
+                interfacesDiff.ApplyPlan, list: the plan and an
+                    ifupdown.CommandResult per command run, ifdown first
+
+            Raises:
+                ValueError: if the interfaces depend on each other in a
+                    cycle, or if the file check fails
+        """
+        plan = self.planApply(current)
+        results = ifupdown.run_layers(ifdown, plan.down, **options)
+        self.writeInterfaces()
+        graph = self.dependencyGraph()
+        results.extend(ifupdown.run_layers(ifup, plan.up, graph.dependencies,
+                                           **options))
+        return plan, results
+
+    def _write(self, validate):
+        options = {}
+        if self._cas and self._signature is not _NOT_READ:
+            options['expected_signature'] = self._signature
+        adapters = self._adapters
+        if self._columnar:
+            # the views of the rows are built once for the write
+            adapters = list(adapters)
+        writer = InterfacesWriter(
+            adapters,
+            self._interfaces_path,
+            self._backup_path,
+            document=self._document,
+            validate=validate,
+            lock_path=self._lock_path,
+            check=self._check,
+            **options
+        )
+        try:
+            result = writer.write_interfaces()
+        finally:
+            if self._columnar:
+                # drop the views, the table does not keep the changed ones
+                writer.adapters = adapters = None
+                self._adapters.compact()
+        self._signature = writer.signature
+        if validate:
+            self._unvalidated = False
+        return result
+
+    def _commit(self):
+        """ Validate the adapters added or changed in the transaction,
+            then write the file without validating the others again.
+            Adapters read with validate='lazy' are all validated, once """
+        baselines = dict(
+            (id(x), y) for x, y in zip(*self._transaction))
+        if self._validate != 'none':
+            for adapter in self._adapters:
+                baseline = baselines.get(id(adapter))
+                if (self._unvalidated or baseline is None
+                        or baseline.attributes != adapter.attributes):
+                    adapter.validateAll()
+        self._unvalidated = False
+        self._write(False)
+
+    def _rollback(self):
+        """ Restore the adapters as they were when the transaction
+            started, in place """
+        adapters, baselines = self._transaction
+        for adapter, baseline in zip(adapters, baselines):
+            adapter.__setstate__(baseline.__getstate__())
+        if self._columnar:
+            self._adapters = AdapterTable()
+            for adapter in adapters:
+                self._adapters.append(adapter)
+        else:
+            self._adapters = adapters
+        self.reindex()
+
+    def _pack_adapters(self):
+        """ Move the adapters in an AdapterTable, in columnar mode """
+        if self._columnar:
+            self._adapters = AdapterTable(self._adapters)
+
+    def _copy_adapters(self, adapters):
+        """ Copies of adapters, to or from PARSE_CACHE: packed in an
+            AdapterTable in columnar mode, so that the cache does not
+            hold adapter objects for these instances """
+        if not self._columnar:
+            return [x.copy() for x in adapters]
+        if isinstance(adapters, AdapterTable):
+            return adapters.copy()
+        return AdapterTable(adapters)
+
+    def _index_adapter(self, adapter):
+        """ Index an adapter, see _added
+
+            Returns:
+                list: its entry
+        """
+        attributes = adapter.attributes
+        name = attributes.get('name')
+        family = attributes.get('addrFam')
+        entry = self._entries[id(adapter)] = [adapter, name, family, 1]
+        self._by_name.setdefault(name, []).append(adapter)
+        self._by_family.setdefault((name, family), []).append(adapter)
+        self._renamed.watch(adapter)
+        if self._indexes is not None:
+            self._indexes.add(adapter)
+        return entry
+
+    def _unindex_adapter(self, adapter):
+        """ Remove adapter from the indexes, with the keys it was indexed
+            with """
+        _, name, family, _ = self._entries.pop(id(adapter))
+        for index, key in ((self._by_name, name),
+                           (self._by_family, (name, family))):
+            adapters = index[key]
+            adapters.remove(adapter)
+            if not adapters:
+                del index[key]
+        self._renamed.unwatch(adapter)
+        if self._indexes is not None:
+            self._indexes.remove(adapter)
+
+    def _added(self, adapter, position=None):
+        """ Index an adapter added to the list, see _AdapterList.
+            position is given when the adapters after it did not move.
+        """
+        entry = self._entries.get(id(adapter))
+        if entry is None:
+            self._index_adapter(adapter)
+        else:
+            # the same adapter twice in the list
+            entry[3] += 1
+        if position is None:
+            self._positions = None
+        elif self._positions is not None:
+            self._positions[id(adapter)] = position
+
+    def _removed(self, adapter, last=False):
+        """ Unindex an adapter removed from the list, see _AdapterList.
+            last tells it was the last one of the list.
+        """
+        entry = self._entries[id(adapter)]
+        entry[3] -= 1
+        if not entry[3]:
+            self._unindex_adapter(adapter)
+        if not last:
+            self._positions = None
+        elif self._positions is not None:
+            self._positions.pop(id(adapter), None)
+
+    def _indexed(self, name, addrFam=None):
+        """ Adapters with the given name (and family), from the indexes,
+            in list order """
+        self._refresh()
+        if addrFam is None:
+            adapters = self._by_name.get(name, ())
+        else:
+            adapters = self._by_family.get((name, addrFam), ())
+        return self._in_order(adapters)
+
+    def _position(self, adapter):
+        if self._positions is None:
+            # shifted by inserts and removes, built again once needed
+            self._positions = dict(
+                (id(x), i) for i, x in enumerate(self._adapters))
+        return self._positions[id(adapter)]
+
+    def _in_order(self, adapters):
+        """ Sort adapters found by the indexes in list order """
+        if len(adapters) < 2:
+            return adapters
+        return sorted(adapters, key=self._position)
+
+    def _secondary(self):
+        """ The maintained secondary indexes, or indexes of the current
+            adapters built for one lookup """
+        if self._indexes is None:
+            return AdapterIndexes(self._adapters, track=False)
+        return self._indexes
+
+    def _refresh(self):
+        """ Index again the adapters renamed since the last lookup
+
+            Raises:
+                StaleIndexError: if the indexes may not be changed, see
+                    _reading
+        """
+        if not self._renamed:
+            return
+        if not self._may_repair():
+            raise StaleIndexError()
+        renamed = self._renamed.changed()
+        self._renamed.clear()
+        for adapter in renamed:
+            attributes = adapter.attributes
+            if self._entries[id(adapter)][1:3] != [
+                    attributes.get('name'), attributes.get('addrFam')]:
+                self.reindex(adapter)
+
+    def _may_repair(self):
+        """ Tell if the indexes may be changed: always, except while
+            holding the read lock only """
+        return self._lock is None or self._lock.is_writing()
+
+    def _table_rows(self, name, addrFam=None):
+        """ Rows of an AdapterTable with the given name (and family) """
+        rows = self._adapters.indexes('name', name)
+        if addrFam is not None:
+            families = set(self._adapters.indexes('addrFam', addrFam))
+            rows = [x for x in rows if x in families]
+        return rows
+
+    def _save_snapshot(self, sources, validated):
+        """ Save a snapshot of the adapters. The snapshot is an
+            optimization: failing to write it is not an error.
+        """
+        try:
+            save_snapshot(self._snapshot_path, sources, self._adapters,
+                          validated)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def _is_usable(self, cached):
+        """ Tell if no file of a cached parse changed, and if it was
+            validated when this instance validates """
+        if not cached.validated and self._validate == 'strict':
+            return False
+        return not toolutils.signatures_changed(cached.sources)
+
     def _set_paths(self, interfaces_path, backup_path):
         """ either use user input or defaults
 
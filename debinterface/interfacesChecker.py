@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Structural checks of the adapters, in process: the mistakes ifup
+--no-act reports on a written file, found before writing it and without
+ifupdown installed.
+"""
+from __future__ import print_function, with_statement, absolute_import
+
+from .adapterValidation import REQUIRED_FAMILY_OPTS
+
+
+def structure_errors(adapters):
+    """ Find the structural mistakes of adapters:
+        - stanzas without a name
+        - two stanzas with the same name and family
+        - families or methods unknown in REQUIRED_FAMILY_OPTS
+        - options required by the method missing
+        - auto or allow-hotplug names without an iface stanza
+
+        Args:
+            adapters (iterable): NetworkAdapter
+
+        Returns:
+            list: error messages, empty if the adapters are valid
+    """
+    errors = []
+    stanzas = set()
+    # names with an iface stanza, names of auto and allow-hotplug lines
+    defined = set()
+    flagged = []
+    for adapter in adapters:
+        attributes = adapter.attributes
+        name = attributes.get('name')
+        if not name:
+            errors.append("an adapter has no name")
+            continue
+        if attributes.get('auto') is True:
+            flagged.append(('auto', name))
+        if attributes.get('hotplug') is True:
+            flagged.append(('allow-hotplug', name))
+        family = attributes.get('addrFam')
+        method = attributes.get('source')
+        if not family or not method:
+            # auto or allow-hotplug line only
+            continue
+        defined.add(name)
+
+        if (name, family) in stanzas:
+            errors.append("duplicate interface {0} {1}".format(name, family))
+            continue
+        stanzas.add((name, family))
+
+        methods = REQUIRED_FAMILY_OPTS.get(family)
+        if methods is None:
+            errors.append("{0}: unknown address family {1}".format(
+                name, family))
+            continue
+        required = methods.get(method)
+        if required is None:
+            errors.append("{0}: unknown method {1} for family {2}".format(
+                name, method, family))
+            continue
+        for option in required:
+            if not attributes.get(option):
+                errors.append(
+                    "{0}: option {1} is required for method {2} in "
+                    "family {3}".format(name, option, method, family))
+
+    for keyword, name in flagged:
+        if name not in defined:
+            errors.append("{0} {1} has no iface stanza".format(keyword, name))
+    return errors
+
+
+def check_structure(adapters):
+    """ Raise the structural mistakes of adapters, see structure_errors.
+
+        Args:
+            adapters (iterable): NetworkAdapter
+
+        Raises:
+            ValueError: if the adapters have structural mistakes, with
+                all of them
+    """
+    errors = structure_errors(adapters)
+    if errors:
+        raise ValueError("Invalid network interfaces : {0}".format(
+            "; ".join(errors)))
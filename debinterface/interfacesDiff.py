@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Compare two states of the adapters and plan the ifdown/ifup needed to
+go from the first to the second, for the changed interfaces only.
+"""
+from __future__ import print_function, with_statement, absolute_import
+from collections import namedtuple, OrderedDict
+
+from .adapterGraph import AdapterGraph
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+# Only addressing options changed
+ADDRESS = 'address'
+# Only up, down, pre-up... commands changed
+HOOKS = 'hooks'
+# Only auto or allow-hotplug changed, nothing to restart
+FLAGS = 'flags'
+# Anything else, eg bridge ports or the method
+CHANGED = 'changed'
+
+ADDRESS_OPTIONS = frozenset([
+    'address', 'netmask', 'gateway', 'broadcast', 'network',
+    'dns-nameservers'])
+HOOK_OPTIONS = frozenset([
+    'up', 'down', 'pre-up', 'pre-down', 'post-up', 'post-down'])
+FLAG_OPTIONS = frozenset(['auto', 'hotplug'])
+
+# One per added, removed or changed stanza. old and new are the adapters,
+# None for an added or removed stanza, options the changed option names.
+AdapterChange = namedtuple('AdapterChange', [
+    'name', 'addrFam', 'kind', 'old', 'new', 'options'])
+
+# changes: the AdapterChange list. down: layers of names to ifdown, before
+# writing the new file. up: layers of names to ifup, after writing it.
+ApplyPlan = namedtuple('ApplyPlan', ['changes', 'down', 'up'])
+
+
+def _options(adapter):
+    """ Options of an adapter, without the empty containers """
+    return dict((key, value)
+                for key, value in adapter.attributes.items()
+                if value not in ({}, [], None))
+
+
+def _stanzas(adapters):
+    """ (name, addrFam) => adapter, in list order """
+    stanzas = OrderedDict()
+    for adapter in adapters:
+        attributes = adapter.attributes
+        stanzas[(attributes.get('name'), attributes.get('addrFam'))] = adapter
+    return stanzas
+
+
+def _kind(options):
+    """ Classify a change from the names of the changed options """
+    for kind, known in ((FLAGS, FLAG_OPTIONS), (ADDRESS, ADDRESS_OPTIONS),
+                        (HOOKS, HOOK_OPTIONS)):
+        if options <= known:
+            return kind
+    return CHANGED
+
+
+def diff_adapters(old, new):
+    """ Compare two states of the adapters, stanza by stanza, by name and
+        family.
+
+        Args:
+            old (iterable): NetworkAdapter, the current state
+            new (iterable): NetworkAdapter, the wanted state
+
+        Returns:
+            list: AdapterChange, removed stanzas first then in the order
+                of new
+    """
+    old, new = _stanzas(old), _stanzas(new)
+    changes = [AdapterChange(key[0], key[1], REMOVED, adapter, None, [])
+               for key, adapter in old.items() if key not in new]
+    for key, adapter in new.items():
+        before = old.get(key)
+        if before is None:
+            changes.append(
+                AdapterChange(key[0], key[1], ADDED, None, adapter, []))
+            continue
+        before_options, options = _options(before), _options(adapter)
+        changed = set(x for x in set(before_options) | set(options)
+                      if before_options.get(x) != options.get(x))
+        if changed:
+            changes.append(AdapterChange(key[0], key[1], _kind(changed),
+                                         before, adapter, sorted(changed)))
+    return changes
+
+
+def plan_apply(old, new):
+    """ The ifdown and ifup going from old to new. Removed interfaces are
+        brought down, added ones up, changed ones down and up again.
+        Changes of the interface itself also restart the interfaces
+        depending on it, eg the bridges of a port. Address and hook
+        changes only restart the interface, flag changes nothing.
+        ifdown and ifup work on interfaces, so a changed inet6 stanza
+        restarts the inet one too.
+
+        Args:
+            old (iterable): NetworkAdapter, the current state
+            new (iterable): NetworkAdapter, the wanted state
+
+        Returns:
+            ApplyPlan: the changes and the layers to run
+
+        Raises:
+            ValueError: if the interfaces depend on each other in a cycle
+    """
+    old, new = list(old), list(new)
+    changes = diff_adapters(old, new)
+    old_graph, new_graph = AdapterGraph(old), AdapterGraph(new)
+    old_names = set(x.attributes.get('name') for x in old)
+    new_names = set(x.attributes.get('name') for x in new)
+
+    removed = old_names - new_names
+    added = new_names - old_names
+    restarted = set()
+    # interfaces whose dependents restart too
+    deep = removed | added
+    for change in changes:
+        if change.name in deep or change.kind == FLAGS:
+            continue
+        restarted.add(change.name)
+        if change.kind not in (ADDRESS, HOOKS):
+            deep.add(change.name)
+    dependents = set(old_graph.restart_set(deep))
+    dependents.update(new_graph.restart_set(deep))
+    restarted |= dependents & old_names & new_names
+
+    down = old_graph.layers(removed | restarted, reverse=True)
+    up = new_graph.layers(added | restarted)
+    return ApplyPlan(changes, down, up)
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""The InterfacesDocument keeps an interfaces file as it was read: comments,
+blank lines, option order and spacing. Adapters read from it are plain
+NetworkAdapter. When rendering, the options changed on each adapter since
+the last read or write are patched in place, so a one option change is
+a one line change in the file.
+"""
+from __future__ import print_function, with_statement, absolute_import
+import difflib
+import re
+
+from .interfacesReader import InterfacesReader
+from .interfacesWriter import InterfacesWriter
+
+
+# Keys of NetworkAdapter.attributes not written as option lines.
+_HEADER_KEYS = ('name', 'addrFam', 'source')
+_FLAG_KEYWORDS = {'auto': 'auto', 'hotplug': 'allow-hotplug'}
+# Option lines holding a list, one line per item.
+_LIST_KEYS = ('pre-up', 'up', 'post-up', 'down', 'pre-down', 'post-down')
+
+# indentation, keyword, separator, value, line ending
+_OPTION_LINE = re.compile(r'^(\s*)(\S+)([ \t]*)(.*?)[ \t]*(\r?\n)?$')
+
+
+def _is_trivia(line):
+    """ Blank and comment lines """
+    stripped = line.strip()
+    return not stripped or stripped[0] == '#'
+
+
+def _split_clauses(lines):
+    """ Group lines by top level clause. Indented, blank and comment lines
+        belong to the clause above them. Lines before the first clause
+        make a clause of their own.
+
+        Args:
+            lines (list): lines of an interfaces file, with line endings
+
+        Returns:
+            list: _Clause
+    """
+    clauses = []
+    current = None
+    for line in lines:
+        if line[:1].isspace() or _is_trivia(line):
+            if current is None:
+                current = _Clause([])
+                clauses.append(current)
+            current.lines.append(line)
+        else:
+            current = _Clause([line])
+            clauses.append(current)
+    return clauses
+
+
+class _Clause(object):
+    """ A top level clause and the lines below it. iface clauses are
+        linked to their adapter and to a copy of it as last read or
+        written, the baseline.
+    """
+
+    def __init__(self, lines, adapter=None, baseline=None):
+        self.lines = lines
+        self.adapter = adapter
+        self.baseline = baseline
+
+    @property
+    def keyword(self):
+        if not self.lines or _is_trivia(self.lines[0]):
+            return None
+        return self.lines[0].split()[0]
+
+    @property
+    def body_end(self):
+        """ Index after the last option line """
+        end = 1
+        for index, line in enumerate(self.lines[1:], 1):
+            if not _is_trivia(line):
+                end = index + 1
+        return end
+
+
+class InterfacesDocument(object):
+    """ Lossless representation of one interfaces file.
+        source and source-directory clauses are kept as they are, but
+        not followed.
+    """
+
+    def __init__(self, content='', trusted=False):
+        """ Args:
+                content (str, optional): text of an interfaces file
+                trusted (bool, optional): options are stored without
+                    being validated, see InterfacesReader validate
+        """
+        self._trusted = trusted
+        self._clauses = []
+        self._pending = None
+        self.load(content)
+
+    @classmethod
+    def read(cls, interfaces_path, trusted=False):
+        """ Build a document from a file.
+
+            Args:
+                interfaces_path (str): path to interfaces file
+                trusted (bool, optional): do not validate options
+
+            Returns:
+                InterfacesDocument: the document
+        """
+        with open(interfaces_path, "rb") as interfaces:
+            content = interfaces.read()
+        if not isinstance(content, str):
+            content = content.decode('utf-8')
+        return cls(content, trusted)
+
+    @property
+    def adapters(self):
+        """ Adapters of the iface clauses, in file order.
+
+            Returns:
+                list: NetworkAdapter
+        """
+        return [x.adapter for x in self._clauses if x.adapter is not None]
+
+    def load(self, content):
+        """ Replace the document by a new content, new adapters are built.
+
+            Args:
+                content (str): text of an interfaces file
+        """
+        self._clauses = _split_clauses(content.splitlines(True))
+        self._pending = None
+        auto_names, hotplug_names = set(), set()
+        for clause in self._clauses:
+            if clause.keyword is None:
+                continue
+            for item in InterfacesReader._read_lines(
+                    clause.lines, auto_names, hotplug_names,
+                    self._trusted):
+                if clause.keyword == 'iface':
+                    clause.adapter = item
+        for clause in self._clauses:
+            if clause.adapter is None:
+                continue
+            if clause.adapter.attributes['name'] in auto_names:
+                clause.adapter.setAuto(True)
+            if clause.adapter.attributes['name'] in hotplug_names:
+                clause.adapter.setHotplug(True)
+            clause.baseline = clause.adapter.copy()
+
+    def render(self, adapters):
+        """ Render the document with the given adapters. Adapters of the
+            document are patched, missing ones are removed, and new ones
+            are inserted before the adapter following them in the list.
+            Call commit once the content is written.
+
+            Args:
+                adapters (list): NetworkAdapter
+
+            Returns:
+                str: the content of the interfaces file
+        """
+        adapters = list(adapters)
+        live = set(id(x) for x in adapters)
+        known = set(x.adapter.attributes['name'] for x in self._clauses
+                    if x.adapter is not None)
+        known.update(x.attributes['name'] for x in adapters)
+        wanted = {}
+        for flag in _FLAG_KEYWORDS:
+            wanted[flag] = set(x.attributes['name'] for x in adapters
+                               if x.attributes.get(flag) is True)
+
+        # New adapters go before the next adapter of the document.
+        in_document = set(id(x.adapter) for x in self._clauses)
+        inserted, tail, following = {}, [], None
+        for adapter in reversed(adapters):
+            if id(adapter) in in_document:
+                following = adapter
+            elif following is None:
+                tail.insert(0, adapter)
+            else:
+                inserted.setdefault(id(following), []).insert(0, adapter)
+
+        # Flag clauses first: names not listed anymore need a new line.
+        flag_lines = {}
+        listed = dict((flag, set()) for flag in _FLAG_KEYWORDS)
+        for clause in self._clauses:
+            flag = self._flag_of(clause.keyword)
+            if flag is None:
+                continue
+            names = clause.lines[0].split()[1:]
+            kept = [x for x in names if x not in known or x in wanted[flag]]
+            listed[flag].update(kept)
+            if kept != names:
+                flag_lines[id(clause)] = kept
+
+        clauses = []
+        for clause in self._clauses:
+            if id(clause) in flag_lines:
+                clauses.extend(self._patch_flags(
+                    clause, flag_lines[id(clause)]))
+            elif clause.adapter is None:
+                clauses.append(_Clause(list(clause.lines)))
+            elif id(clause.adapter) not in live:
+                # Removed: keep the comments after the stanza
+                trailing = clause.lines[clause.body_end:]
+                if trailing:
+                    clauses.append(_Clause(trailing))
+            else:
+                # Before the auto lines of the next stanza
+                position = len(clauses)
+                while position and self._flag_of(
+                        clauses[position - 1].keyword) is not None:
+                    position -= 1
+                for adapter in inserted.get(id(clause.adapter), ()):
+                    new_clauses = self._new_clauses(adapter, listed)
+                    clauses[position:position] = new_clauses
+                    position += len(new_clauses)
+                clauses.extend(self._missing_flags(
+                    clause.adapter, wanted, listed))
+                clauses.append(self._patch_stanza(clause))
+        if tail and clauses and clauses[-1].lines \
+                and not _is_trivia(clauses[-1].lines[-1]):
+            clauses.append(_Clause(['\n']))
+        for adapter in tail:
+            clauses.extend(self._new_clauses(adapter, listed))
+
+        self._pending = clauses
+        lines = [line for clause in clauses for line in clause.lines]
+        for index, line in enumerate(lines[:-1]):
+            if not line.endswith('\n'):
+                lines[index] = line + '\n'
+        return ''.join(lines)
+
+    def commit(self):
+        """ Make the last rendered content the new baseline. """
+        if self._pending is None:
+            return
+        for clause in self._pending:
+            if clause.adapter is not None:
+                clause.baseline = clause.adapter.copy()
+        self._clauses = self._pending
+        self._pending = None
+
+    @staticmethod
+    def _flag_of(keyword):
+        for flag, flag_keyword in _FLAG_KEYWORDS.items():
+            if keyword == flag_keyword:
+                return flag
+        return None
+
+    @staticmethod
+    def _patch_flags(clause, names):
+        """ Rewrite an auto or allow-hotplug line with the kept names """
+        first = _OPTION_LINE.match(clause.lines[0])
+        trailing = list(clause.lines[1:])
+        if not names:
+            return [_Clause(trailing)] if trailing else []
+        line = '{0} {1}{2}'.format(
+            first.group(2), ' '.join(names), first.group(5) or '')
+        return [_Clause([line] + trailing)]
+
+    def _missing_flags(self, adapter, wanted, listed):
+        """ auto and allow-hotplug lines for a flag set since last read """
+        clauses = []
+        name = adapter.attributes['name']
+        for flag in sorted(_FLAG_KEYWORDS):
+            if name in wanted[flag] and name not in listed[flag]:
+                listed[flag].add(name)
+                clauses.append(_Clause(
+                    ['{0} {1}\n'.format(_FLAG_KEYWORDS[flag], name)]))
+        return clauses
+
+    def _new_clauses(self, adapter, listed):
+        """ Clauses of an adapter not in the document, as the
+            InterfacesWriter writes it.
+        """
+        lines = []
+        InterfacesWriter([adapter], None)._render_adapter(adapter, lines)
+        clauses = _split_clauses(lines)
+        for clause in clauses:
+            flag = self._flag_of(clause.keyword)
+            if flag is not None:
+                listed[flag].add(adapter.attributes['name'])
+            elif clause.keyword == 'iface':
+                clause.adapter = adapter
+        return clauses
+
+    def _patch_stanza(self, clause):
+        """ Patch the lines of an iface clause with the changes made to
+            its adapter since the baseline.
+        """
+        old = clause.baseline.attributes
+        new = clause.adapter.attributes
+        lines = list(clause.lines)
+        body = lines[:clause.body_end]
+        trailing = lines[clause.body_end:]
+
+        if any(old.get(x) != new.get(x) for x in _HEADER_KEYS):
+            first = _OPTION_LINE.match(body[0])
+            body[0] = 'iface {0} {1} {2}{3}'.format(
+                new.get('name'), new.get('addrFam'), new.get('source'),
+                first.group(5) or '')
+
+        indent = '\t'
+        for line in body[1:]:
+            if not _is_trivia(line):
+                indent = _OPTION_LINE.match(line).group(1)
+                break
+
+        for key in sorted(set(old) | set(new)):
+            if key in _HEADER_KEYS or key in _FLAG_KEYWORDS:
+                continue
+            before, after = old.get(key), new.get(key)
+            if before == after:
+                continue
+            if key in _LIST_KEYS:
+                self._patch_list(body, indent, key, before or [], after or [])
+            elif key == 'bridge-opts':
+                self._patch_dict(body, indent, 'bridge_',
+                                 before or {}, after or {})
+            elif key == 'unknown':
+                self._patch_dict(body, indent, '', before or {}, after or {})
+            else:
+                self._patch_value(body, indent, key, after)
+
+        return _Clause(body + trailing, clause.adapter, clause.baseline)
+
+    @staticmethod
+    def _option_indexes(body, match):
+        """ Indexes of the option lines whose keyword matches """
+        indexes = []
+        for index, line in enumerate(body[1:], 1):
+            if not _is_trivia(line) and match(line.split()[0]):
+                indexes.append(index)
+        return indexes
+
+    @staticmethod
+    def _replace_value(line, value):
+        parts = _OPTION_LINE.match(line)
+        return '{0}{1}{2}{3}{4}'.format(
+            parts.group(1), parts.group(2), parts.group(3) or ' ',
+            value, parts.group(5) or '')
+
+    @staticmethod
+    def _insert_option(body, index, indent, keyword, value):
+        body.insert(index, '{0}{1} {2}\n'.format(indent, keyword, value))
+
+    def _patch_value(self, body, indent, keyword, value, match=None):
+        """ Replace, add or remove a single value option """
+        if match is None:
+            def match(word):
+                return word == keyword
+        indexes = self._option_indexes(body, match)
+        if not value or value == 'None':
+            for index in reversed(indexes):
+                del body[index]
+        elif indexes:
+            body[indexes[0]] = self._replace_value(
+                body[indexes[0]], value)
+        else:
+            end = max(self._option_indexes(body, bool) or [0]) + 1
+            self._insert_option(body, end, indent, keyword, value)
+
+    def _patch_dict(self, body, indent, prefix, before, after):
+        """ Patch the bridge options or the unknown options """
+        for key in sorted(set(before) | set(after)):
+            if before.get(key) == after.get(key):
+                continue
+            keywords = set([prefix + key])
+            if prefix:
+                keywords.add('bridge-' + key)
+            value = after.get(key)
+            self._patch_value(body, indent, prefix + key,
+                              str(value) if value else value,
+                              keywords.__contains__)
+
+    def _patch_list(self, body, indent, keyword, before, after):
+        """ Patch the lines of a list option with a minimal diff """
+        indexes = self._option_indexes(body, lambda x: x == keyword)
+        if len(indexes) != len(before):
+            # Lines and baseline disagree, rewrite every line
+            before = [self._value_of(body[x]) for x in indexes]
+        matcher = difflib.SequenceMatcher(None, before, after, False)
+        # From the end, so indexes of earlier lines stay valid
+        for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+            if tag == 'equal':
+                continue
+            common = min(i2 - i1, j2 - j1)
+            for offset in range(common):
+                index = indexes[i1 + offset]
+                body[index] = self._replace_value(
+                    body[index], after[j1 + offset])
+            for index in reversed(indexes[i1 + common:i2]):
+                del body[index]
+            if j1 + common < j2:
+                if i1 + common < len(indexes):
+                    position = indexes[i1 + common]
+                elif indexes:
+                    position = indexes[-1] + 1
+                else:
+                    position = max(
+                        self._option_indexes(body, bool) or [0]) + 1
+                for value in reversed(after[j1 + common:j2]):
+                    self._insert_option(body, position, indent,
+                                        keyword, value)
+
+    @staticmethod
+    def _value_of(line):
+        return _OPTION_LINE.match(line).group(4)
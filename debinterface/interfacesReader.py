@@ -1,143 +1,794 @@
 # -*- coding: utf-8 -*-
 # A class representing the contents of /etc/network/interfaces
 from __future__ import print_function, with_statement, absolute_import
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+from collections import namedtuple
+from concurrent import futures
+
 from .adapter import NetworkAdapter
+from . import toolutils
+
+
+# Number of threads parsing included files.
+INCLUDE_WORKERS = 4
+
+# Number of included files whose parse result is kept.
+FRAGMENT_CACHE_SIZE = 1024
+
+# Files parsed by one task of parse_many, at most.
+PARSE_MANY_CHUNKSIZE = 64
+
+# Values of the validate argument of InterfacesReader.
+VALIDATE_MODES = ('strict', 'lazy', 'none')
+
+# Files read by source-directory, as run-parts(8) does.
+_SOURCE_DIRECTORY_NAME = re.compile(r'^[a-zA-Z0-9_-]+$')
+
+# A source or source-directory clause, in the order it was met.
+_Include = namedtuple('_Include', ['keyword', 'pattern'])
+
+# Parse result of one included file, shared through _FRAGMENTS.
+_Fragment = namedtuple('_Fragment', [
+    'signature', 'directory', 'items', 'auto_names', 'hotplug_names',
+    'validated'])
+
+# realpath => _Fragment
+_FRAGMENTS = toolutils.LRUCache(FRAGMENT_CACHE_SIZE)
+
+# Start of each top level clause: first word at column 0.
+_CLAUSE_START = re.compile(br'^[^\s#]', re.M)
+
+# Outcome of parse_many for one file: adapters (or their attributes) and
+# None, or None and the exception raised while parsing.
+ParseResult = namedtuple('ParseResult', ['path', 'adapters', 'error'])
+
+# An iface stanza read by update_interfaces, span is [start, end[ in bytes.
+Stanza = namedtuple('Stanza', ['path', 'start', 'end', 'digest', 'adapter'])
+
+# Adapters changed by update_interfaces. Removed ones are the previous
+# objects, added and changed ones the new objects.
+AdapterChanges = namedtuple('AdapterChanges', ['added', 'removed', 'changed'])
+
+
+def _first_value(setter):
+    """Build an option handler passing the first value to setter."""
+    def handler(adapter, words):
+        setter(adapter, words[1] if len(words) > 1 else '')
+    return handler
+
+
+def _joined_values(appender):
+    """Build an option handler passing the whole command to appender."""
+    def handler(adapter, words):
+        appender(adapter, ' '.join(words[1:]))
+    return handler
+
+
+def _stored_value(key):
+    """Build an option handler storing the first value, not validated."""
+    def handler(adapter, words):
+        adapter.attributes[key] = words[1] if len(words) > 1 else ''
+    return handler
+
+
+def _stored_command(key):
+    """Build an option handler appending the whole command, not validated.
+    """
+    def handler(adapter, words):
+        adapter.attributes.setdefault(key, []).append(' '.join(words[1:]))
+    return handler
+
+
+def _bridge_option(adapter, words):
+    """bridge_ports eth0 eth1 => bridge-opts['ports'] = 'eth0 eth1'"""
+    adapter.replaceBropt(words[0][7:], ' '.join(words[1:]))
+
+
+def _unknown_option(adapter, words):
+    """Store as if so as not to loose it, with all its values"""
+    adapter.setUnknown(words[0], ' '.join(words[1:]))
+
+
+# Option keyword => handler(adapter, words), built once for all readers.
+_OPTION_HANDLERS = {
+    'address': _first_value(NetworkAdapter.setAddress),
+    'netmask': _first_value(NetworkAdapter.setNetmask),
+    'gateway': _first_value(NetworkAdapter.setGateway),
+    'broadcast': _first_value(NetworkAdapter.setBroadcast),
+    'network': _first_value(NetworkAdapter.setNetwork),
+    'hostapd': _first_value(NetworkAdapter.setHostapd),
+    'dns-nameservers': _first_value(NetworkAdapter.setDnsNameservers),
+    'up': _joined_values(NetworkAdapter.appendUp),
+    'down': _joined_values(NetworkAdapter.appendDown),
+    'pre-up': _joined_values(NetworkAdapter.appendPreUp),
+    'pre-down': _joined_values(NetworkAdapter.appendPreDown),
+    'post-down': _joined_values(NetworkAdapter.appendPostDown),
+}
+
+# Same options, stored as read: trusted files are validated by validateAll.
+_TRUSTED_HANDLERS = dict(
+    (keyword, _stored_value(keyword)) for keyword in (
+        'address', 'netmask', 'gateway', 'broadcast', 'network',
+        'hostapd', 'dns-nameservers'))
+_TRUSTED_HANDLERS.update(
+    (keyword, _stored_command(keyword)) for keyword in (
+        'up', 'down', 'pre-up', 'pre-down', 'post-down'))
+
+
+def _option_handler(keyword, handlers=_OPTION_HANDLERS):
+    """Return the handler for an option keyword.
+
+        Args:
+            keyword (str): the first word of an indented line
+            handlers (dict, optional): _OPTION_HANDLERS or
+                _TRUSTED_HANDLERS
+
+        Returns:
+            function: handler(adapter, words)
+    """
+    try:
+        return handlers[keyword]
+    except KeyError:
+        if keyword.startswith('bridge_') or keyword.startswith('bridge-'):
+            return _bridge_option
+        return _unknown_option
+
+
+def _include_pattern(include, directory):
+    """ Absolute path or glob of a source or source-directory clause.
+        Relative paths are relative to the directory of the file
+        holding the clause.
+    """
+    return os.path.join(directory, include.pattern)
+
+
+def _include_directory(include, directory):
+    """ Directory whose modification time changes when files are added
+        to or removed from the clause.
+    """
+    pattern = _include_pattern(include, directory)
+    if include.keyword == 'source':
+        return os.path.dirname(pattern)
+    return pattern
+
+
+def _expand_include(include, directory):
+    """ List the files of a source or source-directory clause.
+        Relative paths are relative to the directory of the file
+        holding the clause.
+
+        Args:
+            include (_Include): the clause
+            directory (str): directory of the file holding the clause
+
+        Returns:
+            list: sorted real paths of the existing files
+    """
+    pattern = _include_pattern(include, directory)
+    if include.keyword == 'source':
+        paths = sorted(glob.glob(pattern))
+    else:
+        try:
+            names = sorted(os.listdir(pattern))
+        except OSError:
+            return []
+        paths = [os.path.join(pattern, name) for name in names
+                 if _SOURCE_DIRECTORY_NAME.match(name)]
+    return [os.path.realpath(path) for path in paths if os.path.isfile(path)]
+
+
+def _decode(data):
+    """ Text of a bytes chunk, as str. """
+    if isinstance(data, str):
+        return data
+    return data.decode('utf-8')
+
+
+def _identities(adapters):
+    """ Map (name, addrFam, occurrence) => adapter, the occurrence tells
+        apart stanzas repeating the same name and family.
+    """
+    identities = {}
+    for adapter in adapters:
+        attributes = adapter.attributes
+        key = (attributes.get('name'), attributes.get('addrFam'))
+        occurrence = 0
+        while key + (occurrence,) in identities:
+            occurrence += 1
+        identities[key + (occurrence,)] = adapter
+    return identities
+
+
+def _load_fragment(path, trusted=False):
+    """ Parse an included file, or get it from the cache if the file
+        did not change since it was parsed.
+
+        Args:
+            path (str): real path of the file
+            trusted (bool, optional): options are not validated. A
+                validated fragment of the cache is used all the same
+
+        Returns:
+            _Fragment: the parse result, shared: do not modify it
+    """
+    signature = toolutils.file_signature(path)
+    cached = _FRAGMENTS.get(
+        path, valid=lambda fragment: fragment.signature == signature
+        and (fragment.validated or trusted))
+    if cached is not None:
+        return cached
+
+    auto_names, hotplug_names = set(), set()
+    with open(path, "r") as interfaces:
+        items = list(InterfacesReader._read_lines(
+            interfaces, auto_names, hotplug_names, trusted))
+    fragment = _Fragment(signature, os.path.dirname(path), items,
+                         auto_names, hotplug_names, not trusted)
+    _FRAGMENTS.put(path, fragment)
+    return fragment
+
+
+def included_sources(content, directory):
+    """ Signatures of the files included by the source and
+        source-directory clauses of an interfaces file, recursively,
+        and of the directories they are listed from.
+
+        Args:
+            content (bytes or str): the interfaces file content
+            directory (str): directory of the interfaces file
+
+        Returns:
+            dict: real path => signature, None for a missing directory
+    """
+    pending = []
+    for line in _decode(content).splitlines():
+        if not line.startswith('source'):
+            continue
+        words = line.split()
+        if words[0] in ('source', 'source-directory') and len(words) > 1:
+            pending.append((_Include(words[0], words[1]), directory))
+    sources = {}
+    while pending:
+        include, folder = pending.pop()
+        watched = _include_directory(include, folder)
+        if watched not in sources:
+            try:
+                sources[watched] = toolutils.file_signature(watched)
+            except OSError:
+                sources[watched] = None
+        for path in _expand_include(include, folder):
+            if path in sources:
+                continue
+            fragment = _load_fragment(path, trusted=True)
+            sources[path] = fragment.signature
+            pending.extend((x, fragment.directory) for x in fragment.items
+                           if isinstance(x, _Include))
+    return sources
+
+
+def _parse_chunk(paths, options, as_dicts):
+    """ Parse files one after the other, in a worker process.
+
+        Args:
+            paths (list): the files to parse
+            options (dict): InterfacesReader keyword arguments
+            as_dicts (bool): return the adapters attributes
+
+        Returns:
+            list: ParseResult, in the order of paths
+    """
+    results = []
+    for path in paths:
+        try:
+            adapters = InterfacesReader(path, **options).parse_interfaces()
+        except Exception as e:
+            results.append(ParseResult(path, None, e))
+            continue
+        if as_dicts:
+            adapters = [x.attributes.copy() for x in adapters]
+        results.append(ParseResult(path, adapters, None))
+    return results
+
+
+def parse_many(paths, max_workers=None, chunksize=None, as_dicts=False,
+               **options):
+    """ Parse many interfaces files in a process pool, eg files collected
+        from a fleet of devices. Files are sent to the workers by chunks,
+        to spare inter process round trips.
+        An error parsing one file does not stop the others.
+
+        Args:
+            paths (iterable): paths to interfaces files
+            max_workers (int, optional): worker processes, default to the
+                number of processors. With 1, files are parsed in the
+                calling process
+            chunksize (int, optional): files parsed per task, default to
+                spread paths evenly on 4 tasks per worker, at most
+                PARSE_MANY_CHUNKSIZE
+            as_dicts (bool, optional): return the attributes dict of each
+                adapter instead of NetworkAdapter. Default False
+            **options: InterfacesReader arguments, eg validate='lazy'
+
+        Returns:
+            list: ParseResult, in the order of paths
+
+        Raises:
+            ValueError: if an option is invalid
+    """
+    paths = list(paths)
+    # Fail here rather than once per file in the workers
+    InterfacesReader(None, **options)
+    if not paths:
+        return []
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    if max_workers == 1:
+        return _parse_chunk(paths, options, as_dicts)
+    if chunksize is None:
+        chunksize = len(paths) // (max_workers * 4) + 1
+        chunksize = min(chunksize, PARSE_MANY_CHUNKSIZE)
+    chunks = [paths[i:i + chunksize] for i in range(0, len(paths), chunksize)]
+
+    results = []
+    with futures.ProcessPoolExecutor(max_workers) as executor:
+        tasks = [executor.submit(_parse_chunk, chunk, options, as_dicts)
+                 for chunk in chunks]
+        for task in tasks:
+            results.extend(task.result())
+    return results
 
 
 class InterfacesReader(object):
     """ Short lived class to read interfaces file """
 
-    def __init__(self, interfaces_path):
+    def __init__(self, interfaces_path, includes=True, max_workers=None,
+                 validate='strict'):
+        """ Args:
+                interfaces_path (str): path to interfaces file
+                includes (bool, optional): follow source and
+                    source-directory clauses. Default True
+                max_workers (int, optional): threads parsing included
+                    files, default to INCLUDE_WORKERS
+                validate (str, optional): 'strict' validates each option
+                    as it is read. 'lazy' and 'none' store options as
+                    they are, for trusted files: they are validated by
+                    validateAll, when writing for 'lazy', and not at all
+                    for 'none' if the writer is told so. Default 'strict'
+
+            Raises:
+                ValueError: if validate is not one of VALIDATE_MODES
+        """
+        if validate not in VALIDATE_MODES:
+            raise ValueError("validate must be one of {0}, not {1!r}".format(
+                ", ".join(VALIDATE_MODES), validate))
         self._interfaces_path = interfaces_path
+        self._validate = validate
+        self._trusted = validate != 'strict'
+        self._includes = includes
+        self._max_workers = max_workers or INCLUDE_WORKERS
+        # The stanzas of the last update_interfaces, kept by _reset
+        self._stanzas = []
+        self._identities = {}
         self._reset()
 
     @property
     def adapters(self):
         return self._adapters
 
+    @property
+    def validate(self):
+        return self._validate
+
+    @property
+    def stanzas(self):
+        """ iface stanzas read by the last update_interfaces.
+
+            Returns:
+                list: Stanza, in file order
+        """
+        return self._stanzas
+
+    @property
+    def sources(self):
+        """ Files and include directories read by parse_interfaces.
+
+            Returns:
+                dict: path => toolutils.file_signature taken before
+                    reading, None for a missing include directory
+        """
+        return self._sources
+
+    @property
+    def deferred_flags(self):
+        """ auto and allow-hotplug names met after a stanza of that name
+            was already yielded by iter_adapters.
+
+            Returns:
+                dict: {'auto': set of names, 'hotplug': set of names}
+        """
+        return {
+            'auto': self._auto_names & self._yielded_without_auto,
+            'hotplug': self._hotplug_names & self._yielded_without_hotplug
+        }
+
     def parse_interfaces(self):
         """ Read /etc/network/interfaces (or specified file).
             Save adapters
             Return an array of networkAdapter instances.
+            Included files are parsed in a thread pool, and cached
+            until they change.
         """
         self._reset()
-        self._read_lines()
+        path = os.path.realpath(self._interfaces_path)
+        signature = toolutils.file_signature(path)
+        # Open up the interfaces file. Read only.
+        with open(path, "r") as interfaces:
+            items = list(self._read_lines(
+                interfaces, self._auto_names, self._hotplug_names,
+                self._trusted))
+        root = _Fragment(signature, os.path.dirname(path), items,
+                         self._auto_names, self._hotplug_names,
+                         not self._trusted)
 
-        for entry in self._auto_list:
-            for adapter in self._adapters:
-                if adapter.attributes['name'] == entry:
-                    adapter.setAuto(True)
+        if self._includes and any(isinstance(x, _Include) for x in items):
+            fragments = self._load_includes(path, root)
+            for fragment_path, fragment in fragments.items():
+                self._sources[fragment_path] = fragment.signature
+                self._auto_names.update(fragment.auto_names)
+                self._hotplug_names.update(fragment.hotplug_names)
+            adapters = list(self._flatten(root, fragments, set([path])))
+        else:
+            adapters = [x for x in items if not isinstance(x, _Include)]
 
-        for entry in self._hotplug_list:
-            for adapter in self._adapters:
-                if adapter.attributes['name'] == entry:
-                    adapter.setHotplug(True)
+        for adapter in adapters:
+            name = adapter.attributes['name']
+            if name in self._auto_names:
+                adapter.setAuto(True)
+            if name in self._hotplug_names:
+                adapter.setHotplug(True)
+        self._adapters = adapters
+        self._sources[path] = signature
 
         return self._adapters
 
-    def _read_lines(self):
-        # Open up the interfaces file. Read only.
-        with open(self._interfaces_path, "r") as interfaces:
-            # Loop through the interfaces file.
-            for line in interfaces:
-                # 1. Identify the clauses by analyzing the first
-                # word of each line.
-                # 2. Go to the next line if the current line is a comment.
-                # line = line.strip().replace("\n", "")
-                if not line or line.strip().startswith("#") is True:
-                    pass
-                else:
-                    self._parse_iface(line)
-                    # Ignore blank lines.
-                    if line.isspace() is True:
-                        pass
-                    else:
-                        self._parse_details(line)
-                    self._read_auto(line)
-                    self._read_hotplug(line)
-
-    def _parse_iface(self, line):
-        if line.startswith('iface'):
-            sline = line.split()
-            # Update the self._context when an iface clause is encountered.
-            self._context += 1
-            self._adapters.append(NetworkAdapter(sline[1].strip()))
-            self._adapters[self._context].setAddressSource(sline[-1].strip())
-            self._adapters[self._context].setAddrFam(sline[2].strip())
-
-    def _parse_details(self, line):
-        if line[0].isspace() is True:
-            sline = [x.strip() for x in line.split()]
-
-            if sline[0] == 'address':
-                self._adapters[self._context].setAddress(sline[1])
-            elif sline[0] == 'netmask':
-                self._adapters[self._context].setNetmask(sline[1])
-            elif sline[0] == 'gateway':
-                self._adapters[self._context].setGateway(sline[1])
-            elif sline[0] == 'broadcast':
-                self._adapters[self._context].setBroadcast(sline[1])
-            elif sline[0] == 'network':
-                self._adapters[self._context].setNetwork(sline[1])
-            elif sline[0] == 'hostapd':
-                self._adapters[self._context].setHostapd(sline[1])
-            elif sline[0] == 'dns-nameservers':
-                self._adapters[self._context].setDnsNameservers(sline[1])
-            elif sline[0].startswith('bridge') is True:
-                opt = sline[0].split('_')
-                sline.pop(0)
-                ifs = " ".join(sline)
-                self._adapters[self._context].replaceBropt(opt[1], ifs)
-            elif (sline[0] == 'up'
-                  or sline[0] == 'down'
-                  or sline[0] == 'pre-up'
-                  or sline[0] == 'pre-down'
-                  or sline[0] == 'post-down'):
-                ud = sline.pop(0)
-                cmd = ' '.join(sline)
-                if ud == 'up':
-                    self._adapters[self._context].appendUp(cmd)
-                elif ud == 'down':
-                    self._adapters[self._context].appendDown(cmd)
-                elif ud == 'pre-up':
-                    self._adapters[self._context].appendPreUp(cmd)
-                elif ud == 'pre-down':
-                    self._adapters[self._context].appendPreDown(cmd)
-                elif ud == 'post-down':
-                    self._adapters[self._context].appendPostDown(cmd)
+    def iter_adapters(self):
+        """ Read the interfaces file and yield each NetworkAdapter as
+            soon as its stanza is closed, without keeping it.
+            Included files are read in place, one after the other.
+            Flags of auto and allow-hotplug lines met so far are set
+            before yielding. Lines naming an already yielded stanza
+            are reported by deferred_flags once the generator is
+            exhausted, see apply_deferred_flags.
+
+            Yields:
+                NetworkAdapter: the adapters, in file order
+        """
+        self._reset()
+        path = os.path.realpath(self._interfaces_path)
+        for adapter in self._iter_file(path, set([path])):
+            name = adapter.attributes['name']
+            if name in self._auto_names:
+                adapter.setAuto(True)
+            else:
+                self._yielded_without_auto.add(name)
+            if name in self._hotplug_names:
+                adapter.setHotplug(True)
             else:
-                # store as if so as not to loose it
-                self._adapters[self._context].setUnknown(sline[0], sline[1])
-
-    def _read_auto(self, line):
-        """ Identify which adapters are flagged auto. """
-        if line.startswith('auto'):
-            sline = [x.strip() for x in line.split()]
-            for word in sline:
-                if word == 'auto':
-                    pass
+                self._yielded_without_hotplug.add(name)
+            yield adapter
+
+    def apply_deferred_flags(self, adapters):
+        """ Set the deferred auto and allow-hotplug flags on adapters
+            yielded by iter_adapters.
+
+            Args:
+                adapters (iterable): NetworkAdapter kept by the caller
+        """
+        deferred = self.deferred_flags
+        if not deferred['auto'] and not deferred['hotplug']:
+            return
+        for adapter in adapters:
+            name = adapter.attributes['name']
+            if name in deferred['auto']:
+                adapter.setAuto(True)
+            if name in deferred['hotplug']:
+                adapter.setHotplug(True)
+
+    def update_interfaces(self):
+        """ Read the interfaces file again, parsing only the iface
+            stanzas whose content changed since the last call.
+            Adapters of unchanged stanzas are the same objects as
+            before: changes made to them and not written are kept.
+            The first call parses every stanza.
+
+            Returns:
+                AdapterChanges: adapters added, removed and changed
+                    (content or auto/allow-hotplug flags), by name,
+                    family and position among the stanzas sharing them
+        """
+        previous = {}
+        for stanza in self._stanzas:
+            previous.setdefault(stanza.digest, []).append(stanza.adapter)
+        before = self._identities
+
+        self._reset()
+        stanzas = []
+        path = os.path.realpath(self._interfaces_path)
+        self._update_file(path, set([path]), previous, stanzas)
+        self._stanzas = stanzas
+        self._adapters = [stanza.adapter for stanza in stanzas]
+
+        flags_changed = set()
+        for adapter in self._adapters:
+            attributes = adapter.attributes
+            # Flags are not part of the stanza, set them again
+            name = attributes['name']
+            if (name in self._auto_names) != (attributes.get('auto') is True):
+                flags_changed.add(id(adapter))
+                if name in self._auto_names:
+                    adapter.setAuto(True)
                 else:
-                    self._auto_list.append(word)
-
-    def _read_hotplug(self, line):
-        """ Identify which adapters are flagged allow-hotplug. """
-        if line.startswith('allow-hotplug'):
-            sline = [x.strip() for x in line.split()]
-            for word in sline:
-                if word == 'allow-hotplug':
-                    pass
+                    del attributes['auto']
+            if ((name in self._hotplug_names)
+                    != (attributes.get('hotplug') is True)):
+                flags_changed.add(id(adapter))
+                if name in self._hotplug_names:
+                    adapter.setHotplug(True)
+                else:
+                    del attributes['hotplug']
+
+        after = _identities(self._adapters)
+        added, removed, changed = [], [], []
+        for key, adapter in after.items():
+            old = before.get(key)
+            if old is None:
+                added.append(adapter)
+            elif old is not adapter or id(adapter) in flags_changed:
+                changed.append(adapter)
+        for key, adapter in before.items():
+            if key not in after:
+                removed.append(adapter)
+        self._identities = after
+        return AdapterChanges(added, removed, changed)
+
+    def _update_file(self, path, chain, previous, stanzas):
+        """ Cut a file in top level clauses, parse the changed iface
+            stanzas and the other clauses, follow includes in place.
+
+            Args:
+                path (str): real path of the file
+                chain (set): real paths of the including files, to
+                    break include loops
+                previous (dict): digest => adapters of the last update,
+                    reused adapters are popped
+                stanzas (list): receives the Stanza of the file
+        """
+        self._sources[path] = toolutils.file_signature(path)
+        with open(path, "rb") as interfaces:
+            data = interfaces.read()
+        directory = os.path.dirname(path)
+        starts = [m.start() for m in _CLAUSE_START.finditer(data)]
+        for start, end in zip(starts, starts[1:] + [len(data)]):
+            chunk = data[start:end]
+            if chunk.startswith(b'iface') and chunk[5:6].isspace():
+                # Blank and comment lines after the stanza are not in it
+                chunk = chunk.rstrip()
+                cut = chunk.rfind(b'\n')
+                while cut > 0 and chunk[cut + 1:].lstrip().startswith(b'#'):
+                    chunk = chunk[:cut].rstrip()
+                    cut = chunk.rfind(b'\n')
+                end = start + len(chunk)
+                digest = hashlib.sha1(chunk).digest()
+                reusable = previous.get(digest)
+                if reusable:
+                    adapter = reusable.pop(0)
                 else:
-                    self._hotplug_list.append(word)
+                    adapter = next(self._read_lines(
+                        _decode(chunk).splitlines(),
+                        self._auto_names, self._hotplug_names,
+                        self._trusted))
+                stanzas.append(Stanza(path, start, end, digest, adapter))
+                continue
+            if chunk.startswith(b'auto') or chunk.startswith(b'allow-'):
+                # The clause is on one line, comments may follow
+                words = _decode(chunk.split(b'\n', 1)[0]).split()
+                if words[0] == 'auto':
+                    self._auto_names.update(words[1:])
+                    continue
+                if words[0] == 'allow-hotplug':
+                    self._hotplug_names.update(words[1:])
+                    continue
+            for item in self._read_lines(_decode(chunk).splitlines(),
+                                         self._auto_names,
+                                         self._hotplug_names,
+                                         self._trusted):
+                if not isinstance(item, _Include) or not self._includes:
+                    continue
+                self._watch_directory(_include_directory(item, directory))
+                for included in _expand_include(item, directory):
+                    if included not in chain:
+                        self._update_file(included, chain | set([included]),
+                                          previous, stanzas)
+
+    def _iter_file(self, path, chain):
+        """ Yield the adapters of a file and of the files it includes.
+
+            Args:
+                path (str): the file to read
+                chain (set): real paths of the including files, to
+                    break include loops
+        """
+        # Open up the interfaces file. Read only.
+        with open(path, "r") as interfaces:
+            directory = os.path.dirname(path)
+            for item in self._read_lines(
+                    interfaces, self._auto_names, self._hotplug_names,
+                    self._trusted):
+                if not isinstance(item, _Include):
+                    yield item
+                elif self._includes:
+                    for included in _expand_include(item, directory):
+                        if included in chain:
+                            continue
+                        for adapter in self._iter_file(
+                                included, chain | set([included])):
+                            yield adapter
+
+    def _load_includes(self, path, root):
+        """ Load every file included from root, recursively, in a
+            thread pool. Each file is loaded once.
+
+            Args:
+                path (str): real path of the interfaces file
+                root (_Fragment): the parsed interfaces file
+
+            Returns:
+                dict: real path => _Fragment, root included
+        """
+        fragments = {path: root}
+        running = {}
+        with futures.ThreadPoolExecutor(self._max_workers) as executor:
+            def submit(fragment):
+                for item in fragment.items:
+                    if not isinstance(item, _Include):
+                        continue
+                    self._watch_directory(
+                        _include_directory(item, fragment.directory))
+                    for path in _expand_include(item, fragment.directory):
+                        if (path not in fragments
+                                and path not in running.values()):
+                            future = executor.submit(
+                                _load_fragment, path, self._trusted)
+                            running[future] = path
+
+            submit(root)
+            while running:
+                done, _ = futures.wait(
+                    list(running), return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    fragments[path] = future.result()
+                    submit(fragments[path])
+        return fragments
+
+    def _watch_directory(self, directory):
+        """ Add the signature of an include directory to sources. """
+        if directory in self._sources:
+            return
+        try:
+            self._sources[directory] = toolutils.file_signature(directory)
+        except OSError:
+            self._sources[directory] = None
+
+    def _flatten(self, fragment, fragments, chain, shared=False):
+        """ Yield the adapters of fragment, included ones in place.
+
+            Args:
+                fragment (_Fragment): the fragment to flatten
+                fragments (dict): real path => _Fragment
+                chain (set): real paths of the including files, to
+                    break include loops
+                shared (bool, optional): fragment comes from the cache,
+                    yield copies of its adapters
+        """
+        for item in fragment.items:
+            if not isinstance(item, _Include):
+                yield item.copy() if shared else item
+                continue
+            for path in _expand_include(item, fragment.directory):
+                if path in chain or path not in fragments:
+                    continue
+                for adapter in self._flatten(fragments[path], fragments,
+                                             chain | set([path]), True):
+                    yield adapter
+
+    @staticmethod
+    def _read_lines(lines, auto_names, hotplug_names, trusted=False):
+        """ Single pass over the file: each line is split once, then
+            classified by its first word and indentation.
+            A stanza is closed by the next iface, mapping or source
+            clause, or by the end of the file.
+
+            Args:
+                lines (iterable): the lines of an interfaces file
+                auto_names (set): receives names of auto lines
+                hotplug_names (set): receives names of allow-hotplug lines
+                trusted (bool, optional): store options without
+                    validating them
+
+            Yields:
+                NetworkAdapter or _Include: the adapter of each closed
+                    stanza, and the include clauses
+        """
+        handlers = _TRUSTED_HANDLERS if trusted else _OPTION_HANDLERS
+        adapter = None
+        for line in lines:
+            words = line.split()
+            # Ignore blank lines and comments.
+            if not words or words[0][0] == '#':
+                continue
+            keyword = words[0]
+            if line[0].isspace():
+                # Option of the current stanza, if any.
+                if adapter is not None:
+                    _option_handler(keyword, handlers)(adapter, words)
+            elif keyword == 'iface':
+                if adapter is not None:
+                    yield adapter
+                adapter = InterfacesReader._parse_iface(words, trusted)
+            elif keyword == 'auto':
+                auto_names.update(words[1:])
+            elif keyword == 'allow-hotplug':
+                hotplug_names.update(words[1:])
+            elif keyword in ('mapping', 'source', 'source-directory'):
+                # Mapping options (script, map) do not belong to an iface.
+                if adapter is not None:
+                    yield adapter
+                adapter = None
+                if keyword != 'mapping' and len(words) > 1:
+                    yield _Include(keyword, words[1])
+        if adapter is not None:
+            yield adapter
+
+    @staticmethod
+    def _parse_iface(words, trusted=False):
+        """ Create the adapter of an iface clause.
+
+            Args:
+                words (list): iface <name> <addrFam> <source>
+                trusted (bool, optional): store the values without
+                    validating them
+
+            Returns:
+                NetworkAdapter: the new adapter
+        """
+        if trusted:
+            adapter = NetworkAdapter({})
+            attributes = adapter.attributes
+            attributes['name'] = words[1]
+            attributes['source'] = words[-1]
+            attributes['addrFam'] = words[2]
+            return adapter
+        adapter = NetworkAdapter(words[1])
+        adapter.setAddressSource(words[-1])
+        adapter.setAddrFam(words[2])
+        return adapter
 
     def _reset(self):
         # Initialize a place to store created networkAdapter objects.
         self._adapters = []
+        self._sources = {}
 
-        # Keep a list of adapters that have the auto or
+        # Keep the names of adapters that have the auto or
         # allow-hotplug flags set.
-        self._auto_list = []
-        self._hotplug_list = []
+        self._auto_names = set()
+        self._hotplug_names = set()
 
-        # Store the interface context.
-        # This is the index of the adapters collection.
-        self._context = -1
+        # Names already yielded without the flag, the only state kept
+        # about past stanzas.
+        self._yielded_without_auto = set()
+        self._yielded_without_hotplug = set()
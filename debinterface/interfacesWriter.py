@@ -1,35 +1,88 @@
 # -*- coding: utf-8 -*-
 # Write interface
 from __future__ import print_function, with_statement, absolute_import
+import hashlib
 import shutil
 import os
-from string import Template
 
-from . import toolutils
+from . import ifupdown, toolutils
+from .interfacesChecker import check_structure
+from .interfacesReader import included_sources
+
+
+# expected_signature default: write whatever the current file is.
+_ANY_SIGNATURE = object()
+
+# How written files are checked: 'ifup' runs ifup --no-act on the file,
+# 'python' checks the adapters structure in process before writing,
+# 'both' runs the in process check first then ifup.
+CHECK_MODES = ('ifup', 'python', 'both')
+
+# Adapter names per ifup --no-act process, for files out of the default
+# place
+CHECK_BATCH_SIZE = 128
+# Files which passed the ifup check, by (path, sha1 of the content,
+# signatures of the files it includes). Set maxsize to 0 to check every
+# write.
+CHECK_CACHE = toolutils.LRUCache(maxsize=32)
+
+
+class InterfacesChangedError(ValueError):
+    """ The interfaces file changed since it was read, it was not
+        written. Read it again and retry. """
 
 
 class InterfacesWriter(object):
     """ Short lived class to write interfaces file """
 
-    # Define templetes for blocks used in /etc/network/interfaces.
-    _auto = Template('auto $name\n')
-    _hotplug = Template('allow-hotplug $name\n')
-    _iface = Template('iface $name $addrFam $source\n')
-    _cmd = Template('\t$varient $value\n')
+    # Line formats of /etc/network/interfaces, bound once.
+    _auto = 'auto {0}\n'.format
+    _hotplug = 'allow-hotplug {0}\n'.format
+    _iface = 'iface {0} {1} {2}\n'.format
+    _option = '\t{0} {1}\n'.format
 
-    _addressFields = [
+    _ifaceFields = ('name', 'addrFam', 'source')
+    _addressFields = (
         'address', 'network', 'netmask', 'broadcast',
         'gateway', 'dns-nameservers'
-    ]
-    _prepFields = ['pre-up', 'up', 'down', 'pre-down', 'post-down']
-    _bridgeFields = ['ports', 'fd', 'hello', 'maxage', 'stp']
-    _plugins = ["hostapd"]
-
-    def __init__(self, adapters, interfaces_path, backup_path=None):
-        """ if backup_path is None => no backup """
+    )
+    _prepFields = ('pre-up', 'up', 'down', 'pre-down', 'post-down')
+    # bridge-opts key => option keyword
+    _bridgeFields = tuple(
+        (x, 'bridge_' + x) for x in ('ports', 'fd', 'hello', 'maxage', 'stp'))
+    _plugins = ('hostapd', )
+
+    def __init__(self, adapters, interfaces_path, backup_path=None,
+                 document=None, validate=True, lock_path=None,
+                 expected_signature=_ANY_SIGNATURE,
+                 check_workers=ifupdown.MAX_WORKERS, check='ifup'):
+        """ if backup_path is None => no backup
+            if document is an InterfacesDocument, only the changed lines
+            of the file are rewritten
+            if validate is False, adapters are written without validateAll,
+            for adapters read from a trusted file with validate='none'
+            if lock_path is set, the backup, write and check run while
+            holding an exclusive toolutils.file_lock on it
+            if expected_signature is set, the file is only written if its
+            toolutils.file_signature is still this one (None: the file
+            must not exist), else InterfacesChangedError is raised
+            check_workers is the number of ifup --no-act processes run at
+            the same time to check a file out of the default place
+            check is one of CHECK_MODES, else ValueError is raised
+        """
+        if check not in CHECK_MODES:
+            raise ValueError("check must be one of {0}, not {1!r}".format(
+                ", ".join(CHECK_MODES), check))
         self._adapters = adapters
+        self._validate = validate
         self._interfaces_path = interfaces_path
         self._backup_path = backup_path
+        self._document = document
+        self._lock_path = lock_path
+        self._expected_signature = expected_signature
+        self._check_workers = check_workers
+        self._check = check
+        self._signature = None
 
     @property
     def adapters(self):
@@ -39,167 +92,231 @@ class InterfacesWriter(object):
     def adapters(self, value):
         self._adapters = value
 
+    @property
+    def signature(self):
+        """ toolutils.file_signature of the written file, taken before
+            the lock is released. None until write_interfaces succeeds.
+        """
+        return self._signature
+
     def write_interfaces(self):
-        # Back up the old interfaces file.
-        self._backup_interfaces()
+        """ Write the adapters, check the file and restore the backup on
+            failure. The file is rendered in memory first: if it already
+            has this content, it is left as is, without backup, write or
+            check.
+
+            Returns:
+                bool: True if the file was written, False if unchanged
+
+            Raises:
+                InterfacesChangedError: if expected_signature is set and
+                    the file changed
+                ValueError: if an adapter is invalid or the check fails
+        """
+        if self._lock_path is None:
+            return self._write_interfaces()
+        with toolutils.file_lock(self._lock_path):
+            return self._write_interfaces()
+
+    def _write_interfaces(self):
+        self._check_signature()
+        if self._check != 'ifup':
+            check_structure(self._adapters)
+
+        content = self._render()
+        if self._unchanged(content):
+            written = False
+        else:
+            # Back up the old interfaces file.
+            self._backup_interfaces()
+
+            try:
+                with toolutils.atomic_write(self._interfaces_path,
+                                            'w+b') as interfaces:
+                    interfaces.write(content)
+                if self._check != 'python':
+                    self._check_interfaces(self._interfaces_path, content)
+            except Exception:
+                # Any error, let's roll back
+                self._restore_interfaces()
+                raise
+            written = True
+        if self._document is not None:
+            self._document.commit()
+        self._signature = toolutils.file_signature(self._interfaces_path)
+        return written
+
+    def _render(self):
+        """ The content of the file, validating the adapters
+
+            Returns:
+                bytes: the file content, UTF-8 encoded
+        """
+        if self._document is not None:
+            for adapter in self._adapters:
+                if self._validate:
+                    adapter.validateAll()
+            content = self._document.render(self._adapters)
+        else:
+            lines = []
+            for adapter in self._adapters:
+                self._render_adapter(adapter, lines)
+            content = ''.join(lines)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        return content
+
+    def _unchanged(self, content):
+        """ Tell if the file has this content: sizes are compared before
+            reading it.
+
+            Args:
+                content (bytes): the rendered file
+
+            Returns:
+                bool: False if the file differs or can not be read
+        """
+        try:
+            if os.path.getsize(self._interfaces_path) != len(content):
+                return False
+            with open(self._interfaces_path, 'rb') as interfaces:
+                return interfaces.read() == content
+        except (IOError, OSError):
+            return False
 
+    def _check_signature(self):
+        """ Compare the file with the expected signature, if any
+
+            Raises:
+                InterfacesChangedError: if the file changed
+        """
+        if self._expected_signature is _ANY_SIGNATURE:
+            return
         try:
-            # Prepare to write the new interfaces file.
-            with toolutils.atomic_write(self._interfaces_path) as interfaces:
-                # Loop through the provided networkAdaprers and
-                # write the new file.
-                for adapter in self._adapters:
-                    # Get dict of details about the adapter.
-                    self._write_adapter(interfaces, adapter)
-            self._check_interfaces(self._interfaces_path)
-        except Exception:
-            # Any error, let's roll back
-            self._restore_interfaces()
-            raise
-
-    def _check_interfaces(self, interfaces_path):
+            signature = toolutils.file_signature(self._interfaces_path)
+        except OSError:
+            signature = None
+        if signature != self._expected_signature:
+            raise InterfacesChangedError(
+                "{0} changed since it was read".format(
+                    self._interfaces_path))
+
+    def _check_interfaces(self, interfaces_path, content=None):
         """Uses ifup to check interfaces file. If it is not in the
-            default place, each interface must be checked one by one.
+            default place, the adapters are checked by batches of
+            CHECK_BATCH_SIZE names, in parallel. The names of a failed
+            batch are checked one by one to find the invalid adapters.
+            A content which passed is not checked again, see CHECK_CACHE.
 
             Args:
                 interfaces_path (string) : the path to interfaces file
+                content (bytes, optional) : the written content, with the
+                    files it includes the key of CHECK_CACHE. Default
+                    None, no cache
 
             Raises:
                 ValueError : if invalid network interfaces
         """
-        ret = False
-        output = ""
         if not self._adapters:
             return
+        key = None
+        if content is not None:
+            sources = included_sources(
+                content, os.path.dirname(os.path.realpath(interfaces_path)))
+            key = (interfaces_path, hashlib.sha1(content).hexdigest(),
+                   tuple(sorted(sources.items())))
+            if CHECK_CACHE.get(key):
+                return
 
         if interfaces_path == "/etc/network/interfaces":
             ret, output = toolutils.safe_subprocess([
-                "/sbin/ifup", "-a", "--no-act"
+                ifupdown.IFUP, "-a", "--no-act"
             ])
         else:
-            for adapter in self._adapters:
-                ret, output = toolutils.safe_subprocess([
-                    "/sbin/ifup", "--no-act",
-                    "--interfaces={0}".format(interfaces_path),
-                    adapter.attributes["name"]
-                ])
-                if not ret:
-                    break
+            results = ifupdown.run_many(
+                [ifupdown.IFUP, "--no-act",
+                 "--interfaces={0}".format(interfaces_path)],
+                (x.attributes["name"] for x in self._adapters),
+                batch_size=CHECK_BATCH_SIZE,
+                max_workers=self._check_workers)
+            failed = [x for x in results if not x.success]
+            ret = not failed
+            output = "\n".join("{0}: {1}".format(x.name, x.output)
+                               for x in failed)
         if not ret:
             raise ValueError("Invalid network interfaces file "
                              "written to disk, restoring to previous "
                              "one : {0}".format(output))
+        if key is not None:
+            CHECK_CACHE.put(key, True)
 
-    def _write_adapter(self, interfaces, adapter):
-        try:
-            adapter.validateAll()
-        except ValueError as e:
-            print(repr(e))
-            raise
-
-        ifAttributes = adapter.export()
-
-        self._write_auto(interfaces, adapter, ifAttributes)
-        self._write_hotplug(interfaces, adapter, ifAttributes)
-        self._write_addrFam(interfaces, adapter, ifAttributes)
-        self._write_addressing(interfaces, adapter, ifAttributes)
-        self._write_bridge(interfaces, adapter, ifAttributes)
-        self._write_plugins(interfaces, adapter, ifAttributes)
-        self._write_callbacks(interfaces, adapter, ifAttributes)
-        self._write_unknown(interfaces, adapter, ifAttributes)
-        interfaces.write("\n")
-
-    def _write_auto(self, interfaces, adapter, ifAttributes):
-        """ Write if applicable """
-        try:
-            if adapter.attributes['auto'] is True:
-                d = dict(name=ifAttributes['name'])
-                interfaces.write(self._auto.substitute(d))
-        except KeyError:
-            pass
-
-    def _write_hotplug(self, interfaces, adapter, ifAttributes):
-        """ Write if applicable """
-        try:
-            if ifAttributes['hotplug'] is True:
-                d = dict(name=ifAttributes['name'])
-                interfaces.write(self._hotplug.substitute(d))
-        except KeyError:
-            pass
-
-    def _write_addrFam(self, interfaces, adapter, ifAttributes):
-        """ Construct and write the iface declaration.
-            The addrFam clause needs a little more processing.
+    def _render_adapter(self, adapter, lines):
+        """ Append the lines of an adapter, auto and allow-hotplug
+            lines included, to lines.
+
+            Args:
+                adapter (NetworkAdapter): the adapter
+                lines (list): the rendered lines
+
+            Raises:
+                ValueError: if the adapter is invalid
         """
-        # Write the source clause.
+        if self._validate:
+            try:
+                adapter.validateAll()
+            except ValueError as e:
+                print(repr(e))
+                raise
+
+        # Stored options only, the missing containers render nothing
+        attributes = dict(dict.items(adapter.attributes))
+        append = lines.append
+        option = self._option
+        name = attributes.get('name')
+
+        if name is not None:
+            if attributes.get('auto') is True:
+                append(self._auto(name))
+            if attributes.get('hotplug') is True:
+                append(self._hotplug(name))
+
+        # The iface line is left out if a field is missing.
         # Will not error if omitted. Maybe not the best plan.
-        try:
-            if (not ifAttributes["name"]
-                    or not ifAttributes["addrFam"]
-                    or not ifAttributes["source"]):
+        for field in self._ifaceFields:
+            if field not in attributes:
+                break
+            if not attributes[field]:
                 raise ValueError("Invalid field content")
-            d = dict(name=ifAttributes['name'],
-                     addrFam=ifAttributes['addrFam'],
-                     source=ifAttributes['source'])
-            interfaces.write(self._iface.substitute(d))
-        except KeyError:
-            pass
-
-    def _write_addressing(self, interfaces, adapter, ifAttributes):
+        else:
+            append(self._iface(name, attributes['addrFam'],
+                               attributes['source']))
+
         for field in self._addressFields:
-            try:
-                value = ifAttributes[field]
+            value = attributes.get(field)
+            if value and value != 'None':
+                append(option(field, value))
+
+        bridge_opts = attributes.get('bridge-opts')
+        if bridge_opts:
+            for field, key in self._bridgeFields:
+                value = bridge_opts.get(field)
                 if value and value != 'None':
-                    d = dict(varient=field, value=ifAttributes[field])
-                    interfaces.write(self._cmd.substitute(d))
-            # Keep going if a field isn't provided.
-            except KeyError:
-                pass
-
-    def _write_bridge(self, interfaces, adapter, ifAttributes):
-        """ Write the bridge information. """
-        for field in self._bridgeFields:
-            try:
-                value = ifAttributes['bridge-opts'][field]
-                if value and value != 'None':
-                    d = dict(varient="bridge_" + field, value=value)
-                    interfaces.write(self._cmd.substitute(d))
-            # Keep going if a field isn't provided.
-            except KeyError:
-                pass
-
-    def _write_callbacks(self, interfaces, adapter, ifAttributes):
-        """ Write the up, down, pre-up, and post-down clauses. """
-        for field in self._prepFields:
-            try:
-                for item in ifAttributes[field]:
-                    if item and item != 'None':
-                        d = dict(varient=field, value=item)
-                        interfaces.write(self._cmd.substitute(d))
-            except KeyError:
-                # Keep going if a field isn't provided.
-                pass
-
-    def _write_plugins(self, interfaces, adapter, ifAttributes):
-        """ Write plugins options, currently hostapd. """
+                    append(option(key, value))
+
         for field in self._plugins:
-            try:
-                if field in ifAttributes and ifAttributes[field] != 'None':
-                    d = dict(varient=field, value=ifAttributes[field])
-                    interfaces.write(self._cmd.substitute(d))
-            # Keep going if a field isn't provided.
-            except KeyError:
-                pass
-
-    def _write_unknown(self, interfaces, adapter, ifAttributes):
-        """ Write unknowns options """
-        try:
-            for k, v in ifAttributes['unknown'].items():
-                if v:
-                    d = dict(varient=k, value=str(v))
-                    interfaces.write(self._cmd.substitute(d))
-        except (KeyError, ValueError):
-            pass
+            if field in attributes and attributes[field] != 'None':
+                append(option(field, attributes[field]))
+
+        for field in self._prepFields:
+            for item in attributes.get(field) or ():
+                if item and item != 'None':
+                    append(option(field, item))
+
+        for key, value in (attributes.get('unknown') or {}).items():
+            if value:
+                append(option(key, value))
+
+        append('\n')
 
     def _backup_interfaces(self):
         """Backup interfaces file is the file exists
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Binary snapshots of parsed adapters, saved next to the interfaces file.
+Loading a snapshot skips the text parse and the setters validation, it is
+used only while the files it was built from keep their inode, mtime and
+size.
+
+Layout: SNAPSHOT_MAGIC, the format version as a big endian unsigned
+short, then a marshal payload:
+(python version, validated, sources, list of attributes dict).
+"""
+from __future__ import print_function, with_statement, absolute_import
+import marshal
+import struct
+import sys
+
+from .adapter import NetworkAdapter
+from . import toolutils
+
+
+SNAPSHOT_MAGIC = b'DEBIFSNP'
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct('>8sH')
+# marshal data is only readable by the same python version
+_PYTHON = tuple(sys.version_info[:2])
+
+
+def save_snapshot(snapshot_path, sources, adapters, validated=True):
+    """ Write a snapshot of adapters.
+
+        Args:
+            snapshot_path (str): the snapshot file
+            sources (dict): path => toolutils.file_signature of the
+                files the adapters were read from
+            adapters (list): NetworkAdapter
+            validated (bool, optional): adapters options were validated
+
+        Raises:
+            ValueError: if an option value cannot be marshalled
+            IOError: if the snapshot cannot be written
+    """
+    payload = marshal.dumps((_PYTHON, validated, sources,
+                             [x.attributes.stored() for x in adapters]))
+    with toolutils.atomic_write(snapshot_path, mode='w+b') as snapshot:
+        snapshot.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+        snapshot.write(payload)
+
+
+def load_snapshot(snapshot_path, validated=True):
+    """ Read the adapters of a snapshot, if it is still valid.
+
+        Args:
+            snapshot_path (str): the snapshot file
+            validated (bool, optional): only accept a snapshot of
+                validated adapters. Default True
+
+        Returns:
+            tuple: (sources, list of NetworkAdapter), or None if the
+                snapshot is missing, unreadable, of another format or
+                python version, or if one of its sources changed
+    """
+    try:
+        with open(snapshot_path, "rb") as snapshot:
+            data = snapshot.read()
+        magic, version = _HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        python, was_validated, sources, attributes = marshal.loads(
+            data[_HEADER.size:])
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            struct.error):
+        return None
+    if tuple(python) != _PYTHON or (validated and not was_validated):
+        return None
+    if toolutils.signatures_changed(sources):
+        return None
+
+    adapters = []
+    for options in attributes:
+        adapter = NetworkAdapter.__new__(NetworkAdapter)
+        adapter.__setstate__({'attributes': options})
+        adapters.append(adapter)
+    return sources, adapters
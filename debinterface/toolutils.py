@@ -5,19 +5,35 @@ import stat
 import tempfile
 from contextlib import contextmanager
 import subprocess
+import threading
+from collections import OrderedDict
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
-def safe_subprocess(command_array):
+# Python 2 has no timeout, nothing to catch
+_TimeoutExpired = getattr(subprocess, 'TimeoutExpired', ())
+
+
+def safe_subprocess(command_array, timeout=None):
     """Executes shell command. Do not raise
 
         Args:
             command_array (list): ideally an array of string elements, but
                 may be a string. Will be converted to an array of strings
+            timeout (float, optional): seconds before the command is
+                killed and reported as failed, Python 3 only. Default None,
+                wait until it ends
 
         Returns:
             bool, str: True/False (command succeeded), command output
     """
 
+    options = {}
+    if timeout is not None:
+        options['timeout'] = timeout
     try:
         # Ensure all args are strings
         if isinstance(command_array, list):
@@ -25,30 +41,352 @@ def safe_subprocess(command_array):
         else:
             command_array_str = [str(command_array)]
         return True, subprocess.check_output(command_array_str,
-                                             stderr=subprocess.STDOUT)
+                                             stderr=subprocess.STDOUT,
+                                             **options)
     except OSError as ex:
         return False, ex.__str__()
     except subprocess.CalledProcessError as ex:
         return False, ex.output
+    except _TimeoutExpired as ex:
+        return False, ex.__str__()
+
+
+def file_signature(path):
+    """Identify a version of a file by its inode, modification time and size
+
+        Args:
+            path (str): the file path
+
+        Returns:
+            tuple: (st_ino, st_mtime_ns, st_size)
+
+        Raises:
+            OSError: if the file can not be stat'ed
+    """
+    st = os.stat(path)
+    mtime_ns = getattr(st, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(st.st_mtime * 1000000000)
+    return st.st_ino, mtime_ns, st.st_size
+
+
+def signatures_changed(signatures):
+    """Tell if any of the files changed since their signatures were taken
+
+        Args:
+            signatures (dict): path => file_signature, or None if the
+                path did not exist
+
+        Returns:
+            bool: True if a file changed, appeared or disappeared
+    """
+    for path, signature in signatures.items():
+        try:
+            if file_signature(path) != signature:
+                return True
+        except OSError:
+            if signature is not None:
+                return True
+    return False
+
+
+class LRUCache(object):
+    """Thread safe mapping keeping the maxsize most recently used keys.
+    A maxsize of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        with self._lock:
+            self._maxsize = value
+            self._evict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None, valid=None):
+        """Return the value of key and mark it as recently used.
+        Counts a hit or a miss.
+
+            Args:
+                key (hashable): the key
+                default (any, optional): returned if key is missing
+                valid (callable, optional): valid(value) is False for stale
+                    values, they are dropped and count as a miss
+
+            Returns:
+                any: the cached value or default
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if valid is not None and not valid(value):
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value, evicting the least recently used keys if full.
+
+            Args:
+                key (hashable): the key
+                value (any): the value
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            self._evict()
+
+    def discard(self, key):
+        """Remove key, if present, without counting a miss."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove all keys and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self):
+        while len(self._data) > max(self._maxsize, 0):
+            self._data.popitem(last=False)
+
+
+class ReadWriteLock(object):
+    """Readers-writer lock: many threads may read at once, a writer runs
+    alone. Waiting writers go before new readers. The lock is reentrant:
+    a writer may read or write again and a reader may read again, but a
+    reader can not become a writer.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        # thread ident => reading depth
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+
+    def is_writing(self):
+        """Tell if the current thread holds the write lock."""
+        return self._writer == threading.current_thread().ident
+
+    @contextmanager
+    def reading(self):
+        """Hold the lock for reading."""
+        me = threading.current_thread().ident
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            elif me in self._readers:
+                self._readers[me] += 1
+            else:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+                self._readers[me] = 1
+        try:
+            yield
+        finally:
+            self._release(me)
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock for writing.
+
+            Raises:
+                RuntimeError: if the current thread holds the read lock
+        """
+        me = threading.current_thread().ident
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+            elif me in self._readers:
+                raise RuntimeError("a reader can not take the write lock")
+            else:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._condition.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            self._release(me)
+
+    def _release(self, me):
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._condition.notify_all()
+            else:
+                self._readers[me] -= 1
+                if not self._readers[me]:
+                    del self._readers[me]
+                    if not self._readers:
+                        self._condition.notify_all()
 
 
 @contextmanager
-def atomic_write(filepath):
+def file_lock(lock_path, shared=False):
+    """
+        Hold an advisory fcntl lock on lock_path, created if missing.
+        Processes and threads using the same lock path wait for each
+        other. Does nothing where fcntl is not available.
+
+        Args:
+            lock_path (str): the lock file path
+            shared (bool, optional): take a shared lock instead of an
+                exclusive one. Default False
+    """
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        # closing the file releases the lock
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(filepath, mode='w+'):
     """
         Writeable file object that atomically updates a file
             (using a temporary file).
 
         Args:
             filepath (str): the file path to be opened
+            mode (str, optional): 'w+b' to write bytes. Default 'w+'
     """
     # Put tmp file to same directory as target file, to allow atomic move
     realpath = os.path.realpath(filepath)
     tmppath = os.path.dirname(realpath)
     with tempfile.NamedTemporaryFile(dir=tmppath, delete=False) as tempf:
-        with open(tempf.name, mode='w+') as tmp:
+        with open(tempf.name, mode=mode) as tmp:
             yield tmp
             tmp.flush()
             os.fsync(tmp.fileno())
         os.rename(tempf.name, realpath)
         os.chmod(realpath,
                  stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+class PrefixTrie(object):
+    """Binary trie of IP networks for longest prefix matches. Lookups,
+    insertions and removals take O(prefix length).
+    IPv4 and IPv6 networks are kept in separate tries.
+    """
+
+    # Nodes are [zero child, one child, values] lists
+    _VALUES = 2
+
+    def __init__(self):
+        self._roots = {4: [None, None, []], 6: [None, None, []]}
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def insert(self, network, value):
+        """Add value to the values of network.
+
+            Args:
+                network (IPv4Network/IPv6Network): the network
+                value (any): the value
+        """
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            bit = (bits >> (width - depth - 1)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, []]
+            node = node[bit]
+        node[self._VALUES].append(value)
+        self._len += 1
+
+    def remove(self, network, value):
+        """Remove value from the values of network, pruning the nodes left
+        empty. Missing values are ignored.
+
+            Args:
+                network (IPv4Network/IPv6Network): the network
+                value (any): the value, compared by identity
+        """
+        node = self._roots[network.version]
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        path = []
+        for depth in range(network.prefixlen):
+            bit = (bits >> (width - depth - 1)) & 1
+            if node[bit] is None:
+                return
+            path.append((node, bit))
+            node = node[bit]
+        values = node[self._VALUES]
+        for index, item in enumerate(values):
+            if item is value:
+                del values[index]
+                self._len -= 1
+                break
+        else:
+            return
+        for parent, bit in reversed(path):
+            if (node[self._VALUES] or node[0] is not None
+                    or node[1] is not None):
+                break
+            parent[bit] = None
+            node = parent
+
+    def longest_match(self, address):
+        """Values of the longest network containing address.
+
+            Args:
+                address (IPv4Address/IPv6Address): the address
+
+            Returns:
+                list: the values, empty if no network contains address
+        """
+        node = self._roots[address.version]
+        bits = int(address)
+        width = address.max_prefixlen
+        best = node[self._VALUES]
+        for depth in range(width):
+            node = node[(bits >> (width - depth - 1)) & 1]
+            if node is None:
+                break
+            if node[self._VALUES]:
+                best = node[self._VALUES]
+        return list(best)
+
+    def clear(self):
+        """Remove all networks."""
+        self.__init__()
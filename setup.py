@@ -16,7 +16,12 @@ def read(*parts):
         return file_src.read()
 
 
-REQUIREMENTS = []
+REQUIREMENTS = [
+    # concurrent.futures backport
+    'futures; python_version < "3.2"',
+    # ipaddress backport
+    'ipaddress; python_version < "3.3"'
+]
 
 # Remember to sync with debinterface.__init__ and docs/conf.py
 VERSION = "3.1.0"
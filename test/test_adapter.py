@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import pickle
 import unittest
 from ..debinterface import NetworkAdapter
 
@@ -33,3 +34,70 @@ class TestNetworkAdapter(unittest.TestCase):
             'source': 'tunnel'
         }
         self.assertRaises(ValueError, NetworkAdapter, opts)
+
+    def test_pickle(self):
+        """Adapters pickle their options only"""
+        adapter = NetworkAdapter({"name": "eth0", "address": "10.0.0.1"})
+        other = pickle.loads(pickle.dumps(adapter))
+        self.assertEqual(other.attributes, adapter.attributes)
+        other.validateAll()
+        other.setNetmask("255.255.255.0")
+        self.assertNotIn("netmask", adapter.attributes)
+
+    def test_compact(self):
+        """Adapters have no __dict__ and share their validator"""
+        adapter = NetworkAdapter({"name": "eth0"})
+        other = NetworkAdapter({"name": "eth1"})
+        self.assertFalse(hasattr(adapter, "__dict__"))
+        self.assertIs(adapter._validator, other._validator)
+        self.assertEqual(adapter.attributes.stored(), {"name": "eth0"})
+
+    def test_lazy_containers(self):
+        """Containers look present and empty, they are stored on first
+        write"""
+        adapter = NetworkAdapter({"name": "eth0"})
+        empty = {"name": "eth0", "bridge-opts": {}, "up": [], "down": [],
+                 "pre-up": [], "pre-down": [], "post-up": [],
+                 "post-down": []}
+        self.assertEqual(adapter.attributes, empty)
+        self.assertEqual(adapter.export(), empty)
+        self.assertEqual(dict(adapter.attributes), empty)
+        self.assertEqual(sorted(adapter.attributes), sorted(empty))
+        self.assertIn("up", adapter.attributes)
+        self.assertEqual(adapter.attributes.get("up"), [])
+        self.assertEqual(adapter.attributes["up"], [])
+        self.assertEqual(adapter.attributes.stored(), {"name": "eth0"})
+
+        adapter.attributes["down"].append("ip link set eth0 down")
+        self.assertEqual(adapter.attributes.stored(),
+                         {"name": "eth0",
+                          "down": ["ip link set eth0 down"]})
+        self.assertEqual(adapter.attributes["down"],
+                         ["ip link set eth0 down"])
+        adapter.appendBropts("ports", "eth1")
+        self.assertEqual(adapter.attributes["bridge-opts"], {"ports": "eth1"})
+        self.assertEqual(adapter.export(["pre-up", "mtu"]),
+                         {"pre-up": [], "mtu": None})
+        self.assertRaises(KeyError, lambda: adapter.attributes["mtu"])
+
+    def test_lazy_container_reads(self):
+        """Reads of a missing container share it until it is stored"""
+        adapter = NetworkAdapter({"name": "eth0"})
+        first = adapter.attributes["up"]
+        second = adapter.attributes["up"]
+        self.assertIs(first, second)
+        first.append("x")
+        second.append("y")
+        self.assertEqual(adapter.attributes["up"], ["x", "y"])
+        bridge_opts = adapter.attributes.get("bridge-opts")
+        adapter.attributes.get("bridge-opts")["ports"] = "eth1"
+        self.assertEqual(bridge_opts, {"ports": "eth1"})
+        # a container dropped unchanged leaves nothing behind
+        adapter.attributes["down"]
+        self.assertEqual(adapter.attributes._pending, None)
+        self.assertEqual(adapter.attributes.stored(),
+                         {"name": "eth0", "up": ["x", "y"],
+                          "bridge-opts": {"ports": "eth1"}})
+        up = adapter.attributes.pop("up")
+        up.append("z")
+        self.assertEqual(adapter.attributes["up"], [])
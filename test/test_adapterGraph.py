@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import unittest
+from ..debinterface import AdapterGraph, NetworkAdapter
+
+
+def adapter(name, ports=None, **unknown):
+    options = {"name": name, "addrFam": "inet", "source": "manual"}
+    if ports:
+        options["bridgeOpts"] = {"ports": ports}
+    result = NetworkAdapter(options)
+    for key, value in unknown.items():
+        result.setUnknown(key.replace("_", "-"), value)
+    return result
+
+
+class TestAdapterGraph(unittest.TestCase):
+    def setUp(self):
+        self.graph = AdapterGraph([
+            adapter("br0", ports="bond0 vlan100"),
+            adapter("vlan100", vlan_raw_device="eth2"),
+            adapter("bond0", bond_slaves="eth0 eth1"),
+            adapter("eth0"),
+            adapter("eth1"),
+            adapter("eth2"),
+            adapter("eth2.200"),
+            adapter("lo"),
+        ])
+
+    def test_dependencies(self):
+        self.assertEqual(self.graph.dependencies("br0"),
+                         ["bond0", "vlan100"])
+        self.assertEqual(self.graph.dependencies("bond0"), ["eth0", "eth1"])
+        self.assertEqual(self.graph.dependencies("eth2.200"), ["eth2"])
+        self.assertEqual(self.graph.dependents("eth2"),
+                         ["vlan100", "eth2.200"])
+
+    def test_layers(self):
+        self.assertEqual(self.graph.layers(), [
+            ["eth0", "eth1", "eth2", "lo"],
+            ["vlan100", "bond0", "eth2.200"],
+            ["br0"]])
+        self.assertEqual(self.graph.layers(["br0", "eth0"], reverse=True),
+                         [["br0"], ["eth0"]])
+
+    def test_restart_set(self):
+        self.assertEqual(self.graph.restart_set(["eth0"]),
+                         ["eth0", "bond0", "br0"])
+        self.assertEqual(self.graph.restart_set(["lo"]), ["lo"])
+
+    def test_cycle(self):
+        graph = AdapterGraph([adapter("br0", ports="br1"),
+                              adapter("br1", ports="br0")])
+        with self.assertRaises(ValueError):
+            graph.layers()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import ipaddress
+import unittest
+from ..debinterface import AdapterIndexes, NetworkAdapter, StaleIndexError
+from ..debinterface.toolutils import PrefixTrie
+
+
+class TestAdapterIndexes(unittest.TestCase):
+    def setUp(self):
+        self.eth0 = NetworkAdapter({
+            "name": "eth0", "addrFam": "inet", "source": "static",
+            "address": "10.0.0.1", "netmask": "255.255.255.0",
+            "auto": True})
+        self.eth1 = NetworkAdapter({
+            "name": "eth1", "addrFam": "inet6", "source": "static",
+            "address": "2001:DB8::1"})
+        self.br0 = NetworkAdapter({
+            "name": "br0", "addrFam": "inet", "source": "static",
+            "address": "10.0.0.2", "netmask": "255.255.255.0",
+            "bridgeOpts": {"ports": "eth2 eth3"}})
+        self.indexes = AdapterIndexes([self.eth0, self.eth1, self.br0])
+
+    def test_lookups(self):
+        self.assertEqual(self.indexes.by_address("10.0.0.1"), [self.eth0])
+        self.assertEqual(self.indexes.by_address("2001:db8::1"), [self.eth1])
+        self.assertEqual(self.indexes.by_address("not an ip"), [])
+        self.assertEqual(self.indexes.by_network("10.0.0.7/24"),
+                         [self.eth0, self.br0])
+        self.assertEqual(self.indexes.by_port("eth3"), [self.br0])
+        self.assertEqual(self.indexes.auto(), [self.eth0])
+        self.assertEqual(self.indexes.hotplug(), [])
+
+    def test_changed_adapters(self):
+        self.eth0.setAddress("10.0.1.1")
+        self.assertEqual(self.indexes.by_address("10.0.0.1"), [])
+        self.assertEqual(self.indexes.by_address("10.0.1.1"), [self.eth0])
+        self.br0.replaceBropt("ports", "eth2")
+        self.indexes.update(self.br0)
+        self.assertEqual(self.indexes.by_port("eth3"), [])
+        self.indexes.remove(self.eth0)
+        self.assertEqual(self.indexes.auto(), [])
+
+    def test_only_changed_adapters_indexed_again(self):
+        updated = []
+        update = self.indexes.update
+
+        def counted(adapter):
+            updated.append(adapter)
+            update(adapter)
+        self.indexes.update = counted
+        for _ in range(3):
+            self.assertEqual(self.indexes.auto(), [self.eth0])
+        self.eth1.setGateway("2001:DB8::2")
+        self.assertEqual(self.indexes.by_address("10.0.0.1"), [self.eth0])
+        self.assertEqual(updated, [])
+        self.br0.setAuto(True)
+        self.assertEqual(self.indexes.auto(), [self.eth0, self.br0])
+        self.assertEqual(self.indexes.hotplug(), [])
+        self.assertEqual(updated, [self.br0])
+
+    def test_by_destination(self):
+        wide = NetworkAdapter({
+            "name": "eth4", "addrFam": "inet", "source": "static",
+            "address": "10.0.0.254", "netmask": "255.0.0.0"})
+        self.indexes.add(wide)
+        self.assertEqual(self.indexes.by_destination("10.0.0.9"),
+                         [self.eth0, self.br0])
+        self.assertEqual(self.indexes.by_destination("10.8.0.9"), [wide])
+        self.assertEqual(self.indexes.by_destination("2001:db8::1"),
+                         [self.eth1])
+        self.assertEqual(self.indexes.by_destination("192.168.0.1"), [])
+        self.eth0.setNetmask("255.255.255.252")
+        with self.assertRaises(StaleIndexError):
+            self.indexes.by_destination("10.0.0.2", repair=False)
+        self.assertEqual(self.indexes.by_destination("10.0.0.2"),
+                         [self.eth0])
+        self.eth0.setGateway("10.0.0.3")
+        self.assertEqual(
+            self.indexes.by_destination("10.0.0.2", repair=False),
+            [self.eth0])
+        self.indexes.remove(self.eth0)
+        self.indexes.remove(self.br0)
+        self.assertEqual(self.indexes.by_destination("10.0.0.2"), [wide])
+
+
+class TestPrefixTrie(unittest.TestCase):
+    def test_longest_match(self):
+        trie = PrefixTrie()
+        default = ipaddress.ip_network(u"0.0.0.0/0")
+        lan = ipaddress.ip_network(u"192.168.0.0/16")
+        host = ipaddress.ip_network(u"192.168.1.1/32")
+        names = dict((x, str(x)) for x in (default, lan, host))
+        for network, name in names.items():
+            trie.insert(network, name)
+        self.assertEqual(len(trie), 3)
+        match = trie.longest_match
+        self.assertEqual(match(ipaddress.ip_address(u"192.168.1.1")),
+                         ["192.168.1.1/32"])
+        self.assertEqual(match(ipaddress.ip_address(u"192.168.1.2")),
+                         ["192.168.0.0/16"])
+        self.assertEqual(match(ipaddress.ip_address(u"8.8.8.8")),
+                         ["0.0.0.0/0"])
+        self.assertEqual(match(ipaddress.ip_address(u"::1")), [])
+        trie.remove(lan, names[lan])
+        self.assertEqual(match(ipaddress.ip_address(u"192.168.1.2")),
+                         ["0.0.0.0/0"])
+        trie.remove(lan, names[lan])
+        self.assertEqual(len(trie), 2)
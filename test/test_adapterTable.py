@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from ..debinterface import (AdapterTable, Interfaces, InterfacesReader,
+                             PARSE_CACHE)
+
+
+INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
+
+
+class TestAdapterTable(unittest.TestCase):
+    def test_rows_keep_attributes(self):
+        """Rows should rebuild the attributes of the packed adapters"""
+        adapters = InterfacesReader(INF_PATH).parse_interfaces()
+        expected = [x.attributes.stored() for x in adapters]
+        table = AdapterTable(adapters)
+        self.assertEqual(len(table), len(expected))
+        for row, attributes in enumerate(expected):
+            self.assertEqual(table.row_attributes(row), attributes)
+            self.assertEqual(table[row].attributes.stored(), attributes)
+
+    def test_views_are_kept(self):
+        """Changes made to a row should be seen by the table"""
+        table = AdapterTable(InterfacesReader(INF_PATH).parse_interfaces())
+        table[0].setAddress("10.1.2.3")
+        self.assertIs(table[0], table[0])
+        self.assertEqual(table.column("address")[0], "10.1.2.3")
+        table.compact()
+        self.assertEqual(table[0].attributes["address"], "10.1.2.3")
+
+    def test_unused_views_are_dropped(self):
+        """Only the changed views should be kept, until compact"""
+        table = AdapterTable(InterfacesReader(INF_PATH).parse_interfaces())
+        for adapter in table:
+            pass
+        del adapter
+        self.assertEqual([x for x in table._views if x is not None
+                          and x() is not None], [])
+        table[1].setAddress("10.1.2.3")
+        kept = table[1]
+        self.assertIs(table._views[1](), kept)
+        table.compact()
+        self.assertEqual(len(table._log), 0)
+        self.assertEqual(table.row_attributes(1)["address"], "10.1.2.3")
+        # still the view of its row
+        kept.setAddress("10.1.2.4")
+        self.assertEqual(table.column("address")[1], "10.1.2.4")
+        del kept
+        self.assertEqual(table[1].attributes["address"], "10.1.2.4")
+
+    def test_copy(self):
+        """Copies should be packed and independent"""
+        table = AdapterTable(InterfacesReader(INF_PATH).parse_interfaces())
+        table[1].setAddress("10.1.2.3")
+        copy = table.copy()
+        self.assertEqual(copy._views, [None] * len(table))
+        self.assertEqual(copy.row_attributes(1)["address"], "10.1.2.3")
+        copy[1].setAddress("10.1.2.4")
+        self.assertEqual(table[1].attributes["address"], "10.1.2.3")
+
+    def test_columns(self):
+        """Column scans should not build adapters"""
+        table = AdapterTable(InterfacesReader(INF_PATH).parse_interfaces())
+        names = table.column("name")
+        self.assertEqual(names[0], "lo")
+        self.assertEqual(table.indexes("name", "eth0"), [names.index("eth0")])
+        rows = table.indexes("address", "192.168.1.2")
+        self.assertEqual([names[x] for x in rows], ["br0"])
+        self.assertEqual(table._views, [None] * len(table))
+
+    def test_unpacked_values(self):
+        """Values that are not canonical IPs should be kept as they are"""
+        table = AdapterTable()
+        table.extend(AdapterTable([]))
+        adapters = InterfacesReader(INF_PATH).parse_interfaces()
+        adapter = adapters[0]
+        adapter.attributes["address"] = "10.0.0.1/24"
+        adapter.attributes["netmask"] = "2001:DB8::1"
+        table.extend([adapter])
+        self.assertEqual(table.row_attributes(0)["address"], "10.0.0.1/24")
+        self.assertEqual(table.row_attributes(0)["netmask"], "2001:DB8::1")
+        self.assertEqual(table.indexes("address", "10.0.0.1/24"), [0])
+
+    def test_list_operations(self):
+        """Insert, delete and assign should behave as a list"""
+        adapters = InterfacesReader(INF_PATH).parse_interfaces()
+        table = AdapterTable(adapters[1:])
+        table.insert(0, adapters[0])
+        self.assertIs(table[0], adapters[0])
+        del table[1]
+        self.assertEqual(len(table), len(adapters) - 1)
+        table[-1] = adapters[1]
+        self.assertIs(table[-1], adapters[1])
+        self.assertRaises(IndexError, lambda: table[len(table)])
+
+    def test_columnar_interfaces(self):
+        """Interfaces should work the same with an AdapterTable"""
+        itfs = Interfaces(interfaces_path=INF_PATH, columnar=True)
+        self.assertIsInstance(itfs.adapters, AdapterTable)
+        self.assertEqual(len(itfs.adapters), 8)
+        self.assertEqual(itfs.getAdapter("eth0").attributes["name"], "eth0")
+        itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                         "source": "dhcp"})
+        self.assertEqual(itfs.getAdapter("eth9").attributes["source"], "dhcp")
+        itfs.removeAdapterByName("eth9")
+        self.assertEqual(itfs.getAdapter("eth9"), None)
+        self.assertRaises(ValueError, Interfaces, interfaces_path=INF_PATH,
+                          columnar=True, lossless=True)
+
+    def test_columnar_parse_cache(self):
+        """Columnar instances should cache packed adapters"""
+        PARSE_CACHE.clear()
+        try:
+            Interfaces(interfaces_path=INF_PATH, columnar=True)
+            cached = PARSE_CACHE.get(os.path.realpath(INF_PATH))
+            self.assertIsInstance(cached.adapters, AdapterTable)
+            itfs = Interfaces(interfaces_path=INF_PATH, columnar=True)
+            self.assertEqual(PARSE_CACHE.hits, 2)
+            self.assertIsInstance(itfs.adapters, AdapterTable)
+            itfs.getAdapter("eth0").setAddress("10.1.2.3")
+            self.assertEqual(itfs.getAdapter("eth0").attributes["address"],
+                             "10.1.2.3")
+            self.assertNotEqual(cached.adapters.column("address"),
+                                itfs.adapters.column("address"))
+            itfs = Interfaces(interfaces_path=INF_PATH)
+            self.assertIsInstance(itfs.adapters, list)
+            self.assertEqual(len(itfs.adapters), 8)
+        finally:
+            PARSE_CACHE.clear()
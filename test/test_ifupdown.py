@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from ..debinterface import Interfaces, InterfacesWriter, NetworkAdapter
+from ..debinterface import ifupdown
+from ..debinterface.ifupdown import run_many
+
+
+# Logs its arguments, fails on bad* names and hangs on slow* names
+STUB = """#!/bin/sh
+echo "$@" >> "{log}"
+for name in "$@"; do
+    case "$name" in
+        bad*) echo "cannot configure $name"; exit 1 ;;
+        slow*) sleep 5 ;;
+    esac
+done
+echo "configured $@"
+"""
+
+
+@unittest.skipIf(os.name != "posix", "needs a shell")
+class TestIfupdown(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp, "calls")
+        self.ifup = os.path.join(self.tmp, "ifup")
+        with open(self.ifup, "w") as stub:
+            stub.write(STUB.format(log=self.log))
+        os.chmod(self.ifup, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def calls(self):
+        with open(self.log) as log:
+            return [line.split() for line in log]
+
+    def test_batches(self):
+        names = ["eth{0}".format(x) for x in range(10)]
+        results = Interfaces.upAdapters(names, command=self.ifup,
+                                        batch_size=4, max_workers=2)
+        self.assertEqual([x.name for x in results], names)
+        self.assertTrue(all(x.success for x in results))
+        self.assertEqual(sorted(len(x) for x in self.calls()), [2, 4, 4])
+
+    def test_failed_batch(self):
+        """Interfaces of a failed batch are run again one by one"""
+        results = run_many(self.ifup, ["eth0", "bad0", "eth1", "eth0"],
+                           batch_size=3)
+        self.assertEqual([(x.name, x.success) for x in results],
+                         [("eth0", True), ("bad0", False), ("eth1", True)])
+        self.assertIn(b"cannot configure bad0", results[1].output)
+        self.assertEqual(len(self.calls()), 4)
+
+    @unittest.skipIf(sys.version_info < (3, 3), "no subprocess timeout")
+    def test_timeout(self):
+        results = run_many(self.ifup, ["slow0", "eth0"], max_workers=2,
+                           timeout=0.5)
+        self.assertEqual([x.success for x in results], [False, True])
+        self.assertIn("timed out", results[0].output)
+
+    def test_arguments(self):
+        self.assertEqual(run_many(self.ifup, []), [])
+        with self.assertRaises(ValueError):
+            run_many(self.ifup, ["eth0"], batch_size=0)
+
+    def test_dependency_order(self):
+        """A bridge is brought up after its ports, not if one failed"""
+        tmp = os.path.join(self.tmp, "interfaces")
+        with open(tmp, "w") as interfaces:
+            interfaces.write("iface eth0 inet manual\n"
+                             "iface bad0 inet manual\n"
+                             "iface br0 inet manual\n"
+                             "    bridge_ports eth0\n"
+                             "iface br1 inet manual\n"
+                             "    bridge_ports bad0\n")
+        itfs = Interfaces(interfaces_path=tmp)
+        results = itfs.upAdaptersInOrder(command=self.ifup, max_workers=2)
+        self.assertEqual([(x.name, x.success) for x in results],
+                         [("eth0", True), ("bad0", False),
+                          ("br0", True), ("br1", False)])
+        self.assertEqual(results[3].output, "not run, bad0 failed")
+        self.assertEqual([x[0] for x in self.calls()][-1], "br0")
+        self.assertEqual(itfs.getRestartSet(["eth0"]), ["eth0", "br0"])
+
+    def test_writer_check(self):
+        """ifup --no-act checks many adapters per process, the failed
+        batches name by name, and passed contents are cached"""
+        path = os.path.join(self.tmp, "interfaces")
+        adapters = [NetworkAdapter({"name": name, "addrFam": "inet",
+                                    "source": "manual"})
+                    for name in ("eth0", "bad0", "eth1")]
+        ifup = ifupdown.IFUP
+        ifupdown.IFUP = self.ifup
+        try:
+            writer = InterfacesWriter(adapters, path)
+            with self.assertRaises(ValueError) as error:
+                writer.write_interfaces()
+            self.assertIn("bad0: ", str(error.exception))
+            self.assertNotIn("eth0: ", str(error.exception))
+            self.assertEqual([len(x) for x in self.calls()],
+                             [5, 3, 3, 3])
+
+            del adapters[1]
+            writer = InterfacesWriter(adapters, path)
+            self.assertTrue(writer.write_interfaces())
+            self.assertEqual(self.calls()[-1][2:], ["eth0", "eth1"])
+            calls = len(self.calls())
+            with open(path, "rb") as interfaces:
+                writer._check_interfaces(path, interfaces.read())
+            self.assertEqual(len(self.calls()), calls)
+        finally:
+            ifupdown.IFUP = ifup
+
+    def test_writer_check_includes(self):
+        """A content which passed is checked again once a file it
+        includes changed"""
+        path = os.path.join(self.tmp, "interfaces")
+        fragments = os.path.join(self.tmp, "interfaces.d")
+        os.mkdir(fragments)
+        fragment = os.path.join(fragments, "eth1")
+        with open(fragment, "w") as included:
+            included.write("iface eth1 inet manual\n")
+        content = (b"source-directory interfaces.d\n"
+                   b"iface eth0 inet manual\n")
+        with open(path, "wb") as interfaces:
+            interfaces.write(content)
+        writer = InterfacesWriter([NetworkAdapter({
+            "name": "eth0", "addrFam": "inet", "source": "manual"})], path)
+        ifup = ifupdown.IFUP
+        ifupdown.IFUP = self.ifup
+        try:
+            writer._check_interfaces(path, content)
+            writer._check_interfaces(path, content)
+            self.assertEqual(len(self.calls()), 1)
+            with open(fragment, "w") as included:
+                included.write("iface eth1 inet static\n"
+                               "    address 10.0.0.1\n")
+            writer._check_interfaces(path, content)
+            self.assertEqual(len(self.calls()), 2)
+        finally:
+            ifupdown.IFUP = ifup
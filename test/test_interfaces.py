@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 import os
+import shutil
+import tempfile
+import threading
 import unittest
-from ..debinterface import Interfaces
+from ..debinterface import Interfaces, NetworkAdapter, PARSE_CACHE
+from ..debinterface.toolutils import ReadWriteLock
 
 
 INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
@@ -19,6 +23,15 @@ class TestInterfaces(unittest.TestCase):
         itfs.updateAdapters()
         self.assertEqual(len(itfs.adapters), 8)
 
+    def test_conflicting_modes(self):
+        """Modes which would ignore each other are refused"""
+        for modes in ({"lossless": True, "incremental": True},
+                      {"lossless": True, "snapshot": True},
+                      {"incremental": True, "snapshot": True}):
+            with self.assertRaises(ValueError):
+                Interfaces(interfaces_path=INF_PATH, update_adapters=False,
+                           **modes)
+
     def test_get_existing_adapter(self):
         itfs = Interfaces(interfaces_path=INF_PATH)
         self.assertEqual(itfs.getAdapter("eth0").attributes["name"], "eth0")
@@ -78,3 +91,390 @@ class TestInterfaces(unittest.TestCase):
         self.assertEqual(len(itfs.adapters), nb_adapters - 1)
         for adapter in itfs.adapters:
             self.assertNotEqual("eth0", adapter.attributes["name"])
+
+    def test_name_index_families(self):
+        itfs = Interfaces(interfaces_path=INF_PATH)
+        inet6 = itfs.addAdapter({"name": "eth0", "addrFam": "inet6",
+                                 "source": "auto"})
+        inet = itfs.getAdapter("eth0")
+        self.assertEqual(inet.attributes["addrFam"], "inet")
+        self.assertIs(itfs.getAdapter("eth0", "inet6"), inet6)
+        itfs.removeAdapterByName("eth0", "inet")
+        self.assertIs(itfs.getAdapter("eth0"), inet6)
+        self.assertNotIn(inet, itfs.adapters)
+
+    def test_name_index_consistency(self):
+        itfs = Interfaces(interfaces_path=INF_PATH)
+        names = [x.attributes["name"] for x in itfs.adapters]
+        for name in names[:5]:
+            itfs.removeAdapterByName(name)
+        self.assertEqual([x.attributes["name"] for x in itfs.adapters],
+                         names[5:])
+        itfs.addAdapter("eth7", 0)
+        self.assertIs(itfs.getAdapter("eth7"), itfs.adapters[0])
+        itfs.removeAdapter(0)
+        self.assertEqual(itfs.getAdapter("eth7"), None)
+        # changes made behind the indexes
+        old_name = itfs.adapters[0].attributes["name"]
+        itfs.adapters[0].setName("eth8")
+        self.assertEqual(itfs.getAdapter(old_name), None)
+        self.assertIs(itfs.getAdapter("eth8"), itfs.adapters[0])
+        itfs.adapters.append(itfs.adapters[0].copy())
+        itfs.adapters[-1].setName("eth9")
+        self.assertIs(itfs.getAdapter("eth9"), itfs.adapters[-1])
+
+    def test_name_index_follows_changes(self):
+        """Renamed and replaced adapters are found by their new name"""
+        for thread_safe in (False, True):
+            itfs = Interfaces(interfaces_path=INF_PATH,
+                              thread_safe=thread_safe)
+            eth1 = itfs.getAdapter("eth1")
+            eth1.setName("eth9")
+            self.assertIs(itfs.getAdapter("eth9"), eth1)
+            self.assertIs(itfs.getAdapter("eth9", "inet"), eth1)
+            self.assertEqual(itfs.getAdapter("eth1"), None)
+
+        itfs = Interfaces(interfaces_path=INF_PATH)
+        eth0 = itfs.getAdapter("eth0")
+        self.assertIs(itfs.adapters[3], eth0)
+        itfs.adapters[3] = NetworkAdapter("wlan9")
+        self.assertIs(itfs.getAdapter("wlan9"), itfs.adapters[3])
+        self.assertEqual(itfs.getAdapter("eth0"), None)
+        adapters = itfs.adapters
+        adapters[0], adapters[1] = adapters[1], adapters[0]
+        self.assertIs(itfs.getAdapter("lo"), adapters[1])
+        itfs.removeAdapterByName("lo")
+        self.assertEqual([x.attributes["name"] for x in itfs.adapters[:2]],
+                         ["wlan0", "wlan1"])
+
+    def test_adapters_list_changes(self):
+        """The adapters list has no holes and its changes are indexed"""
+        itfs = Interfaces(interfaces_path=INF_PATH, indexes=True)
+        adapters = itfs.adapters
+        itfs.removeAdapterByName("wlan1")
+        itfs.removeAdapter(0)
+        self.assertIs(itfs.adapters, adapters)
+        self.assertNotIn(None, adapters)
+        self.assertEqual([x.attributes["name"] for x in adapters[:2]],
+                         ["wlan0", "eth0"])
+        del adapters[1:3]
+        self.assertEqual(itfs.getAdapter("eth0"), None)
+        self.assertEqual(itfs.getAdapterByAddress("10.1.20.1"), None)
+        adapters.extend([NetworkAdapter("eth0"), NetworkAdapter("eth1")])
+        adapters.insert(0, NetworkAdapter({"name": "eth0",
+                                           "addrFam": "inet6",
+                                           "source": "auto"}))
+        self.assertIs(itfs.getAdapter("eth0"), adapters[0])
+        self.assertIs(itfs.getAdapter("eth1"), adapters[-1])
+        adapters.reverse()
+        self.assertIs(itfs.getAdapter("eth0"), adapters[1])
+        adapters[0] = adapters[-1]
+        adapters.pop()
+        self.assertIs(itfs.getAdapter("eth0"), adapters[0])
+        itfs.updateAdapters()
+        adapters.append(NetworkAdapter("eth7"))
+        self.assertEqual(itfs.getAdapter("eth7"), None)
+
+    def test_secondary_indexes(self):
+        for indexes in (False, True):
+            itfs = Interfaces(interfaces_path=INF_PATH, indexes=indexes)
+            br0 = itfs.getAdapter("br0")
+            self.assertIs(itfs.getAdapterByAddress("192.168.1.2"), br0)
+            self.assertIs(itfs.getBridge("ath1"), br0)
+            self.assertIs(itfs.getAdapterForDestination("192.168.1.77"), br0)
+            self.assertIs(itfs.getAdapterForDestination("10.1.20.3"),
+                          itfs.getAdapter("eth1"))
+            self.assertEqual(itfs.getAdaptersInNetwork("10.1.10.0/24"),
+                             [itfs.getAdapter("wlan0"),
+                              itfs.getAdapter("ath2")])
+            self.assertEqual(
+                [x.attributes["name"] for x in itfs.getAutoAdapters()],
+                ["lo", "wlan0", "ath0", "br0", "ath2"])
+            itfs.removeAdapterByName("br0")
+            self.assertEqual(itfs.getBridge("ath1"), None)
+            eth9 = itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                                    "source": "static",
+                                    "address": "192.168.1.2"})
+            self.assertIs(itfs.getAdapterByAddress("192.168.1.2"), eth9)
+            itfs.getAdapter("wlan0").setAuto(False)
+            itfs.reindex(itfs.getAdapter("wlan0"))
+            self.assertNotIn(itfs.getAdapter("wlan0"),
+                             itfs.getAutoAdapters())
+
+    def test_secondary_indexes_follow_changes(self):
+        """Changed adapters are found by their new keys"""
+        for indexes in (False, True):
+            itfs = Interfaces(interfaces_path=INF_PATH, indexes=indexes)
+            eth0, eth1 = itfs.getAdapter("eth0"), itfs.getAdapter("eth1")
+            eth1.setAddress("10.9.9.9")
+            self.assertIs(itfs.getAdapterByAddress("10.9.9.9"), eth1)
+            self.assertEqual(itfs.getAdapterByAddress("10.1.20.1"), None)
+            self.assertEqual(itfs.getAdaptersInNetwork("10.9.9.0/24"),
+                             [eth1])
+            eth0.setAuto(True)
+            itfs.getAdapter("wlan0").setAuto(False)
+            self.assertEqual(
+                [x.attributes["name"] for x in itfs.getAutoAdapters()],
+                ["lo", "eth0", "ath0", "br0", "ath2"])
+            br0 = itfs.getAdapter("br0")
+            br0.replaceBropt("ports", "eth9")
+            self.assertIs(itfs.getBridge("eth9"), br0)
+            self.assertEqual(itfs.getBridge("ath1"), None)
+
+    def test_destination_follows_changes(self):
+        """The prefix trie follows address and netmask changes"""
+        for indexes in (False, True):
+            itfs = Interfaces(interfaces_path=INF_PATH, indexes=indexes)
+            eth1 = itfs.getAdapter("eth1")
+            eth1.setAddress("10.9.9.9")
+            self.assertIs(itfs.getAdapterForDestination("10.9.9.1"), eth1)
+            self.assertEqual(itfs.getAdapterForDestination("10.1.20.3"),
+                             None)
+            eth1.setNetmask("255.255.0.0")
+            self.assertIs(itfs.getAdapterForDestination("10.9.200.1"), eth1)
+
+
+class TestInterfacesParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "interfaces")
+        shutil.copy(INF_PATH, self.path)
+        PARSE_CACHE.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        PARSE_CACHE.clear()
+        PARSE_CACHE.maxsize = 8
+
+    def test_cache_hit(self):
+        """Unchanged file is not parsed again"""
+        first = Interfaces(interfaces_path=self.path)
+        self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (0, 1))
+        second = Interfaces(interfaces_path=self.path)
+        self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (1, 1))
+        self.assertEqual(
+            [x.attributes for x in first.adapters],
+            [x.attributes for x in second.adapters])
+
+    def test_cache_copies(self):
+        """Cached adapters are independent copies"""
+        first = Interfaces(interfaces_path=self.path)
+        first.getAdapter("eth0").setAddress("10.0.0.1")
+        first.getAdapter("br0").attributes["pre-up"].append("true")
+        second = Interfaces(interfaces_path=self.path)
+        self.assertNotIn("address", second.getAdapter("eth0").attributes)
+        self.assertNotIn("true", second.getAdapter("br0").attributes["pre-up"])
+
+    def test_cache_invalidation(self):
+        """A changed file is parsed again"""
+        Interfaces(interfaces_path=self.path)
+        with open(self.path, "a") as interfaces:
+            interfaces.write("iface eth42 inet dhcp\n")
+        itfs = Interfaces(interfaces_path=self.path)
+        self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (0, 2))
+        self.assertNotEqual(itfs.getAdapter("eth42"), None)
+
+    def test_cache_lru(self):
+        """Least recently used files are evicted"""
+        PARSE_CACHE.maxsize = 1
+        other = os.path.join(self.tmpdir, "interfaces2")
+        shutil.copy(INF2_PATH, other)
+        Interfaces(interfaces_path=self.path)
+        Interfaces(interfaces_path=other)
+        Interfaces(interfaces_path=self.path)
+        self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (0, 3))
+        self.assertEqual(len(PARSE_CACHE), 1)
+
+    def test_cache_validation(self):
+        """Adapters read without validation are not served to strict mode"""
+        Interfaces(interfaces_path=self.path, validate="lazy")
+        Interfaces(interfaces_path=self.path)
+        self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (0, 2))
+        Interfaces(interfaces_path=self.path, validate="lazy")
+        self.assertEqual((PARSE_CACHE.hits, PARSE_CACHE.misses), (1, 2))
+
+    def test_incremental_update(self):
+        """updateAdapters reports changes in incremental mode"""
+        itfs = Interfaces(interfaces_path=self.path, incremental=True)
+        eth1 = itfs.getAdapter("eth1")
+        with open(self.path, "a") as interfaces:
+            interfaces.write("iface eth42 inet dhcp\n")
+        changes = itfs.updateAdapters()
+        self.assertIs(itfs.getAdapter("eth1"), eth1)
+        self.assertEqual(changes.added, [itfs.getAdapter("eth42")])
+
+
+class TestInterfacesTransaction(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "interfaces")
+        shutil.copy(INF_PATH, self.path)
+        with open(self.path) as interfaces:
+            self.content = interfaces.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assert_unchanged(self, itfs, names):
+        self.assertEqual([x.attributes["name"] for x in itfs.adapters], names)
+        with open(self.path) as interfaces:
+            self.assertEqual(interfaces.read(), self.content)
+
+    def test_rollback_on_error(self):
+        """Changes are undone when the block raises, nothing is written"""
+        itfs = Interfaces(interfaces_path=self.path)
+        names = [x.attributes["name"] for x in itfs.adapters]
+        eth1 = itfs.getAdapter("eth1")
+        with self.assertRaises(RuntimeError):
+            with itfs.transaction():
+                itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                                 "source": "dhcp"})
+                itfs.removeAdapterByName("br0")
+                eth1.setAddress("10.9.9.9")
+                itfs.writeInterfaces()
+                raise RuntimeError("abort")
+        self.assert_unchanged(itfs, names)
+        self.assertIs(itfs.getAdapter("eth1"), eth1)
+        self.assertEqual(eth1.attributes["address"], "10.1.20.1")
+        self.assertNotEqual(itfs.getAdapter("br0"), None)
+        self.assertEqual(itfs.getAdapter("eth9"), None)
+
+    def test_validation_at_commit(self):
+        """Added and changed adapters are validated when the block ends"""
+        itfs = Interfaces(interfaces_path=self.path)
+        names = [x.attributes["name"] for x in itfs.adapters]
+        with self.assertRaises(ValueError):
+            with itfs.transaction():
+                # a static inet adapter requires an address
+                itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                                 "source": "static"})
+        self.assert_unchanged(itfs, names)
+        with self.assertRaises(ValueError):
+            with itfs.transaction():
+                with itfs.transaction():
+                    itfs.getAdapter("eth1").setAddressSource("tunnel")
+        self.assert_unchanged(itfs, names)
+        self.assertEqual(itfs.getAdapter("eth1").attributes["source"],
+                         "static")
+
+    def test_lazy_validation_at_commit(self):
+        """Adapters read with validate='lazy' are validated at commit"""
+        with open(self.path, "a") as interfaces:
+            interfaces.write("iface eth8 inet static\n"
+                             "    address 10.0.0.300\n")
+        with open(self.path) as interfaces:
+            self.content = interfaces.read()
+        itfs = Interfaces(interfaces_path=self.path, validate="lazy",
+                          check="python")
+        names = [x.attributes["name"] for x in itfs.adapters]
+        with self.assertRaises(ValueError):
+            with itfs.transaction():
+                itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                                 "source": "dhcp"})
+        self.assert_unchanged(itfs, names)
+
+
+class TestInterfacesThreadSafe(unittest.TestCase):
+    def test_concurrent_changes(self):
+        """Lookups, snapshots and changes from many threads"""
+        itfs = Interfaces(interfaces_path=INF_PATH, indexes=True,
+                          thread_safe=True)
+        names = set(x.attributes["name"] for x in itfs.adapters)
+        errors = []
+
+        def writer(number):
+            try:
+                for i in range(50):
+                    name = "tst{0}_{1}".format(number, i)
+                    itfs.addAdapter({"name": name, "auto": True})
+                    itfs.removeAdapterByName(name)
+            except Exception as error:
+                errors.append(error)
+
+        def reader():
+            try:
+                for _ in range(200):
+                    self.assertNotEqual(itfs.getAdapter("eth0"), None)
+                    self.assertNotEqual(itfs.getBridge("eth0"), None)
+                    self.assertFalse(
+                        any(x is None for x in itfs.adapters))
+                    itfs.getAutoAdapters()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=writer, args=(x, ))
+                   for x in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            set(x.attributes["name"] for x in itfs.adapters), names)
+
+    def test_stale_lookup_repaired(self):
+        """A reader finding stale indexes repairs them as a writer"""
+        itfs = Interfaces(interfaces_path=INF_PATH, indexes=True,
+                          thread_safe=True)
+        eth1 = itfs.getAdapter("eth1")
+        eth1.setAddress("10.9.9.9")
+        self.assertIs(itfs.getAdapterByAddress("10.9.9.9"), eth1)
+        self.assertEqual(itfs.getAdapterByAddress("10.1.20.1"), None)
+        eth0 = itfs.getAdapter("eth0")
+        eth0.setAuto(True)
+        self.assertIn(eth0, itfs.getAutoAdapters())
+        eth0.attributes["name"] = "eth7"
+        self.assertIs(itfs.getAdapter("eth7"), eth0)
+        self.assertEqual(itfs.getAdapter("eth0"), None)
+
+    def test_columnar_refused(self):
+        with self.assertRaises(ValueError):
+            Interfaces(interfaces_path=INF_PATH, columnar=True,
+                       thread_safe=True)
+
+
+class TestReadWriteLock(unittest.TestCase):
+    def test_reentrant(self):
+        lock = ReadWriteLock()
+        with lock.writing():
+            with lock.writing():
+                with lock.reading():
+                    self.assertTrue(lock.is_writing())
+            self.assertTrue(lock.is_writing())
+        self.assertFalse(lock.is_writing())
+        with lock.reading():
+            with lock.reading():
+                self.assertFalse(lock.is_writing())
+            with self.assertRaises(RuntimeError):
+                with lock.writing():
+                    pass
+
+    def test_readers_share(self):
+        """Readers run together, a writer waits for them"""
+        lock = ReadWriteLock()
+        both = threading.Barrier(3) if hasattr(threading, "Barrier") \
+            else None
+        if both is None:
+            self.skipTest("threading.Barrier is not available")
+        events = []
+
+        def read():
+            with lock.reading():
+                both.wait(5)
+                events.append("read")
+
+        def write():
+            with lock.writing():
+                events.append("write")
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        with lock.reading():
+            for thread in readers:
+                thread.start()
+            writer = threading.Thread(target=write)
+            both.wait(5)
+            writer.start()
+        for thread in readers + [writer]:
+            thread.join()
+        self.assertEqual(events[-1], "write")
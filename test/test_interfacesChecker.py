@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from ..debinterface import (Interfaces, InterfacesReader, InterfacesWriter,
+                            NetworkAdapter, check_structure,
+                            structure_errors)
+
+
+INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
+
+
+def adapter(name, addrFam="inet", source="manual", **options):
+    options.update(name=name, addrFam=addrFam, source=source)
+    result = NetworkAdapter({"name": name})
+    result._ifAttributes.update(options)
+    return result
+
+
+class TestInterfacesChecker(unittest.TestCase):
+    def test_valid(self):
+        adapters = InterfacesReader(INF_PATH).parse_interfaces()
+        self.assertEqual(structure_errors(adapters), [])
+        check_structure(adapters)
+
+    def test_errors(self):
+        flags_only = NetworkAdapter({"name": "eth5", "auto": True})
+        errors = structure_errors([
+            adapter("eth0"),
+            adapter("eth0"),
+            adapter("eth0", addrFam="inet6"),
+            adapter("eth1", addrFam="inet6", source="bootp"),
+            adapter("eth2", addrFam="appletalk"),
+            adapter("eth3", source="static"),
+            adapter("eth4", source="tunnel", address="10.0.0.1",
+                    mode="GRE"),
+            flags_only,
+        ])
+        self.assertEqual(errors, [
+            "duplicate interface eth0 inet",
+            "eth1: unknown method bootp for family inet6",
+            "eth2: unknown address family appletalk",
+            "eth3: option address is required for method static in "
+            "family inet",
+            "eth4: option endpoint is required for method tunnel in "
+            "family inet",
+            "auto eth5 has no iface stanza",
+        ])
+        with self.assertRaises(ValueError):
+            check_structure([flags_only])
+
+
+class TestInterfacesWriterCheck(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "interfaces")
+        shutil.copy(INF_PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_python_check(self):
+        """The in process check replaces ifup, before writing"""
+        itfs = Interfaces(interfaces_path=self.path, check="python")
+        itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                         "source": "dhcp"})
+        self.assertTrue(itfs.writeInterfaces())
+        self.assertNotEqual(
+            Interfaces(interfaces_path=self.path).getAdapter("eth9"), None)
+
+        with open(self.path) as interfaces:
+            content = interfaces.read()
+        writer = InterfacesWriter(
+            itfs.adapters + [adapter("eth9")], self.path, check="both")
+        with self.assertRaises(ValueError):
+            writer.write_interfaces()
+        with open(self.path) as interfaces:
+            self.assertEqual(interfaces.read(), content)
+
+    def test_check_modes(self):
+        with self.assertRaises(ValueError):
+            InterfacesWriter([], self.path, check="sometimes")
+        with self.assertRaises(ValueError):
+            Interfaces(interfaces_path=self.path, check="sometimes")
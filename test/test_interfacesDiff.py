@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os
+import unittest
+from ..debinterface import Interfaces, diff_adapters, plan_apply
+from ..debinterface import interfacesDiff
+
+
+INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
+
+
+class TestInterfacesDiff(unittest.TestCase):
+    def setUp(self):
+        self.old = Interfaces(interfaces_path=INF_PATH)
+        self.new = Interfaces(interfaces_path=INF_PATH)
+
+    def kinds(self):
+        return [(x.name, x.kind) for x in self.old.diff(self.new)]
+
+    def test_no_change(self):
+        self.assertEqual(self.kinds(), [])
+        plan = self.new.planApply(self.old)
+        self.assertEqual((plan.down, plan.up), ([], []))
+
+    def test_kinds(self):
+        self.new.getAdapter("eth1").setAddress("10.1.20.2")
+        self.new.getAdapter("wlan0").appendUp("echo up")
+        self.new.getAdapter("ath0").setAuto(False)
+        self.new.getAdapter("eth0").setAddressSource("manual")
+        self.new.removeAdapterByName("ath2")
+        self.new.addAdapter({"name": "eth9", "addrFam": "inet",
+                             "source": "dhcp"})
+        self.assertEqual(sorted(self.kinds()), [
+            ("ath0", interfacesDiff.FLAGS),
+            ("ath2", interfacesDiff.REMOVED),
+            ("eth0", interfacesDiff.CHANGED),
+            ("eth1", interfacesDiff.ADDRESS),
+            ("eth9", interfacesDiff.ADDED),
+            ("wlan0", interfacesDiff.HOOKS)])
+        change = [x for x in self.old.diff(self.new) if x.name == "eth1"][0]
+        self.assertEqual(change.options, ["address"])
+
+    def test_plan(self):
+        """Only changed interfaces restart, and the bridges of a changed
+        port"""
+        self.new.getAdapter("eth1").setAddress("10.1.20.2")
+        self.new.getAdapter("ath0").setAuto(False)
+        self.new.getAdapter("eth0").setAddressSource("manual")
+        self.new.removeAdapterByName("ath2")
+        plan = self.new.planApply(self.old)
+        self.assertEqual(plan.down, [["br0"], ["eth0", "eth1", "ath2"]])
+        self.assertEqual(plan.up, [["eth0", "eth1"], ["br0"]])
+
+    def test_adapter_lists(self):
+        old = [x.copy() for x in self.old.adapters]
+        new = [x.copy() for x in self.old.adapters[:-1]]
+        self.assertEqual([x.kind for x in diff_adapters(old, new)],
+                         [interfacesDiff.REMOVED])
+        plan = plan_apply(old, new)
+        self.assertEqual(plan.up, [])
+        self.assertEqual(len(plan.down), 1)
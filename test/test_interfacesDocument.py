@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import difflib
+import os
+import unittest
+from ..debinterface import InterfacesDocument, NetworkAdapter
+
+
+INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
+
+
+class TestInterfacesDocument(unittest.TestCase):
+    def setUp(self):
+        with open(INF_PATH) as interfaces:
+            self.content = interfaces.read()
+        self.document = InterfacesDocument.read(INF_PATH)
+        self.adapters = self.document.adapters
+
+    def _diff(self, content):
+        return [
+            line[0] + line[2:] for line in difflib.ndiff(
+                self.content.splitlines(), content.splitlines())
+            if line[0] in "+-"
+        ]
+
+    def _adapter(self, name):
+        return next(x for x in self.adapters if x.attributes["name"] == name)
+
+    def test_round_trip(self):
+        """Unchanged adapters render the file as it was"""
+        self.assertEqual(self.document.render(self.adapters), self.content)
+
+    def test_same_adapters_as_reader(self):
+        """Adapters are the ones of the InterfacesReader"""
+        from ..debinterface import InterfacesReader
+        expected = InterfacesReader(INF_PATH).parse_interfaces()
+        self.assertEqual([x.attributes for x in self.adapters],
+                         [x.attributes for x in expected])
+
+    def test_one_option_one_line(self):
+        """A changed option is patched in place"""
+        self._adapter("br0").setAddress("192.168.1.3")
+        self.assertEqual(self._diff(self.document.render(self.adapters)), [
+            "-       address 192.168.1.2",
+            "+       address 192.168.1.3",
+        ])
+
+    def test_list_option(self):
+        """Hooks are patched with a minimal diff"""
+        br0 = self._adapter("br0")
+        br0.attributes["pre-up"][2] = "iwpriv ath0 mode 11b"
+        br0.attributes["pre-up"].pop(0)
+        br0.appendUp("echo up")
+        self.assertEqual(self._diff(self.document.render(self.adapters)), [
+            "-       pre-up wlanconfig ath0 create wlandev wifi0 wlanmode ap",
+            "-       pre-up iwpriv ath0 mode 11g",
+            "+       pre-up iwpriv ath0 mode 11b",
+            "+       up echo up",
+        ])
+
+    def test_unknown_and_bridge_options(self):
+        """Unknown and bridge options are patched in place"""
+        self._adapter("ath2").setUnknown("wireless-channel", "6")
+        self._adapter("br0").replaceBropt("ports", "eth0 ath0")
+        self.assertEqual(self._diff(self.document.render(self.adapters)), [
+            "-       bridge_ports eth0 ath0 ath1",
+            "+       bridge_ports eth0 ath0",
+            "-       wireless-channel 1",
+            "+       wireless-channel 6",
+        ])
+
+    def test_flags(self):
+        """auto lines follow the auto flag"""
+        self._adapter("eth1").setAuto(True)
+        self._adapter("br0").attributes.pop("auto")
+        self.assertEqual(self._diff(self.document.render(self.adapters)), [
+            "+auto eth1",
+            "-auto br0",
+        ])
+
+    def test_remove_and_add(self):
+        """Removed stanzas are dropped, new ones inserted in list order"""
+        self.adapters.remove(self._adapter("eth1"))
+        self.adapters.insert(len(self.adapters) - 1, NetworkAdapter(
+            {"name": "eth7", "addrFam": "inet", "source": "dhcp"}))
+        content = self.document.render(self.adapters)
+        self.assertEqual(self._diff(content), [
+            "-iface eth1 inet static",
+            "-    address 10.1.20.1",
+            "-    netmask 255.255.255.0",
+            "-    dns-nameservers 8.8.8.8",
+            "+iface eth7 inet dhcp",
+            "+",
+        ])
+        # New adapters go before the auto line of the next stanza
+        self.assertIn("iface eth7 inet dhcp\n\nauto ath2\n", content)
+
+    def test_commit(self):
+        """After commit, the rendered content is the new baseline"""
+        self._adapter("br0").setAddress("192.168.1.3")
+        content = self.document.render(self.adapters)
+        self.document.commit()
+        self.assertEqual(self.document.render(self.adapters), content)
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import os
+import shutil
+import tempfile
 import unittest
-from ..debinterface import InterfacesReader
+from ..debinterface import InterfacesReader, parse_many
+from ..debinterface.interfacesReader import _FRAGMENTS
 
 
 INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
@@ -62,3 +65,270 @@ class TestInterfacesReader(unittest.TestCase):
             'post-up': [],
             'pre-down': []
         })
+
+    def test_auto_applies_to_all_families(self):
+        """inet and inet6 stanzas share the auto flag"""
+        content = (
+            "iface eth0 inet dhcp\n"
+            "iface eth0 inet6 auto\n"
+            "auto eth0\n"
+            "allow-hotplug eth0\n"
+        )
+        with tempfile.NamedTemporaryFile(mode="w") as tempf:
+            tempf.write(content)
+            tempf.flush()
+            adapters = InterfacesReader(tempf.name).parse_interfaces()
+        self.assertEqual(len(adapters), 2)
+        for adapter in adapters:
+            self.assertEqual(adapter.attributes["auto"], True)
+            self.assertEqual(adapter.attributes["hotplug"], True)
+
+    def test_mapping_options_ignored(self):
+        """mapping options should not end up in the previous adapter"""
+        content = (
+            "iface eth0 inet dhcp\n"
+            "    bridge_ports eth1 eth2\n"
+            "mapping eth0\n"
+            "    script /usr/local/sbin/map-scheme\n"
+        )
+        with tempfile.NamedTemporaryFile(mode="w") as tempf:
+            tempf.write(content)
+            tempf.flush()
+            adapters = InterfacesReader(tempf.name).parse_interfaces()
+        self.assertEqual(len(adapters), 1)
+        self.assertEqual(adapters[0].attributes["bridge-opts"],
+                         {"ports": "eth1 eth2"})
+        self.assertNotIn("unknown", adapters[0].attributes)
+
+    def test_iter_adapters(self):
+        """Should yield the same adapters than parse_interfaces"""
+        reader = InterfacesReader(INF_PATH)
+        names = [x.attributes["name"] for x in reader.iter_adapters()]
+        expected = [x.attributes["name"]
+                    for x in InterfacesReader(INF_PATH).parse_interfaces()]
+        self.assertEqual(names, expected)
+
+    def test_iter_adapters_deferred_flags(self):
+        """auto lines after a yielded stanza are deferred"""
+        content = (
+            "auto eth0\n"
+            "iface eth0 inet dhcp\n"
+            "iface eth1 inet dhcp\n"
+            "iface eth2 inet dhcp\n"
+            "auto eth1\n"
+        )
+        with tempfile.NamedTemporaryFile(mode="w") as tempf:
+            tempf.write(content)
+            tempf.flush()
+            reader = InterfacesReader(tempf.name)
+            adapters = reader.iter_adapters()
+            eth0 = next(adapters)
+            self.assertEqual(eth0.attributes["auto"], True)
+            eth1 = next(adapters)
+            # auto eth1 is not read yet, but eth1 stanza is closed
+            self.assertNotIn("auto", eth1.attributes)
+            rest = list(adapters)
+        self.assertEqual(len(rest), 1)
+        self.assertEqual(reader.deferred_flags,
+                         {"auto": set(["eth1"]), "hotplug": set()})
+        reader.apply_deferred_flags([eth0, eth1] + rest)
+        self.assertEqual(eth1.attributes["auto"], True)
+        self.assertNotIn("auto", rest[0].attributes)
+
+    def test_lazy_validation(self):
+        """lazy and none modes read the same adapters"""
+        expected = [x.attributes
+                    for x in InterfacesReader(INF_PATH).parse_interfaces()]
+        for validate in ("lazy", "none"):
+            reader = InterfacesReader(INF_PATH, validate=validate)
+            self.assertEqual(
+                [x.attributes for x in reader.parse_interfaces()], expected)
+
+    def test_lazy_validation_deferred(self):
+        """Invalid options are only reported by validateAll in lazy mode"""
+        content = (
+            "iface eth0 inet static\n"
+            "    address 10.0.0.300\n"
+        )
+        with tempfile.NamedTemporaryFile(mode="w") as tempf:
+            tempf.write(content)
+            tempf.flush()
+            with self.assertRaises(ValueError):
+                InterfacesReader(tempf.name).parse_interfaces()
+            adapters = InterfacesReader(
+                tempf.name, validate="lazy").parse_interfaces()
+        self.assertEqual(adapters[0].attributes["address"], "10.0.0.300")
+        with self.assertRaises(ValueError):
+            adapters[0].validateAll()
+
+    def test_validate_mode(self):
+        """Unknown validate mode is refused"""
+        with self.assertRaises(ValueError):
+            InterfacesReader(INF_PATH, validate="fast")
+
+
+class TestInterfacesReaderIncludes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = self._write("interfaces", (
+            "auto lo eth1\n"
+            "iface lo inet loopback\n"
+            "source-directory interfaces.d\n"
+            "source extra/*.cfg\n"
+            "iface eth9 inet dhcp\n"
+        ))
+        os.mkdir(os.path.join(self.tmpdir, "interfaces.d"))
+        os.mkdir(os.path.join(self.tmpdir, "extra"))
+        self._write("interfaces.d/eth1", "iface eth1 inet dhcp\n")
+        self._write("interfaces.d/eth2", (
+            "auto eth2\n"
+            "iface eth2 inet dhcp\n"
+            "source ../interfaces\n"
+        ))
+        # Not a run-parts name, ignored by source-directory
+        self._write("interfaces.d/eth3.bak", "iface eth3 inet dhcp\n")
+        self._write("extra/eth4.cfg", "iface eth4 inet dhcp\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as tempf:
+            tempf.write(content)
+        return path
+
+    def test_parse_includes(self):
+        """Included adapters are in place, include loops are broken"""
+        adapters = InterfacesReader(self.path).parse_interfaces()
+        names = [x.attributes["name"] for x in adapters]
+        self.assertEqual(names, ["lo", "eth1", "eth2", "eth4", "eth9"])
+        self.assertEqual(adapters[1].attributes["auto"], True)
+        self.assertEqual(adapters[2].attributes["auto"], True)
+        self.assertNotIn("auto", adapters[3].attributes)
+
+    def test_iter_includes(self):
+        """iter_adapters reads included files in place"""
+        reader = InterfacesReader(self.path)
+        names = [x.attributes["name"] for x in reader.iter_adapters()]
+        self.assertEqual(names, ["lo", "eth1", "eth2", "eth4", "eth9"])
+
+    def test_no_includes(self):
+        """source clauses can be ignored"""
+        adapters = InterfacesReader(
+            self.path, includes=False).parse_interfaces()
+        names = [x.attributes["name"] for x in adapters]
+        self.assertEqual(names, ["lo", "eth9"])
+
+    def test_include_cache(self):
+        """Only changed included files are parsed again"""
+        first = InterfacesReader(self.path).parse_interfaces()
+        # Change size so the signature changes whatever the mtime resolution
+        self._write("extra/eth4.cfg", "iface eth4 inet static\n"
+                                      "    address 10.0.0.4\n")
+        eth1_path = os.path.realpath(
+            os.path.join(self.tmpdir, "interfaces.d", "eth1"))
+        eth1_fragment = _FRAGMENTS.get(eth1_path)
+
+        second = InterfacesReader(self.path).parse_interfaces()
+        self.assertIs(_FRAGMENTS.get(eth1_path), eth1_fragment)
+        self.assertEqual(second[3].attributes["address"], "10.0.0.4")
+        # Cached adapters are never handed out
+        self.assertIsNot(first[1], second[1])
+        second[1].setAddress("10.0.0.1")
+        third = InterfacesReader(self.path).parse_interfaces()
+        self.assertNotIn("address", third[1].attributes)
+
+
+class TestInterfacesReaderUpdate(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "interfaces")
+        shutil.copy(INF_PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _replace(self, old, new):
+        with open(self.path) as interfaces:
+            content = interfaces.read()
+        with open(self.path, "w") as interfaces:
+            interfaces.write(content.replace(old, new))
+
+    def test_first_update(self):
+        """First update reads everything, as parse_interfaces"""
+        reader = InterfacesReader(self.path)
+        changes = reader.update_interfaces()
+        expected = InterfacesReader(self.path).parse_interfaces()
+        self.assertEqual([x.attributes for x in reader.adapters],
+                         [x.attributes for x in expected])
+        self.assertEqual(len(changes.added), len(expected))
+        self.assertEqual((changes.removed, changes.changed), ([], []))
+        self.assertEqual(len(reader.stanzas), len(expected))
+
+    def test_update_reuses_unchanged(self):
+        """Only changed stanzas are parsed again"""
+        reader = InterfacesReader(self.path)
+        reader.update_interfaces()
+        before = dict((x.attributes["name"], x) for x in reader.adapters)
+
+        self._replace("    address 10.1.20.1", "    address 10.1.20.2")
+        self._replace("iface eth0 inet dhcp", "iface eth5 inet dhcp")
+        self._replace("#auto wlan1", "auto wlan1")
+        changes = reader.update_interfaces()
+
+        after = dict((x.attributes["name"], x) for x in reader.adapters)
+        self.assertIs(after["br0"], before["br0"])
+        self.assertIs(after["wlan1"], before["wlan1"])
+        self.assertIsNot(after["eth1"], before["eth1"])
+        self.assertEqual(after["eth1"].attributes["address"], "10.1.20.2")
+        self.assertEqual(after["wlan1"].attributes["auto"], True)
+        self.assertEqual(changes.added, [after["eth5"]])
+        self.assertEqual(changes.removed, [before["eth0"]])
+        self.assertEqual(
+            sorted(x.attributes["name"] for x in changes.changed),
+            ["eth1", "wlan1"])
+
+    def test_update_unchanged(self):
+        """Nothing to report on an unchanged file"""
+        reader = InterfacesReader(self.path)
+        reader.update_interfaces()
+        self.assertEqual(reader.update_interfaces(), ([], [], []))
+
+
+class TestParseMany(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.invalid = os.path.join(self.tmpdir, "invalid")
+        with open(self.invalid, "w") as interfaces:
+            interfaces.write("iface eth0 inet static\n"
+                             "    address 10.0.0.300\n")
+        self.missing = os.path.join(self.tmpdir, "missing")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_many(self):
+        """Results in the order of paths, one error per bad file"""
+        paths = [INF_PATH, self.invalid, INF2_PATH, self.missing] * 3
+        results = parse_many(paths, max_workers=2, chunksize=2)
+        self.assertEqual([x.path for x in results], paths)
+        expected = InterfacesReader(INF_PATH).parse_interfaces()
+        self.assertEqual([x.attributes for x in results[0].adapters],
+                         [x.attributes for x in expected])
+        self.assertEqual(len(results[2].adapters), 1)
+        self.assertIsInstance(results[1].error, ValueError)
+        self.assertIsNone(results[1].adapters)
+        self.assertIsInstance(results[3].error, (IOError, OSError))
+
+    def test_parse_many_dicts(self):
+        """as_dicts returns the attributes, options reach the reader"""
+        results = parse_many([self.invalid], max_workers=1,
+                             as_dicts=True, validate="lazy")
+        self.assertIsNone(results[0].error)
+        self.assertEqual(results[0].adapters[0]["address"], "10.0.0.300")
+
+    def test_parse_many_options(self):
+        """Invalid options are refused before starting the pool"""
+        with self.assertRaises(ValueError):
+            parse_many([INF_PATH], validate="fast")
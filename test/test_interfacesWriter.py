@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, with_statement, absolute_import
 import os
+import shutil
+import threading
+import time
 import unittest
 import tempfile
-from ..debinterface import InterfacesReader, InterfacesWriter, NetworkAdapter
+from ..debinterface import (Interfaces, InterfacesChangedError,
+                            InterfacesReader, InterfacesWriter,
+                            NetworkAdapter)
+from ..debinterface import toolutils
 
 
 INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
@@ -115,3 +121,68 @@ class TestInterfacesWriter(unittest.TestCase):
             content = open(tempf.name).read().split("\n")
             for line_written, line_expected in zip(content, expected):
                 self.assertEqual(line_written.strip(), line_expected)
+
+
+class TestInterfacesWriterConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "interfaces")
+        shutil.copy(INF_PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_compare_and_swap(self):
+        """A file changed since it was read is not written"""
+        itfs = Interfaces(interfaces_path=self.path, cas=True)
+        with open(self.path, "a") as interfaces:
+            interfaces.write("iface eth42 inet dhcp\n")
+        with open(self.path) as interfaces:
+            content = interfaces.read()
+        itfs.addAdapter({"name": "eth9", "addrFam": "inet",
+                         "source": "dhcp"})
+        self.assertRaises(InterfacesChangedError, itfs.writeInterfaces)
+        with open(self.path) as interfaces:
+            self.assertEqual(interfaces.read(), content)
+        self.assertFalse(os.path.exists(itfs.backup_path))
+        itfs.updateAdapters()
+        self.assertNotEqual(itfs.getAdapter("eth42"), None)
+
+    def test_file_lock(self):
+        """Writers wait for the lock holder"""
+        lock_path = self.path + ".lock"
+        events = []
+        locked = threading.Event()
+
+        def hold():
+            with toolutils.file_lock(lock_path):
+                locked.set()
+                time.sleep(0.2)
+                events.append("released")
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        locked.wait()
+        with toolutils.file_lock(lock_path):
+            events.append("acquired")
+        thread.join()
+        self.assertEqual(events, ["released", "acquired"])
+
+    def test_lock_file(self):
+        """The lock file is only created with lock=True"""
+        lock_path = self.path + ".lock"
+        Interfaces(interfaces_path=self.path, check="python").writeInterfaces()
+        self.assertFalse(os.path.exists(lock_path))
+        Interfaces(interfaces_path=self.path, check="python",
+                   lock=True).writeInterfaces()
+        self.assertTrue(os.path.exists(lock_path))
+
+    def test_unchanged_not_written(self):
+        """A file with the rendered content is not backed up nor written"""
+        itfs = Interfaces(interfaces_path=self.path, lossless=True, cas=True)
+        signature = toolutils.file_signature(self.path)
+        self.assertFalse(itfs.writeInterfaces())
+        self.assertEqual(toolutils.file_signature(self.path), signature)
+        self.assertFalse(os.path.exists(itfs.backup_path))
+        # the signature is still known for the next compare and swap
+        self.assertFalse(itfs.writeInterfaces())
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from ..debinterface import Interfaces, InterfacesReader, PARSE_CACHE
+from ..debinterface.snapshot import load_snapshot, save_snapshot
+
+
+INF_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "interfaces.txt")
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "interfaces")
+        self.snapshot_path = self.path + ".snapshot"
+        shutil.copy(INF_PATH, self.path)
+        self.reader = InterfacesReader(self.path)
+        self.adapters = self.reader.parse_interfaces()
+        PARSE_CACHE.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        PARSE_CACHE.clear()
+
+    def test_round_trip(self):
+        """Loaded adapters have the saved attributes"""
+        save_snapshot(self.snapshot_path, self.reader.sources, self.adapters)
+        sources, adapters = load_snapshot(self.snapshot_path)
+        self.assertEqual(sources, self.reader.sources)
+        self.assertEqual([x.attributes for x in adapters],
+                         [x.attributes for x in self.adapters])
+        for adapter in adapters:
+            adapter.validateAll()
+
+    def test_stale(self):
+        """A snapshot is not used once its source changed"""
+        save_snapshot(self.snapshot_path, self.reader.sources, self.adapters)
+        with open(self.path, "a") as interfaces:
+            interfaces.write("iface eth42 inet dhcp\n")
+        self.assertIsNone(load_snapshot(self.snapshot_path))
+
+    def test_invalid(self):
+        """Missing, corrupted and unvalidated snapshots are not used"""
+        self.assertIsNone(load_snapshot(self.snapshot_path))
+        save_snapshot(self.snapshot_path, self.reader.sources, self.adapters,
+                      validated=False)
+        self.assertIsNone(load_snapshot(self.snapshot_path))
+        self.assertIsNotNone(load_snapshot(self.snapshot_path, False))
+        with open(self.snapshot_path, "r+b") as snapshot:
+            snapshot.seek(12)
+            snapshot.write(b"garbage")
+        self.assertIsNone(load_snapshot(self.snapshot_path, False))
+        with open(self.snapshot_path, "wb") as snapshot:
+            snapshot.write(b"DEBIF")
+        self.assertIsNone(load_snapshot(self.snapshot_path, False))
+
+    def test_interfaces_snapshot(self):
+        """Interfaces saves a snapshot, then loads it instead of parsing"""
+        itfs = Interfaces(interfaces_path=self.path, snapshot=True)
+        self.assertEqual(itfs.snapshot_path, self.snapshot_path)
+        self.assertTrue(os.path.exists(self.snapshot_path))
+        # Only a snapshot can tell about eth42
+        self.adapters[0].setName("eth42")
+        save_snapshot(self.snapshot_path, self.reader.sources, self.adapters)
+        PARSE_CACHE.clear()
+        itfs = Interfaces(interfaces_path=self.path, snapshot=True)
+        self.assertIsNotNone(itfs.getAdapter("eth42"))